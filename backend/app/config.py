@@ -1,23 +1,216 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
     database_url: str
-    openai_api_key: str
+    # Only needed when embedding_provider is "openai".
+    openai_api_key: str = ""
+
+    # Embedding backend: "openai", "local" (a model on disk, run in-process on
+    # CPU) or "hashing" (deterministic stub for tests and benchmarks). Vectors
+    # from different models cannot be mixed; the corpus records which model
+    # embedded each chunk and search refuses a mismatch. The chunks.embedding
+    # column is sized by embedding_dimensions, so switching to a model with a
+    # different width means a fresh schema and a re-ingest.
+    embedding_provider: Literal["openai", "local", "hashing"] = "openai"
     embedding_model: str = "text-embedding-3-small"
+    embedding_dimensions: int = 1536
+    embedding_local_model_path: str | None = None
+    embedding_local_threads: int = 2
+    embedding_local_batch_size: int = 32
+    # Query embeddings (one per search) time out after the p99 of the last
+    # embedding_latency_window calls times embedding_timeout_p99_multiplier,
+    # kept within [embedding_timeout_min_seconds, embedding_timeout_max_seconds].
+    # embedding_hedge sends a duplicate request once the first has taken longer
+    # than the p95. After embedding_breaker_failures failures in a row, searches
+    # are refused with 503 without calling the provider for
+    # embedding_breaker_reset_seconds, then one probe request decides whether
+    # to resume. Per worker (app.services.resilience).
+    embedding_latency_window: int = 200
+    embedding_timeout_p99_multiplier: float = 2.0
+    embedding_timeout_min_seconds: float = 1.0
+    embedding_timeout_max_seconds: float = 10.0
+    embedding_hedge: bool = False
+    embedding_breaker_failures: int = 5
+    embedding_breaker_reset_seconds: float = 30.0
+    # Unset means the OpenAI default. Point at bench/stub_server.py for offline runs.
+    openai_base_url: str | None = None
 
     # Search settings
     top_k: int = 10
     similarity_threshold: float = 0.1
 
+    # HNSW build parameters, applied when idx_chunks_embedding_hnsw is created
+    # (changing them on an existing index needs a REINDEX), and the per-query
+    # candidate list size. None keeps pgvector's default ef_search of 40.
+    # bench/hnsw_tune.py measures recall/latency and recommends values.
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 64
+    hnsw_ef_search: int | None = None
+    # Progressive search (/api/search/stream): a first pass with a small
+    # ef_search answers quickly, then a high-recall pass replaces its results.
+    stream_fast_ef_search: int = 16
+    stream_refined_ef_search: int = 200
+
+    # Semantic query cache (app.services.query_cache): a search whose query
+    # vector is within query_cache_min_similarity (cosine) of a recent one is
+    # answered with that one's results. 0 entries disables it.
+    query_cache_size: int = 2048
+    query_cache_min_similarity: float = 0.97
+    query_cache_ttl_seconds: float = 900.0
+    query_cache_generation_poll_seconds: float = 5.0
+
+    # Vector search backend. "local" answers searches and related stories from
+    # a float16 snapshot of the embeddings memory-mapped from local_index_dir,
+    # shared by the pod's workers and re-exported when the corpus changes
+    # (app.services.local_index); Postgres answers until it is loaded.
+    search_backend: Literal["postgres", "local"] = "postgres"
+    local_index_dir: str = "/tmp/hn-vectors"
+    local_index_block_rows: int = 32768
+    local_index_refresh_seconds: float = 30.0
+
+    # Schema migrations (python -m app.migrate). The runner needs a session-
+    # level connection, so give it a direct Postgres URL when database_url is
+    # a transaction-mode PgBouncer. migrate_on_startup runs it from the app's
+    # lifespan instead, for local development; deploys run it once beforehand.
+    migration_database_url: str | None = None
+    migrate_on_startup: bool = False
+
+    # Optional streaming replicas for read-only queries, comma-separated URLs
+    # in the same form as database_url; see app.database. Strategy is
+    # "round_robin" or "least_latency" (smoothed health-check round trip).
+    database_replica_urls: str = ""
+    replica_strategy: Literal["round_robin", "least_latency"] = "round_robin"
+    replica_max_lag_seconds: float = 10.0
+    replica_check_interval_seconds: float = 5.0
+    replica_check_timeout_seconds: float = 2.0
+    replica_pool_size: int = 5
+
+    # Worker processes per pod (the container entrypoint passes it to uvicorn
+    # --workers) and the primary connections one pod may hold across all of
+    # them; app.database splits the budget into per-worker pool sizes. Keep
+    # pods x budget under the database role's connection limit.
+    web_concurrency: int = 1
+    db_connection_budget: int = 15
+
+    # Hot queries (search, story load, related, quota flush) on a separate
+    # asyncpg pool instead of SQLAlchemy sessions; see app.services.fastpath.
+    # The pool is capped at db_fast_pool_size and half of the worker's share
+    # of db_connection_budget. db_prepared_statements: "auto" probes whether named
+    # prepared statements survive the pooler, "on"/"off" force it.
+    db_fast_path: bool = False
+    db_fast_pool_size: int = 5
+    db_prepared_statements: Literal["auto", "on", "off"] = "auto"
+    db_statement_cache_size: int = 256
+
+    # Prometheus endpoint, served on its own port so the public ingress (which
+    # routes the app's port) never exposes it; 0 disables it. Not 9100 (bench
+    # stub server) or 9101 (job worker), so all three can share a host.
+    metrics_port: int = 9102
+
+    # Plan sampler: re-run this fraction of vector queries, and any slower than
+    # plan_slow_query_ms, under EXPLAIN (ANALYZE, BUFFERS); the last
+    # plan_buffer_size plans are served at /api/admin/plans.
+    plan_sample_rate: float = 0.0
+    plan_slow_query_ms: float = 500.0
+    plan_buffer_size: int = 50
+
+    # Request profiling (needs pyinstrument) and event-loop stall capture; see
+    # app.services.profiling. Both are off unless enabled here.
+    profiling_enabled: bool = False
+    profile_sample_rate: float = 0.0
+    profile_interval_ms: float = 1.0
+    profile_buffer_size: int = 20
+    loop_monitor_enabled: bool = False
+    loop_monitor_interval_ms: float = 50.0
+    loop_stall_threshold_ms: float = 100.0
+
+    # Sent as X-Admin-Token to reach /api/admin/*. Empty disables those routes.
+    admin_token: str = ""
+
     # Public-demo spend cap: each search costs one embedding call.
     search_rate_limit_per_day: int = 5
+    # Counters live in memory and are written behind to search_quota; see
+    # app.services.rate_limit for the overshoot bound these two control.
+    quota_flush_interval_ms: int = 250
+    quota_max_unflushed: int = 2
+    # POST /api/search/batch, for evaluation scripts and internal tools: it
+    # takes the admin token instead of spending the per-IP quota, and has its
+    # own bounds on queries and top_k per request and on batches running at
+    # once per worker (more are refused with 429).
+    search_batch_max_queries: int = 256
+    search_batch_max_top_k: int = 100
+    search_batch_concurrency: int = 2
+
+    # Admission control for /api/search and /api/search/stream, per worker
+    # (app.services.admission): at most search_max_concurrency searches run at
+    # once (default: half the worker's pool plus its fast-path pool), at most
+    # search_max_queue wait, and a search that would wait longer than
+    # search_queue_deadline_ms is refused with 503 and Retry-After.
+    search_max_concurrency: int | None = None
+    search_max_queue: int = 32
+    search_queue_deadline_ms: int = 2000
+
+    # Time budget of one search (embedding call and queries) and of a related
+    # stories lookup. Each query runs with statement_timeout set to what is
+    # left (app.services.deadline); a search over budget gets 504 and its
+    # quota back, a story page renders without related stories. 0 disables.
+    search_deadline_ms: int = 10000
+    related_deadline_ms: int = 2000
 
     # HN ingestion settings
+    hn_search_url: str = "https://hn.algolia.com/api/v1/search_by_date"
+    hn_item_url: str = "https://hn.algolia.com/api/v1/items"
     hn_min_score: int = 10
     hn_days_to_keep: int = 30
     hn_max_comments_per_story: int = 20
+    # Story text and comments longer than chunk_max_tokens (counted with the
+    # chunk_tokenizer BPE encoding) are split into overlapping windows
+    # (app.services.chunker). Ingest embeds in batches of at most
+    # embedding_batch_size texts and embedding_batch_max_tokens tokens; a batch
+    # the backend rejects is bisected and only the offending text is dropped.
+    chunk_tokenizer: str = "cl100k_base"
+    chunk_max_tokens: int = 512
+    chunk_overlap_tokens: int = 64
     embedding_batch_size: int = 50
+    embedding_batch_max_tokens: int = 100_000
+
+    # Ingest job queue (app.services.jobs, run by python -m app.worker). A
+    # running job whose heartbeat is older than job_stale_seconds is taken
+    # over by another worker; failures retry with exponential backoff.
+    job_poll_seconds: float = 5.0
+    job_heartbeat_seconds: float = 15.0
+    job_stale_seconds: float = 120.0
+    job_max_attempts: int = 3
+    job_retry_base_seconds: float = 60.0
+
+    # Partitions: stories and chunks are partitioned by day
+    # (app.services.partitions). The worker keeps this many future days'
+    # partitions created, and DDL on the parents gives up after
+    # partition_lock_timeout_ms rather than queueing searches behind it.
+    partition_days_ahead: int = 3
+    partition_lock_timeout_ms: int = 5000
+
+    # HNSW health checks and rebuilds (app.services.index_health), run by the
+    # worker every index_check_interval_minutes (0 disables). Indexes whose
+    # probe recall or heap dead-tuple ratio crosses a threshold are rebuilt
+    # with REINDEX CONCURRENTLY, only inside index_maintenance_window ("HH:MM-
+    # HH:MM" UTC) and only while probe p99 stays within the search budget.
+    index_check_interval_minutes: int = 60
+    index_probe_count: int = 20
+    index_probe_k: int = 10
+    index_min_recall: float = 0.9
+    index_max_dead_ratio: float = 0.2
+    index_maintenance_window: str = "02:00-05:00"
+    index_search_p99_budget_ms: float = 200.0
+    index_throttle_wait_seconds: float = 30.0
+    index_max_rebuilds_per_run: int = 3
+
+    # Port for the worker's Prometheus endpoint; 0 disables it. Not 9100,
+    # which bench/stub_server.py listens on by default.
+    worker_metrics_port: int = 9101
 
     model_config = {"env_file": ".env"}
 
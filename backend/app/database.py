@@ -1,8 +1,23 @@
+import asyncio
+import itertools
+import logging
 import ssl as ssl_module
+import time
+from dataclasses import dataclass
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
 from app.config import settings
+from app.services.metrics import (
+    DB_READ_ROUTE,
+    REPLICA_HEALTHY,
+    REPLICA_LAG_SECONDS,
+    TimedQueuePool,
+    instrument_engine,
+)
+
+logger = logging.getLogger(__name__)
 
 
 def _build_async_url(raw_url: str) -> tuple[str, dict]:
@@ -40,10 +55,222 @@ def _build_async_url(raw_url: str) -> tuple[str, dict]:
 
 db_url, connect_args = _build_async_url(settings.database_url)
 
-engine = create_async_engine(db_url, echo=False, pool_size=5, max_overflow=10, connect_args=connect_args)
+
+def split_connection_budget(budget: int, workers: int, fast_path: bool, fast_pool_max: int) -> tuple[int, int, int]:
+    """(pool_size, max_overflow, fast_pool_size) for one worker process.
+
+    db_connection_budget is what one pod may hold on the primary across all of
+    its workers, so each worker gets an equal share. The fast-path pool, when
+    enabled, takes up to half of it. Of the rest a third is kept open and the
+    remainder is overflow, opened only under load.
+    """
+    per_worker = max(2, budget // max(1, workers))
+    fast = min(fast_pool_max, per_worker // 2) if fast_path else 0
+    rest = per_worker - fast
+    pool_size = max(1, rest // 3)
+    return pool_size, rest - pool_size, fast
+
+
+POOL_SIZE, MAX_OVERFLOW, FAST_POOL_SIZE = split_connection_budget(
+    settings.db_connection_budget, settings.web_concurrency, settings.db_fast_path, settings.db_fast_pool_size
+)
+
+engine = create_async_engine(
+    db_url,
+    echo=False,
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    poolclass=TimedQueuePool,
+    connect_args=connect_args,
+)
+instrument_engine(engine, capacity=POOL_SIZE + MAX_OVERFLOW)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
 async def get_session() -> AsyncSession:
     async with async_session() as session:
         yield session
+
+
+# --- read replicas ------------------------------------------------------------
+#
+# Read-only sessions (read_session, fastpath.fetch(read_only=True)) go to a
+# healthy streaming replica when any are configured; everything else,
+# including ingest, prune and the quota counters, stays on the primary.
+#
+# A background check measures each replica's replay lag and round-trip time
+# and takes it out of rotation while it is unreachable or more than
+# replica_max_lag_seconds behind. Read-your-writes: after a write that readers
+# must see (note_write, called by ingest and prune) a replica is only used once
+# it has replayed past the primary's WAL position at that moment. Ingest and
+# prune run in app.worker, which records that position in
+# ingest_jobs.write_lsn; every process reads the highest one back from the
+# primary with each replica check, so until its next check a process may
+# still read from a replica that has not caught up.
+
+_REPLICA_STATUS_SQL = text("""
+    SELECT
+        pg_is_in_recovery() AS in_recovery,
+        pg_last_wal_replay_lsn()::text AS replay_lsn,
+        CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END AS lag_seconds
+""")
+
+
+def parse_lsn(lsn: str | None) -> int:
+    """'16/B374D848' -> integer position, comparable with <."""
+    if not lsn:
+        return 0
+    high, _, low = lsn.partition("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+@dataclass
+class Replica:
+    name: str
+    url: str
+    connect_args: dict
+    engine: AsyncEngine
+    session: async_sessionmaker
+    healthy: bool = False
+    lag_seconds: float | None = None
+    replay_lsn: int = 0
+    latency_ms: float | None = None
+    last_error: str | None = None
+
+
+def _make_replica(raw_url: str) -> Replica:
+    url, args = _build_async_url(raw_url)
+    replica_engine = create_async_engine(
+        url,
+        echo=False,
+        pool_size=settings.replica_pool_size,
+        max_overflow=settings.replica_pool_size,
+        poolclass=TimedQueuePool,
+        connect_args=args,
+    )
+    name = urlparse(raw_url).hostname or "replica"
+    name = f"{name}:{urlparse(raw_url).port or 5432}"
+    instrument_engine(replica_engine, capacity=2 * settings.replica_pool_size, pool=name)
+    return Replica(
+        name=name,
+        url=url,
+        connect_args=args,
+        engine=replica_engine,
+        session=async_sessionmaker(replica_engine, class_=AsyncSession, expire_on_commit=False),
+    )
+
+
+replicas: list[Replica] = [
+    _make_replica(u.strip()) for u in settings.database_replica_urls.split(",") if u.strip()
+]
+_next_replica = itertools.count()
+_min_replay_lsn = 0
+_monitor_task: asyncio.Task | None = None
+
+
+def choose_replica() -> Replica | None:
+    """A replica to read from, or None to use the primary."""
+    eligible = [r for r in replicas if r.healthy and r.replay_lsn >= _min_replay_lsn]
+    if not eligible:
+        if replicas:
+            DB_READ_ROUTE.labels("primary_fallback").inc()
+        return None
+    if settings.replica_strategy == "least_latency":
+        chosen = min(eligible, key=lambda r: r.latency_ms or 0.0)
+    else:
+        chosen = eligible[next(_next_replica) % len(eligible)]
+    DB_READ_ROUTE.labels(chosen.name).inc()
+    return chosen
+
+
+def read_session() -> AsyncSession:
+    """A session for read-only work: a replica when one is usable, else the primary."""
+    replica = choose_replica()
+    return replica.session() if replica else async_session()
+
+
+async def note_write() -> None:
+    """Make later reads wait for replicas to replay everything committed so far."""
+    global _min_replay_lsn
+    if not replicas:
+        return
+    async with engine.connect() as conn:
+        lsn = (await conn.execute(text("SELECT pg_current_wal_lsn()::text"))).scalar()
+    _min_replay_lsn = max(_min_replay_lsn, parse_lsn(lsn))
+
+
+async def _refresh_write_lsn() -> None:
+    """Pick up the WAL position the job worker recorded after its latest writes."""
+    global _min_replay_lsn
+    async with engine.connect() as conn:
+        lsn = (await conn.execute(text("SELECT MAX(write_lsn) FROM ingest_jobs"))).scalar()
+    _min_replay_lsn = max(_min_replay_lsn, lsn or 0)
+
+
+async def check_replicas() -> None:
+    try:
+        await _refresh_write_lsn()
+    except Exception as e:
+        logger.warning("could not read the last write position: %s", e)
+    for replica in replicas:
+        start = time.perf_counter()
+        try:
+            async with replica.engine.connect() as conn:
+                row = (await asyncio.wait_for(
+                    conn.execute(_REPLICA_STATUS_SQL), settings.replica_check_timeout_seconds
+                )).one()
+        except Exception as e:
+            if replica.healthy:
+                logger.warning("replica %s out of rotation: %s", replica.name, e)
+            replica.healthy, replica.last_error = False, str(e)
+            REPLICA_HEALTHY.labels(replica.name).set(0)
+            continue
+
+        rtt = (time.perf_counter() - start) * 1000
+        # Smoothed, so one slow check does not flip least_latency routing.
+        replica.latency_ms = rtt if replica.latency_ms is None else 0.7 * replica.latency_ms + 0.3 * rtt
+        replica.lag_seconds = float(row.lag_seconds)
+        replica.replay_lsn = parse_lsn(row.replay_lsn)
+        replica.last_error = None
+        healthy = replica.lag_seconds <= settings.replica_max_lag_seconds
+        if healthy != replica.healthy:
+            logger.warning("replica %s %s rotation (lag %.1fs)", replica.name,
+                           "back in" if healthy else "out of", replica.lag_seconds)
+        replica.healthy = healthy
+        REPLICA_LAG_SECONDS.labels(replica.name).set(replica.lag_seconds)
+        REPLICA_HEALTHY.labels(replica.name).set(int(healthy))
+
+
+async def _run_replica_monitor() -> None:
+    while True:
+        try:
+            await check_replicas()
+        except Exception:
+            logger.exception("replica check failed")
+        await asyncio.sleep(settings.replica_check_interval_seconds)
+
+
+async def start_replica_monitor() -> None:
+    """Check replicas once, so the first requests can use them, then keep checking."""
+    global _monitor_task
+    if not replicas or _monitor_task is not None:
+        return
+    await check_replicas()
+    _monitor_task = asyncio.create_task(_run_replica_monitor())
+
+
+async def stop_replica_monitor() -> None:
+    global _monitor_task
+    if _monitor_task is not None:
+        _monitor_task.cancel()
+        try:
+            await _monitor_task
+        except asyncio.CancelledError:
+            pass
+        _monitor_task = None
+    for replica in replicas:
+        await replica.engine.dispose()
@@ -1,78 +1,71 @@
 import logging
+import time
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import text
 
-from app.database import engine
-from app.models import Base
-from app.routers import search, ingest, stats, stories, ssr
-from app.services.embeddings import generate_embedding
+from app.config import settings
+from app.database import engine, start_replica_monitor, stop_replica_monitor
+from app.migrate import check_schema_version, run_migrations
+from app.routers import search, ingest, stats, stories, ssr, admin
+from app.services.embeddings import close_provider
+from app.services.fastpath import start_fast_path, stop_fast_path
+from app.services.metrics import (
+    HTTP_REQUEST_SECONDS,
+    format_server_timing,
+    mark_worker_exit,
+    start_metrics_server,
+    start_request_timings,
+    stop_metrics_server,
+)
+from app.services.local_index import start_local_index, stop_local_index
+from app.services.profiling import ProfilingMiddleware, start_loop_monitor, stop_loop_monitor
+from app.services.query_cache import start_query_cache, stop_query_cache
+from app.services.rate_limit import start_quota_flusher, stop_quota_flusher
+from app.services.vector_search import verify_corpus_model
+from app.services.warmup import readiness, start_warmup, stop_warmup
 
 logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    async with engine.begin() as conn:
-        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
-        # One-time migration: if chunks table exists with old schema (document_id), wipe and recreate
-        result = await conn.execute(text(
-            "SELECT EXISTS ("
-            "  SELECT 1 FROM information_schema.columns "
-            "  WHERE table_name = 'chunks' AND column_name = 'story_id'"
-            ")"
-        ))
-        has_correct_schema = result.scalar()
-        if not has_correct_schema:
-            await conn.execute(text("DROP TABLE IF EXISTS chunks CASCADE"))
-            await conn.execute(text("DROP TABLE IF EXISTS documents CASCADE"))
-            await conn.execute(text("DROP TABLE IF EXISTS stories CASCADE"))
-        # Migration: add slug column if missing
-        slug_exists = await conn.execute(text(
-            "SELECT EXISTS ("
-            "  SELECT 1 FROM information_schema.columns "
-            "  WHERE table_name = 'stories' AND column_name = 'slug'"
-            ")"
-        ))
-        if not slug_exists.scalar():
-            await conn.execute(text(
-                "ALTER TABLE stories ADD COLUMN slug VARCHAR(300)"
-            ))
-        # Always backfill any stories with NULL slugs
-        from app.models import generate_slug
-        null_slugs = await conn.execute(text(
-            "SELECT id, title, hn_id FROM stories WHERE slug IS NULL"
-        ))
-        for row in null_slugs.fetchall():
-            slug = generate_slug(row.title, row.hn_id)
-            await conn.execute(text(
-                "UPDATE stories SET slug = :slug WHERE id = :id"
-            ), {"slug": slug, "id": row.id})
-        # Ensure NOT NULL constraint and unique index exist
-        await conn.execute(text(
-            "ALTER TABLE stories ALTER COLUMN slug SET NOT NULL"
-        ))
-        await conn.execute(text(
-            "CREATE UNIQUE INDEX IF NOT EXISTS idx_stories_slug ON stories (slug)"
-        ))
-        await conn.run_sync(Base.metadata.create_all)
-        # Create HNSW index for cosine similarity
-        await conn.execute(text("""
-            CREATE INDEX IF NOT EXISTS idx_chunks_embedding_hnsw
-            ON chunks USING hnsw (embedding vector_cosine_ops)
-            WITH (m = 16, ef_construction = 64)
-        """))
-    # Warm up OpenAI connection so first search is fast. Best-effort: a failure
-    # here (expired key, exhausted quota) must not stop the app from booting,
-    # since story pages and browsing do not need embeddings.
-    try:
-        await generate_embedding("warmup")
-    except Exception as e:
-        logger.warning("OpenAI warmup failed, continuing without it: %s", e)
+    # Schema changes belong to `python -m app.migrate`, run once per deploy;
+    # startup only checks the recorded version, so it takes the same time
+    # however large the tables are. migrate_on_startup is for local setups.
+    if settings.migrate_on_startup:
+        await run_migrations()
+    if settings.metrics_port:
+        start_metrics_server(settings.metrics_port)
+    async with engine.connect() as conn:
+        await check_schema_version(conn)
+        # A corpus embedded by another model only disables search; story pages
+        # and browsing still work, so this must not stop the app from booting.
+        await verify_corpus_model(conn)
+    await start_replica_monitor()
+    await start_fast_path()
+    await start_quota_flusher()
+    await start_query_cache()
+    # search_backend = "local": Postgres serves until the snapshot is loaded.
+    start_local_index()
+    await start_loop_monitor()
+    # Pools, HNSW index and a first real search, in the background: /api/ready
+    # turns 200 when it is done, /api/health answers meanwhile.
+    start_warmup()
     yield
+    await stop_warmup()
+    await stop_loop_monitor()
+    await stop_query_cache()
+    await stop_local_index()
+    await stop_quota_flusher()
+    await stop_fast_path()
+    await stop_replica_monitor()
+    await close_provider()
     await engine.dispose()
+    stop_metrics_server()
+    mark_worker_exit()
 
 
 app = FastAPI(
@@ -91,6 +84,9 @@ app.add_middleware(
     max_age=3600,
 )
 
+# Added only when enabled, so the default request path has no profiling hook.
+if settings.profiling_enabled:
+    app.add_middleware(ProfilingMiddleware)
 
 # Demo mirrors public HN content — keep every page out of search indexes.
 # Crawling stays allowed (robots.txt) so Google can see the noindex and drop
@@ -101,13 +97,40 @@ async def add_noindex_header(request, call_next):
     response.headers["X-Robots-Tag"] = "noindex, nofollow"
     return response
 
+# Server-Timing breaks each response down into embed / db / render so the
+# browser devtools show where a slow request went. The timings dict is created
+# here, before call_next, so the endpoint task (which runs in a copy of this
+# context) records into the same object.
+@app.middleware("http")
+async def server_timing(request, call_next):
+    timings = start_request_timings()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.labels(
+        request.method, route.path if route else "unmatched", str(response.status_code)
+    ).observe(elapsed)
+    response.headers["Server-Timing"] = format_server_timing(timings, elapsed)
+    response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
 app.include_router(search.router)
 app.include_router(ingest.router)
 app.include_router(stats.router)
 app.include_router(stories.router)
 app.include_router(ssr.router)
+app.include_router(admin.router)
 
 
 @app.get("/api/health")
 async def health():
     return {"status": "ok"}
+
+
+# Readiness, separate from liveness: 503 until this worker's warmup finished,
+# so a new pod gets traffic only once its first search is as fast as the rest.
+@app.get("/api/ready")
+async def ready():
+    state = readiness()
+    return JSONResponse(state, status_code=200 if state["status"] == "ready" else 503)
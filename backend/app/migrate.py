@@ -0,0 +1,373 @@
+"""Versioned schema migrations.
+
+Run once per deploy, before the app starts:
+
+    python -m app.migrate            # apply pending migrations
+    python -m app.migrate --status   # print current and latest version
+
+A Postgres advisory lock makes concurrent runners (several pods, an init
+container racing a manual run) queue up; whoever gets the lock second finds
+nothing left to do. Applied versions are recorded in schema_migrations, and
+the app itself only checks that the recorded version is current, so startup
+time does not depend on the size of the tables.
+
+Every step is idempotent (IF NOT EXISTS, WHERE ... IS NULL), so a runner that
+dies half way through a migration just repeats it. Index builds on existing
+tables use CREATE INDEX CONCURRENTLY, which cannot run inside a transaction;
+migrations containing them run in autocommit mode. Session advisory locks and
+CONCURRENTLY both need one server connection for the whole run, so point
+migration_database_url at Postgres directly when database_url goes through
+PgBouncer in transaction mode.
+"""
+
+import argparse
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+from app.database import _build_async_url
+from app.models import Base, Chunk, CorpusGeneration, IndexHealth, IngestJob, Story
+from app.services import partitions
+from app.services.vector_search import HNSW_INDEX, STORY_HNSW_INDEX
+
+logger = logging.getLogger(__name__)
+
+# pg_advisory_lock key shared by every runner; arbitrary but fixed.
+LOCK_KEY = 0x686E_6D69  # "hnmi"
+
+
+class SchemaOutOfDate(RuntimeError):
+    """The database is behind the migrations this code expects."""
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[AsyncConnection], Awaitable[None]]
+    # False for steps using CREATE INDEX CONCURRENTLY.
+    transactional: bool = True
+
+
+async def _column_exists(conn: AsyncConnection, table: str, column: str) -> bool:
+    return (await conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM information_schema.columns "
+        "WHERE table_name = :table AND column_name = :column)"
+    ), {"table": table, "column": column})).scalar()
+
+
+async def create_index_concurrently(conn: AsyncConnection, name: str, definition: str, unique: bool = False) -> None:
+    """CREATE [UNIQUE] INDEX CONCURRENTLY IF NOT EXISTS, after clearing an invalid leftover.
+
+    A concurrent build that fails leaves an INVALID index behind under the same
+    name, which IF NOT EXISTS would then happily accept. An existing valid
+    index is left alone without issuing the statement at all, which also keeps
+    this a no-op on partitioned tables (where CONCURRENTLY is an error) created
+    by a fresh baseline.
+    """
+    valid = (await conn.execute(text(
+        "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name"
+    ), {"name": name})).scalar()
+    if valid:
+        return
+    if valid is False:
+        logger.warning("dropping invalid index %s left by an interrupted build", name)
+        await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    await conn.execute(text(f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} {definition}"))
+
+
+async def _baseline(conn: AsyncConnection) -> None:
+    await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+    # Databases from before the story model (chunks hung off `documents`) are
+    # wiped; there is nothing in them this app can read.
+    chunks_exists = (await conn.execute(text("SELECT to_regclass('chunks') IS NOT NULL"))).scalar()
+    if chunks_exists and not await _column_exists(conn, "chunks", "story_id"):
+        await conn.execute(text("DROP TABLE IF EXISTS chunks CASCADE"))
+        await conn.execute(text("DROP TABLE IF EXISTS documents CASCADE"))
+        await conn.execute(text("DROP TABLE IF EXISTS stories CASCADE"))
+    # Creates whatever is missing; tables that already exist are left alone and
+    # brought up to date by the migrations below.
+    await conn.run_sync(Base.metadata.create_all)
+
+
+async def _story_slugs(conn: AsyncConnection) -> None:
+    await conn.execute(text("ALTER TABLE stories ADD COLUMN IF NOT EXISTS slug VARCHAR(300)"))
+    # app.models.generate_slug as one set-based statement.
+    await conn.execute(text(r"""
+        WITH base AS (
+            SELECT id, hn_id,
+                   rtrim(left(btrim(regexp_replace(
+                       regexp_replace(lower(title), '[^a-z0-9\s-]', '', 'g'),
+                       '[\s-]+', '-', 'g'), '-'), 80), '-') AS slug
+            FROM stories
+            WHERE slug IS NULL
+        )
+        UPDATE stories s
+        SET slug = CASE WHEN base.slug = '' THEN base.hn_id::text ELSE base.slug || '-' || base.hn_id END
+        FROM base
+        WHERE s.id = base.id
+    """))
+    await conn.execute(text("ALTER TABLE stories ALTER COLUMN slug SET NOT NULL"))
+    await create_index_concurrently(conn, "idx_stories_slug", "ON stories (slug)", unique=True)
+
+
+async def _chunk_embedding_model(conn: AsyncConnection) -> None:
+    # Everything stored before the column existed came from the OpenAI model
+    # configured at the time.
+    await conn.execute(text("ALTER TABLE chunks ADD COLUMN IF NOT EXISTS embedding_model VARCHAR(100)"))
+    await conn.execute(
+        text("UPDATE chunks SET embedding_model = :model WHERE embedding_model IS NULL"),
+        {"model": f"openai:{settings.embedding_model}"},
+    )
+    await conn.execute(text("ALTER TABLE chunks ALTER COLUMN embedding_model SET NOT NULL"))
+    await create_index_concurrently(conn, "idx_chunks_embedding_model", "ON chunks (embedding_model)")
+
+
+async def _hnsw_index(conn: AsyncConnection) -> None:
+    await create_index_concurrently(
+        conn,
+        "idx_chunks_embedding_hnsw",
+        f"ON chunks USING hnsw (embedding vector_cosine_ops) "
+        f"WITH (m = {settings.hnsw_m}, ef_construction = {settings.hnsw_ef_construction})",
+    )
+
+
+async def _pg_prewarm(conn: AsyncConnection) -> None:
+    # Used by the readiness warmup to load the HNSW index into shared buffers.
+    # Managed databases may not allow it; warmup then falls back to queries.
+    try:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_prewarm"))
+    except Exception as e:
+        logger.warning("pg_prewarm unavailable, warmup will run without it: %s", e)
+
+
+async def _ingest_jobs(conn: AsyncConnection) -> None:
+    # New table, so its indexes are built with it; no CONCURRENTLY needed.
+    await conn.run_sync(Base.metadata.create_all, tables=[IngestJob.__table__])
+
+
+async def _index_health(conn: AsyncConnection) -> None:
+    await conn.run_sync(Base.metadata.create_all, tables=[IndexHealth.__table__])
+
+
+async def _corpus_generation(conn: AsyncConnection) -> None:
+    await conn.run_sync(Base.metadata.create_all, tables=[CorpusGeneration.__table__])
+    await conn.execute(text("INSERT INTO corpus_generation (id, generation) VALUES (1, 0) ON CONFLICT DO NOTHING"))
+
+
+# The columns the tables had when _partition_by_day was written; the model has
+# gained some since (added by later migrations), which the old tables lack.
+_UNPARTITIONED_STORY_COLUMNS = [
+    "id", "hn_id", "title", "url", "author", "score", "num_comments",
+    "story_text", "slug", "story_type", "created_at", "fetched_at",
+]
+_UNPARTITIONED_CHUNK_COLUMNS = [
+    "id", "story_id", "content", "chunk_type", "author", "embedding", "embedding_model", "created_at",
+]
+
+
+async def _partition_by_day(conn: AsyncConnection) -> None:
+    """Move stories and chunks into day-partitioned tables (app.services.partitions).
+
+    A fresh baseline already creates them partitioned. Otherwise the rows are
+    copied into new partitioned tables inside this one transaction, holding an
+    exclusive lock on the old ones, so plan for downtime proportional to the
+    corpus; the HNSW indexes are built after the copy, one per partition.
+    """
+    today = datetime.now(timezone.utc).date()
+    partitioned = (await conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('stories'))"
+    ))).scalar()
+    if partitioned:
+        await partitions.ensure_partitions(
+            conn, today - timedelta(days=settings.hn_days_to_keep), today + timedelta(days=settings.partition_days_ahead)
+        )
+        return
+
+    await conn.execute(text("LOCK TABLE stories, chunks IN ACCESS EXCLUSIVE MODE"))
+    # Free the table and index names for the new tables.
+    for table in ("stories", "chunks"):
+        await conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned"))
+        indexes = (await conn.execute(text(
+            "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE i.indrelid = to_regclass(:table)"
+        ), {"table": f"{table}_unpartitioned"})).scalars().all()
+        for index in indexes:
+            await conn.execute(text(f'ALTER INDEX "{index}" RENAME TO "{index[:48]}_unpartitioned"'))
+
+    await conn.run_sync(Base.metadata.create_all, tables=[Story.__table__, Chunk.__table__])
+    # Built after the copy: one bulk build per partition beats inserting into
+    # empty graphs by orders of magnitude. The story index comes with the
+    # current model and is built by _story_vectors once its column is filled.
+    await conn.execute(text(f"DROP INDEX {HNSW_INDEX}"))
+    await conn.execute(text(f"DROP INDEX IF EXISTS {STORY_HNSW_INDEX}"))
+
+    bounds = (await conn.execute(text(
+        "SELECT MIN(created_at), MAX(created_at) FROM stories_unpartitioned"
+    ))).one()
+    first = min(bounds[0].astimezone(timezone.utc).date(), today) if bounds[0] else today
+    last = max(bounds[1].astimezone(timezone.utc).date(), today) if bounds[1] else today
+    await partitions.ensure_partitions(conn, first, last + timedelta(days=settings.partition_days_ahead))
+
+    story_columns = ", ".join(_UNPARTITIONED_STORY_COLUMNS)
+    chunk_columns = _UNPARTITIONED_CHUNK_COLUMNS
+    await conn.execute(text(
+        f"INSERT INTO stories ({story_columns}) SELECT {story_columns} FROM stories_unpartitioned"
+    ))
+    await conn.execute(text(
+        f"INSERT INTO chunks ({', '.join(chunk_columns)}, story_created_at) "
+        f"SELECT {', '.join('c.' + c for c in chunk_columns)}, s.created_at "
+        "FROM chunks_unpartitioned c JOIN stories_unpartitioned s ON s.id = c.story_id"
+    ))
+    await conn.execute(text("DROP TABLE chunks_unpartitioned, stories_unpartitioned"))
+
+    await conn.execute(text("SET LOCAL maintenance_work_mem = '1GB'"))
+    await conn.execute(text(
+        f"CREATE INDEX {HNSW_INDEX} ON chunks USING hnsw (embedding vector_cosine_ops) "
+        f"WITH (m = {settings.hnsw_m}, ef_construction = {settings.hnsw_ef_construction})"
+    ))
+    await partitions.name_hnsw_partitions(conn)
+
+
+async def _story_vectors(conn: AsyncConnection) -> None:
+    """stories.embedding, backfilled from the chunks, and its HNSW index.
+
+    The backfill stores the plain mean; ingest normalises it, which changes no
+    cosine distance. A partitioned parent cannot be indexed CONCURRENTLY, so
+    the build blocks ingest (not searches) for as long as it takes; the
+    story graphs are a small fraction of the chunk ones.
+    """
+    await conn.execute(text(
+        f"ALTER TABLE stories ADD COLUMN IF NOT EXISTS embedding vector({settings.embedding_dimensions})"
+    ))
+    await conn.execute(text("""
+        UPDATE stories s SET embedding = a.embedding
+        FROM (
+            SELECT story_id, story_created_at, avg(embedding) AS embedding
+            FROM chunks GROUP BY story_id, story_created_at
+        ) a
+        WHERE s.id = a.story_id AND s.created_at = a.story_created_at AND s.embedding IS NULL
+    """))
+    await conn.execute(text("SET LOCAL maintenance_work_mem = '1GB'"))
+    await conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {STORY_HNSW_INDEX} ON stories USING hnsw (embedding vector_cosine_ops) "
+        f"WITH (m = {settings.hnsw_m}, ef_construction = {settings.hnsw_ef_construction})"
+    ))
+    await partitions.name_hnsw_partitions(conn)
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "baseline tables", _baseline),
+    Migration(2, "stories.slug", _story_slugs, transactional=False),
+    Migration(3, "chunks.embedding_model", _chunk_embedding_model, transactional=False),
+    Migration(4, "chunks HNSW index", _hnsw_index, transactional=False),
+    Migration(5, "pg_prewarm extension", _pg_prewarm, transactional=False),
+    Migration(6, "ingest_jobs queue", _ingest_jobs),
+    Migration(7, "partition stories and chunks by day", _partition_by_day),
+    Migration(8, "index_health history", _index_health),
+    Migration(9, "corpus_generation counter", _corpus_generation),
+    Migration(10, "story-level vectors", _story_vectors),
+]
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+async def current_version(conn: AsyncConnection) -> int:
+    """Highest applied version, 0 for a database the runner has never touched."""
+    if not (await conn.execute(text("SELECT to_regclass('schema_migrations') IS NOT NULL"))).scalar():
+        return 0
+    return (await conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations"))).scalar()
+
+
+async def check_schema_version(conn: AsyncConnection) -> None:
+    """Startup check: refuse to serve against a schema older than this code."""
+    version = await current_version(conn)
+    if version < LATEST_VERSION:
+        raise SchemaOutOfDate(
+            f"database schema is at version {version}, this build needs {LATEST_VERSION}; "
+            "run `python -m app.migrate`"
+        )
+    if version > LATEST_VERSION:
+        # A newer release migrated already; its steps are additive, keep serving.
+        logger.warning("database schema version %d is newer than this build (%d)", version, LATEST_VERSION)
+
+
+async def run_migrations() -> int:
+    """Apply pending migrations under the advisory lock; returns the resulting version."""
+    url, connect_args = _build_async_url(settings.migration_database_url or settings.database_url)
+    migration_engine = create_async_engine(url, poolclass=NullPool, connect_args=connect_args)
+    try:
+        # The lock is held by this autocommit session, which also runs the
+        # CONCURRENTLY steps; transactional steps get a connection of their own.
+        async with migration_engine.connect() as lock_conn:
+            lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+            logger.info("waiting for migration lock")
+            await lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": LOCK_KEY})
+            try:
+                # DDL waiting behind a long query would queue all traffic behind it.
+                await lock_conn.execute(text("SET lock_timeout = '30s'"))
+                await lock_conn.execute(text("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version integer PRIMARY KEY,
+                        name text NOT NULL,
+                        applied_at timestamptz NOT NULL DEFAULT now()
+                    )
+                """))
+                version = await current_version(lock_conn)
+                for migration in MIGRATIONS:
+                    if migration.version <= version:
+                        continue
+                    logger.info("applying migration %d: %s", migration.version, migration.name)
+                    if migration.transactional:
+                        async with migration_engine.begin() as conn:
+                            await conn.execute(text("SET LOCAL lock_timeout = '30s'"))
+                            await migration.apply(conn)
+                            await _record(conn, migration)
+                    else:
+                        await migration.apply(lock_conn)
+                        await _record(lock_conn, migration)
+                    version = migration.version
+                logger.info("schema at version %d", version)
+                return version
+            finally:
+                await lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY})
+    finally:
+        await migration_engine.dispose()
+
+
+async def _record(conn: AsyncConnection, migration: Migration) -> None:
+    await conn.execute(
+        text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name) ON CONFLICT DO NOTHING"),
+        {"version": migration.version, "name": migration.name},
+    )
+
+
+async def _status() -> None:
+    url, connect_args = _build_async_url(settings.migration_database_url or settings.database_url)
+    status_engine = create_async_engine(url, poolclass=NullPool, connect_args=connect_args)
+    try:
+        async with status_engine.connect() as conn:
+            version = await current_version(conn)
+    finally:
+        await status_engine.dispose()
+    print(f"current {version}, latest {LATEST_VERSION}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Apply database schema migrations.")
+    parser.add_argument("--status", action="store_true", help="print the schema version and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(_status() if args.status else run_migrations())
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,15 @@ import re
 import uuid
 from datetime import date, datetime, timezone
 
-from sqlalchemy import String, Integer, Text, ForeignKey, DateTime, Date, Index
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import (
+    BigInteger, CheckConstraint, Float, String, Integer, SmallInteger, Text, ForeignKeyConstraint, DateTime, Date, Index, text
+)
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from pgvector.sqlalchemy import Vector
 
+from app.config import settings
+
 
 def generate_slug(title: str, hn_id: int) -> str:
     """Generate a URL-friendly slug from a story title, with hn_id suffix for uniqueness."""
@@ -22,33 +26,52 @@ class Base(DeclarativeBase):
 
 
 class Story(Base):
+    """A HN story. Range-partitioned by day of created_at; see app.services.partitions.
+
+    Unique keys on a partitioned table must include the partition key, hence
+    (hn_id, created_at) and (slug, created_at). An HN story's created_at never
+    changes, so they are as good as unique hn_id and slug.
+    """
+
     __tablename__ = "stories"
     __table_args__ = (
-        Index("idx_stories_hn_id", "hn_id", unique=True),
+        Index("idx_stories_hn_id", "hn_id", "created_at", unique=True),
         Index("idx_stories_created_at", "created_at"),
-        Index("idx_stories_slug", "slug", unique=True),
+        Index("idx_stories_slug", "slug", "created_at", unique=True),
+        # Story-level search (granularity=story); one small graph per day partition.
+        Index(
+            "idx_stories_embedding_hnsw", "embedding",
+            postgresql_using="hnsw",
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+            postgresql_with={"m": settings.hnsw_m, "ef_construction": settings.hnsw_ef_construction},
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
 
     id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
     )
-    hn_id: Mapped[int] = mapped_column(Integer, nullable=False, unique=True)
+    hn_id: Mapped[int] = mapped_column(Integer, nullable=False)
     title: Mapped[str] = mapped_column(String(1000), nullable=False)
     url: Mapped[str | None] = mapped_column(String(2000), nullable=True)
     author: Mapped[str] = mapped_column(String(200), nullable=False)
     score: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
     num_comments: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
     story_text: Mapped[str | None] = mapped_column(Text, nullable=True)
-    slug: Mapped[str] = mapped_column(String(300), nullable=False, unique=True)
+    slug: Mapped[str] = mapped_column(String(300), nullable=False)
     story_type: Mapped[str] = mapped_column(
         String(20), nullable=False, default="story"
     )
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), nullable=False
+        DateTime(timezone=True), primary_key=True
     )
     fetched_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
     )
+    # Mean direction of the story's chunk embeddings (vector_search.story_vector),
+    # from the same model as they are; searched by granularity=story. NULL only
+    # for a story without chunks.
+    embedding = mapped_column(Vector(settings.embedding_dimensions), nullable=True)
 
     chunks: Mapped[list["Chunk"]] = relationship(
         back_populates="story", cascade="all, delete-orphan"
@@ -59,9 +82,10 @@ class SearchQuota(Base):
     """Per-IP, per-day search counter.
 
     Every search costs one embedding call, so this is the spend cap on a public
-    demo. Kept in Postgres rather than in memory because the backend runs a
-    Recreate rollout: an in-memory counter would reset on every deploy and pod
-    restart, which is exactly when a cap matters least to lose.
+    demo. Workers count in memory and write increments behind to this table
+    (app.services.rate_limit); it is what survives the Recreate rollout, since
+    an in-memory counter alone would reset on every deploy and pod restart,
+    which is exactly when a cap matters least to lose.
 
     Rows are pruned by the retention job, so this is not a long-lived store of
     visitor IPs.
@@ -79,17 +103,31 @@ class SearchQuota(Base):
 
 
 class Chunk(Base):
+    """A searchable piece of a story, partitioned by its story's day like stories."""
+
     __tablename__ = "chunks"
     __table_args__ = (
+        ForeignKeyConstraint(
+            ["story_id", "story_created_at"], ["stories.id", "stories.created_at"], ondelete="CASCADE"
+        ),
         Index("idx_chunks_story_id", "story_id"),
+        Index("idx_chunks_embedding_model", "embedding_model"),
+        # Declared on the parent, so each day partition gets its own graph.
+        Index(
+            "idx_chunks_embedding_hnsw", "embedding",
+            postgresql_using="hnsw",
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+            postgresql_with={"m": settings.hnsw_m, "ef_construction": settings.hnsw_ef_construction},
+        ),
+        {"postgresql_partition_by": "RANGE (story_created_at)"},
     )
 
     id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
     )
-    story_id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True), ForeignKey("stories.id", ondelete="CASCADE"), nullable=False
-    )
+    story_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    # The partition key: a copy of stories.created_at for story_id.
+    story_created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
     content: Mapped[str] = mapped_column(Text, nullable=False)
     chunk_type: Mapped[str] = mapped_column(
         String(20), nullable=False
@@ -97,9 +135,109 @@ class Chunk(Base):
     author: Mapped[str | None] = mapped_column(
         String(200), nullable=True
     )
-    embedding = mapped_column(Vector(1536), nullable=False)
+    embedding = mapped_column(Vector(settings.embedding_dimensions), nullable=False)
+    # Provider model id (e.g. "openai:text-embedding-3-small") that produced
+    # `embedding`; vectors from different models must never be compared.
+    embedding_model: Mapped[str] = mapped_column(String(100), nullable=False)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
     )
 
     story: Mapped["Story"] = relationship(back_populates="chunks")
+
+
+class IngestJob(Base):
+    """One ingest or prune run, queued by the API and executed by app.worker.
+
+    Workers claim queued rows with FOR UPDATE SKIP LOCKED and keep
+    heartbeat_at fresh while they run; a running job whose heartbeat went
+    stale belonged to a worker that died, and is claimed again. A backfill
+    records `checkpoint` after every finished day, so the next attempt resumes
+    below it instead of starting over.
+    """
+
+    __tablename__ = "ingest_jobs"
+    __table_args__ = (
+        # At most one queued or running job per kind: enqueueing a second one
+        # returns the first, which is what the old _ingest_running flag did,
+        # but across workers and pods.
+        Index(
+            "idx_ingest_jobs_active_kind", "kind", unique=True,
+            postgresql_where=text("status IN ('queued', 'running')"),
+        ),
+        Index("idx_ingest_jobs_created_at", "created_at"),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+    )
+    # "initial", "daily" or "prune"
+    kind: Mapped[str] = mapped_column(String(20), nullable=False)
+    # "queued", "running", "succeeded" or "failed"
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default="queued")
+    window_start: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    window_end: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Lower edge of the oldest fully ingested day (backfills run newest first).
+    checkpoint: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    days_total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    days_done: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Running totals while the job runs, the final result once it has finished.
+    result: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    worker: Mapped[str | None] = mapped_column(String(200), nullable=True)
+    run_after: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc)
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc)
+    )
+    started_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    heartbeat_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Primary WAL position (bytes) after the job's latest writes; API processes
+    # do not read from replicas behind the highest one (app.database).
+    write_lsn: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+
+
+class IndexHealth(Base):
+    """One HNSW index measurement by app.services.index_health, and what was done about it."""
+
+    __tablename__ = "index_health"
+    __table_args__ = (
+        Index("idx_index_health_index_measured", "index_name", "measured_at"),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    measured_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    index_name: Mapped[str] = mapped_column(String(100), nullable=False)
+    table_name: Mapped[str] = mapped_column(String(100), nullable=False)
+    index_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    live_tuples: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    dead_tuples: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    # Null for partitions too small to probe.
+    recall: Mapped[float | None] = mapped_column(Float, nullable=True)
+    probe_p50_ms: Mapped[float | None] = mapped_column(Float, nullable=True)
+    probe_p99_ms: Mapped[float | None] = mapped_column(Float, nullable=True)
+    # "reindex", "deferred: <why>", "failed: <error>", or null when healthy.
+    action: Mapped[str | None] = mapped_column(Text, nullable=True)
+    action_seconds: Mapped[float | None] = mapped_column(Float, nullable=True)
+
+
+class CorpusGeneration(Base):
+    """A single row whose generation goes up whenever ingest or prune changes the corpus.
+
+    Workers poll it to know when their semantic query cache
+    (app.services.query_cache) has gone stale.
+    """
+
+    __tablename__ = "corpus_generation"
+    __table_args__ = (
+        CheckConstraint("id = 1", name="corpus_generation_single_row"),
+    )
+
+    id: Mapped[int] = mapped_column(SmallInteger, primary_key=True, default=1)
+    generation: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    changed_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=text("now()")
+    )
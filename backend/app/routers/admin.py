@@ -0,0 +1,126 @@
+import secrets
+from dataclasses import asdict
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import Response
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import read_session, replicas
+from app.schemas import (
+    CapturedPlanOut,
+    IndexHealthOut,
+    IndexHealthResponse,
+    LoopStallOut,
+    PlanSamplesResponse,
+    ProfileSummary,
+    ReplicaStatus,
+)
+from app.services import plan_sampler, profiling
+
+
+def require_admin(x_admin_token: str = Header(default="")) -> None:
+    """Gate for operator-only routes. Unconfigured means the routes do not exist."""
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/api/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/plans", response_model=PlanSamplesResponse)
+async def get_plans(query: str | None = None, missing_index: bool = False, full: bool = False):
+    """Recently sampled vector-query plans, newest first.
+
+    `missing_index` keeps only plans that did not use the expected index;
+    `full` includes the raw EXPLAIN JSON.
+    """
+    plans = plan_sampler.recent_plans()
+    flagged = sum(not p.used_expected_index for p in plans)
+    if query:
+        plans = [p for p in plans if p.query == query]
+    if missing_index:
+        plans = [p for p in plans if not p.used_expected_index]
+    return PlanSamplesResponse(
+        sample_rate=settings.plan_sample_rate,
+        slow_query_ms=settings.plan_slow_query_ms,
+        captured=len(plan_sampler.recent_plans()),
+        missing_index=flagged,
+        plans=[CapturedPlanOut(**{**asdict(p), "plan": p.plan if full else None}) for p in plans],
+    )
+
+
+@router.get("/profiles", response_model=list[ProfileSummary])
+async def list_profiles():
+    """Stored request profiles, newest first."""
+    return [
+        ProfileSummary(**{k: v for k, v in asdict(p).items() if k != "session"})
+        for p in profiling.recent_profiles()
+    ]
+
+
+@router.get("/profiles/{profile_id}", include_in_schema=False)
+async def download_profile(profile_id: str, format: str = Query("html", pattern="^(html|text|speedscope)$")):
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    body, media_type = profiling.render_profile(profile, format)
+    return Response(content=body, media_type=media_type)
+
+
+@router.get("/loop-stalls", response_model=list[LoopStallOut])
+async def list_loop_stalls():
+    """Stacks captured while the event loop was blocked, newest first."""
+    return [LoopStallOut(**asdict(s)) for s in profiling.recent_stalls()]
+
+
+@router.get("/replicas", response_model=list[ReplicaStatus])
+async def list_replicas():
+    """Read replicas as of the last health check."""
+    return [
+        ReplicaStatus(
+            name=r.name,
+            healthy=r.healthy,
+            lag_seconds=r.lag_seconds,
+            latency_ms=round(r.latency_ms, 2) if r.latency_ms is not None else None,
+            last_error=r.last_error,
+        )
+        for r in replicas
+    ]
+
+
+_HEALTH_COLUMNS = """
+    measured_at, index_name, table_name, index_bytes, live_tuples, dead_tuples,
+    recall, probe_p50_ms, probe_p99_ms, action, action_seconds
+"""
+
+
+def _health_out(row) -> IndexHealthOut:
+    return IndexHealthOut(**{**row._mapping, "measured_at": row.measured_at.isoformat(timespec="seconds")})
+
+
+@router.get("/index-health", response_model=IndexHealthResponse)
+async def index_health(actions: int = 50):
+    """Per-partition HNSW index health from the index_maintenance job.
+
+    `indexes` is the latest measurement of each index that still exists;
+    `actions` the most recent rebuilds, deferrals and failures.
+    """
+    async with read_session() as session:
+        latest = (await session.execute(text(f"""
+            SELECT DISTINCT ON (h.index_name) {_HEALTH_COLUMNS}
+            FROM index_health h
+            WHERE to_regclass(h.index_name) IS NOT NULL
+            ORDER BY h.index_name, h.measured_at DESC
+        """))).fetchall()
+        recent = (await session.execute(text(f"""
+            SELECT {_HEALTH_COLUMNS} FROM index_health
+            WHERE action IS NOT NULL
+            ORDER BY measured_at DESC
+            LIMIT :limit
+        """), {"limit": min(actions, 500)})).fetchall()
+    return IndexHealthResponse(indexes=[_health_out(r) for r in latest], actions=[_health_out(r) for r in recent])
+
@@ -1,54 +1,84 @@
-import asyncio
-import logging
+import json
+import uuid
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Response
 
-from app.schemas import IngestResponse, PruneResponse
-from app.services.ingest import ingest_initial, ingest_daily, prune_old_stories
-from app.services.rate_limit import prune_quota
+from app.schemas import IngestJobOut, IngestJobsResponse
+from app.services import jobs
 
 router = APIRouter(prefix="/api/ingest", tags=["ingest"])
-logger = logging.getLogger(__name__)
 
-_ingest_running = False
+# Ingest and prune run in the job worker (python -m app.worker); these routes
+# only queue them and report progress. Queueing a kind that is already queued
+# or running returns the existing job with 200 instead of 202.
 
 
-@router.post("/initial")
-async def trigger_initial_ingest():
-    """Trigger initial 30-day HN data fetch. Runs in background."""
-    global _ingest_running
-    if _ingest_running:
-        return {"status": "already_running"}
-    _ingest_running = True
+def _job_out(row) -> IngestJobOut:
+    def iso(value):
+        return value.isoformat() if value is not None else None
 
-    async def _run():
-        global _ingest_running
-        try:
-            result = await ingest_initial()
-            logger.info(f"Initial ingest completed: {result}")
-        except Exception as e:
-            logger.error(f"Initial ingest failed: {e}")
-        finally:
-            _ingest_running = False
+    result = json.loads(row.result) if isinstance(row.result, str) else row.result
+    return IngestJobOut(
+        id=str(row.id),
+        kind=row.kind,
+        status=row.status,
+        days_done=row.days_done,
+        days_total=row.days_total,
+        checkpoint=iso(row.checkpoint),
+        attempts=row.attempts,
+        error=row.error,
+        result=result,
+        created_at=row.created_at.isoformat(),
+        started_at=iso(row.started_at),
+        finished_at=iso(row.finished_at),
+    )
 
-    asyncio.create_task(_run())
-    return {"status": "started"}
 
+async def _enqueue(kind: str, response: Response) -> IngestJobOut:
+    row, created = await jobs.enqueue(kind)
+    response.status_code = 202 if created else 200
+    return _job_out(row)
 
-@router.post("/daily", response_model=IngestResponse)
-async def trigger_daily_ingest():
-    """Trigger daily update: fetch last 24h of stories."""
-    result = await ingest_daily()
-    return IngestResponse(**result)
 
+@router.post("/initial", response_model=IngestJobOut)
+async def trigger_initial_ingest(response: Response):
+    """Queue the initial backfill of hn_days_to_keep days. Resumes per day if interrupted."""
+    return await _enqueue("initial", response)
 
-@router.post("/prune", response_model=PruneResponse)
-async def trigger_prune():
-    """Drop stories outside the retention window to keep the database bounded.
+
+@router.post("/daily", response_model=IngestJobOut)
+async def trigger_daily_ingest(response: Response):
+    """Queue the daily update: fetch the last 24h of stories."""
+    return await _enqueue("daily", response)
+
+
+@router.post("/prune", response_model=IngestJobOut)
+async def trigger_prune(response: Response):
+    """Queue dropping stories outside the retention window to keep the database bounded.
 
     Also expires the per-IP search counters, so visitor addresses are not
     retained beyond the short window the rate limit needs them for.
     """
-    result = await prune_old_stories()
-    result["quota_rows_deleted"] = await prune_quota()
-    return PruneResponse(**result)
+    return await _enqueue("prune", response)
+
+
+@router.post("/index-maintenance", response_model=IngestJobOut)
+async def trigger_index_maintenance(response: Response):
+    """Queue an HNSW index health check now rather than at the next interval.
+
+    Rebuilds still only happen inside index_maintenance_window.
+    """
+    return await _enqueue("index_maintenance", response)
+
+
+@router.get("/jobs", response_model=IngestJobsResponse)
+async def list_jobs(limit: int = 20):
+    return IngestJobsResponse(jobs=[_job_out(r) for r in await jobs.recent_jobs(min(limit, 100))])
+
+
+@router.get("/jobs/{job_id}", response_model=IngestJobOut)
+async def get_job(job_id: uuid.UUID):
+    row = await jobs.get_job(job_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="No such job")
+    return _job_out(row)
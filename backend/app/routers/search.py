@@ -1,23 +1,126 @@
+import asyncio
+import json
 import logging
+import math
 import time
 
-from fastapi import APIRouter, HTTPException, Request
-from openai import OpenAIError, RateLimitError
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
-from app.schemas import SearchRequest, SearchResponse, SearchResultItem, PerformanceStats
-from app.services.embeddings import generate_embedding
+from app.routers.admin import require_admin
+from app.schemas import (
+    BatchSearchRequest,
+    BatchSearchResponse,
+    BatchSearchResult,
+    PerformanceStats,
+    SearchRequest,
+    SearchResponse,
+    SearchResultItem,
+)
+from app.services.embeddings import (
+    EmbeddingError,
+    EmbeddingUnavailable,
+    EmbeddingQuotaError,
+    embedding_model_id,
+    check_available,
+    generate_embedding,
+    generate_embeddings,
+)
+from app.services import query_cache
+from app.services.admission import Overloaded, Slot, search_admission
+from app.services.deadline import ClientDisconnected, DeadlineExceeded, cancel_on_disconnect, deadline, expiry, resume
+from app.services.metrics import REQUEST_ABORTS, SEARCH_STREAM_SECONDS
 from app.services.rate_limit import consume_search, get_client_ip, refund_search
-from app.services.vector_search import search_hn
+from app.services.vector_search import (
+    CorpusModelMismatch,
+    HNSearchResult,
+    SearchPerformance,
+    batch_nearest_chunks,
+    count_chunks,
+    count_stories,
+    ensure_corpus_model,
+    index_type,
+    nearest_chunks,
+    nearest_stories,
+    search_hn,
+    search_stories,
+)
 from app.config import settings
 
 router = APIRouter(prefix="/api", tags=["search"])
 logger = logging.getLogger(__name__)
 
 
-@router.post("/search", response_model=SearchResponse)
-async def search(request: SearchRequest, http_request: Request):
-    """Semantic search over HN stories and comments."""
-    total_start = time.time()
+def _result_item(r: HNSearchResult) -> SearchResultItem:
+    return SearchResultItem(
+        story_title=r.story_title,
+        story_slug=r.story_slug,
+        story_url=r.story_url,
+        story_author=r.story_author,
+        story_score=r.story_score,
+        story_hn_url=f"https://news.ycombinator.com/item?id={r.story_hn_id}",
+        matched_content=r.matched_content,
+        chunk_type=r.chunk_type,
+        comment_author=r.comment_author,
+        similarity_score=r.similarity_score,
+        story_date=r.story_date,
+    )
+
+
+def _provider_down(e: EmbeddingUnavailable) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Search is temporarily unavailable: the embedding provider is down. Browsing still works.",
+        headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+    )
+
+
+def _busy(e: Overloaded) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Search is busy right now; try again in a few seconds. Browsing still works.",
+        headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+    )
+
+
+async def _admit(http_request: Request) -> Slot:
+    """A search admission slot for the database work; a shed search gets its quota back."""
+    try:
+        return await search_admission.acquire()
+    except Overloaded as e:
+        await refund_search(get_client_ip(http_request))
+        raise _busy(e)
+
+
+async def _embed_query(request: SearchRequest, http_request: Request) -> tuple[list[float], str, float]:
+    """Everything before the vector query; returns (query_embedding, model_id, embedding_time_ms).
+
+    Raises the HTTP errors a search can be refused with, so the streamed
+    variant can still answer them with a status code before it starts.
+    """
+    # A corpus embedded by a different model cannot answer this query at all;
+    # say so before spending the caller's allowance or an embedding call.
+    model_id = embedding_model_id()
+    try:
+        ensure_corpus_model(model_id)
+    except CorpusModelMismatch as e:
+        logger.error("search refused: %s", e)
+        raise HTTPException(
+            status_code=503,
+            detail="Search is temporarily unavailable: the index was built with a different embedding model. Browsing still works.",
+        )
+
+    # While the provider is known to be down, or searches are already queued
+    # past the deadline, do not even take from the allowance.
+    try:
+        check_available()
+    except EmbeddingUnavailable as e:
+        raise _provider_down(e)
+    try:
+        search_admission.check()
+    except Overloaded as e:
+        raise _busy(e)
 
     # Count the search before spending anything on it, so simultaneous requests
     # cannot both pass the check and overshoot the cap.
@@ -43,14 +146,17 @@ async def search(request: SearchRequest, http_request: Request):
     embed_start = time.time()
     try:
         query_embedding = await generate_embedding(request.query)
-    except RateLimitError:
+    except EmbeddingQuotaError:
         await refund_search(client_ip)
         logger.exception("embedding quota exhausted; search unavailable")
         raise HTTPException(
             status_code=503,
             detail="Search is temporarily unavailable: the embedding quota is exhausted. Browsing still works.",
         )
-    except OpenAIError:
+    except EmbeddingUnavailable as e:
+        await refund_search(client_ip)
+        raise _provider_down(e)
+    except EmbeddingError:
         await refund_search(client_ip)
         logger.exception("embedding provider error; search unavailable")
         raise HTTPException(
@@ -59,34 +165,60 @@ async def search(request: SearchRequest, http_request: Request):
         )
     embedding_time_ms = (time.time() - embed_start) * 1000
     logger.info("search by %s (%s/%s today)", client_ip, used, limit)
+    return query_embedding, model_id, embedding_time_ms
+
+
+@router.post("/search", response_model=SearchResponse)
+async def search(request: SearchRequest, http_request: Request):
+    """Semantic search over HN stories and comments."""
+    with deadline(settings.search_deadline_ms / 1000):
+        return await _guarded(http_request, "/api/search", _search(request, http_request))
+
+
+async def _guarded(http_request: Request, route: str, work):
+    """Await a search's work, cancelling it if the client leaves; a passed deadline is a refunded 504."""
+    try:
+        return await cancel_on_disconnect(http_request, work)
+    except ClientDisconnected:
+        REQUEST_ABORTS.labels(route, "disconnect").inc()
+        raise HTTPException(status_code=499, detail="Client closed request")
+    except DeadlineExceeded as e:
+        REQUEST_ABORTS.labels(route, "deadline").inc()
+        logger.warning("search over its deadline: %s", e)
+        # Only raised after the quota was taken, by the embedding call or a query.
+        await refund_search(get_client_ip(http_request))
+        raise HTTPException(status_code=504, detail="Search took too long; please try again.")
+
 
-    # Search
+async def _search(request: SearchRequest, http_request: Request) -> SearchResponse:
+    total_start = time.time()
+    query_embedding, model_id, embedding_time_ms = await _embed_query(request, http_request)
+
+    # Search, unless a near-duplicate query was answered recently.
     top_k = request.top_k or settings.top_k
-    results, perf = await search_hn(
-        query_embedding=query_embedding,
-        top_k=top_k,
-        threshold=settings.similarity_threshold,
-    )
+    cache_similarity = None
+    cached = query_cache.lookup(query_embedding, top_k, request.granularity)
+    if cached is not None:
+        results, perf, cache_similarity = cached
+    else:
+        generation = query_cache.current_generation()
+        search_fn = search_stories if request.granularity == "story" else search_hn
+        slot = await _admit(http_request)
+        try:
+            results, perf = await search_fn(
+                query_embedding=query_embedding,
+                top_k=top_k,
+                threshold=settings.similarity_threshold,
+                model_id=model_id,
+            )
+        finally:
+            slot.release()
+        query_cache.store(query_embedding, top_k, results, perf, generation, request.granularity)
 
     total_time_ms = (time.time() - total_start) * 1000
 
     return SearchResponse(
-        results=[
-            SearchResultItem(
-                story_title=r.story_title,
-                story_slug=r.story_slug,
-                story_url=r.story_url,
-                story_author=r.story_author,
-                story_score=r.story_score,
-                story_hn_url=f"https://news.ycombinator.com/item?id={r.story_hn_id}",
-                matched_content=r.matched_content,
-                chunk_type=r.chunk_type,
-                comment_author=r.comment_author,
-                similarity_score=r.similarity_score,
-                story_date=r.story_date,
-            )
-            for r in results
-        ],
+        results=[_result_item(r) for r in results],
         performance=PerformanceStats(
             query_time_ms=round(perf.query_time_ms, 2),
             embedding_time_ms=round(embedding_time_ms, 2),
@@ -95,5 +227,229 @@ async def search(request: SearchRequest, http_request: Request):
             results_found=len(results),
             index_type=perf.index_type,
             similarity_metric="cosine",
+            cache_similarity=cache_similarity,
+        ),
+    )
+
+
+def _frame(payload: dict) -> bytes:
+    return (json.dumps(payload) + "\n").encode()
+
+
+@router.post("/search/stream")
+async def search_stream(request: SearchRequest, http_request: Request):
+    """Progressive search, as newline-delimited JSON frames.
+
+    {"type": "results", "stage": "fast", ...} comes from a pass with
+    stream_fast_ef_search, as soon as it is ready; {"type": "results",
+    "stage": "refined", ...} from a higher-recall pass with
+    stream_refined_ef_search, and replaces it; {"type": "performance", ...}
+    ends the stream. granularity=story has only the refined pass. A semantic
+    query cache hit sends a single "cached" results frame instead of the
+    passes. Refusals (rate limit, embedding outage) are plain HTTP errors as
+    for /api/search; a failure after the first frame is sent as {"type":
+    "error", "detail": ...}. search_deadline_ms covers the whole stream.
+    """
+    total_start = time.time()
+    with deadline(settings.search_deadline_ms / 1000):
+        query_embedding, _, embedding_time_ms = await _guarded(
+            http_request, "/api/search/stream", _embed_query(request, http_request)
+        )
+        expires = expiry()
+    top_k = request.top_k or settings.top_k
+    story_mode = request.granularity == "story"
+    passes = [("fast", settings.stream_fast_ef_search)]
+    if story_mode:
+        # One row per story: a few times fewer candidates, one pass is enough.
+        passes = [("refined", None)]
+    elif index_type() != "hnsw":
+        # The local backend's scan is exact; one pass is already the refined one.
+        passes = [("refined", None)]
+    elif settings.stream_refined_ef_search > max(settings.stream_fast_ef_search, top_k):
+        passes.append(("refined", settings.stream_refined_ef_search))
+
+    cached = query_cache.lookup(query_embedding, top_k, request.granularity)
+    if cached is not None:
+        return _cached_stream(cached, total_start, embedding_time_ms)
+    generation = query_cache.current_generation()
+    stream_index_type = "hnsw-story" if story_mode else index_type()
+    slot = await _admit(http_request)
+
+    async def frames():
+        # The body runs after the route returned, outside its deadline block.
+        resume(expires)
+        # The chunk (story) count is only needed for the last frame; run it alongside.
+        count_task = asyncio.create_task(count_stories() if story_mode else count_chunks())
+        first_result_ms = None
+        query_time_ms = 0.0
+        results: list[HNSearchResult] = []
+        try:
+            for stage, ef_search in passes:
+                if story_mode:
+                    results, pass_ms = await nearest_stories(query_embedding, top_k, settings.similarity_threshold)
+                else:
+                    results, pass_ms = await nearest_chunks(
+                        query_embedding, top_k, settings.similarity_threshold, ef_search=ef_search
+                    )
+                query_time_ms += pass_ms
+                elapsed_ms = (time.time() - total_start) * 1000
+                if first_result_ms is None:
+                    first_result_ms = elapsed_ms
+                    SEARCH_STREAM_SECONDS.labels("first_result").observe(elapsed_ms / 1000)
+                yield _frame({
+                    "type": "results",
+                    "stage": stage,
+                    "elapsed_ms": round(elapsed_ms, 2),
+                    "results": [_result_item(r).model_dump() for r in results],
+                })
+            chunks_searched = await count_task
+            query_cache.store(
+                query_embedding, top_k, results,
+                SearchPerformance(round(query_time_ms, 2), chunks_searched, stream_index_type), generation,
+                request.granularity,
+            )
+        except DeadlineExceeded as e:
+            REQUEST_ABORTS.labels("/api/search/stream", "deadline").inc()
+            logger.warning("streamed search over its deadline: %s", e)
+            yield _frame({"type": "error", "detail": "Search took too long; please try again."})
+            return
+        except asyncio.CancelledError:
+            REQUEST_ABORTS.labels("/api/search/stream", "disconnect").inc()
+            raise
+        except Exception:
+            logger.exception("streamed search failed")
+            yield _frame({"type": "error", "detail": "Search failed before all results were sent."})
+            return
+        finally:
+            count_task.cancel()
+            slot.release()
+
+        total_time_ms = (time.time() - total_start) * 1000
+        SEARCH_STREAM_SECONDS.labels("total").observe(total_time_ms / 1000)
+        performance = PerformanceStats(
+            # Both passes.
+            query_time_ms=round(query_time_ms, 2),
+            embedding_time_ms=round(embedding_time_ms, 2),
+            total_time_ms=round(total_time_ms, 2),
+            chunks_searched=chunks_searched,
+            results_found=len(results),
+            index_type=stream_index_type,
+            similarity_metric="cosine",
+            time_to_first_result_ms=round(first_result_ms, 2),
+        )
+        yield _frame({"type": "performance", "performance": performance.model_dump()})
+
+    # Also released after the response, in case the client left before the
+    # generator ever started.
+    return _ndjson(frames(), background=BackgroundTask(slot.release))
+
+
+def _ndjson(frames, background: BackgroundTask | None = None) -> StreamingResponse:
+    # no-cache / X-Accel-Buffering: keep proxies from holding back the first frame.
+    return StreamingResponse(
+        frames,
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background,
+    )
+
+
+def _cached_stream(cached, total_start: float, embedding_time_ms: float) -> StreamingResponse:
+    """A query cache hit, streamed: its results as the one "cached" frame, then performance."""
+    results, perf, similarity = cached
+    elapsed_ms = (time.time() - total_start) * 1000
+    SEARCH_STREAM_SECONDS.labels("first_result").observe(elapsed_ms / 1000)
+    SEARCH_STREAM_SECONDS.labels("total").observe(elapsed_ms / 1000)
+    performance = PerformanceStats(
+        query_time_ms=perf.query_time_ms,
+        embedding_time_ms=round(embedding_time_ms, 2),
+        total_time_ms=round(elapsed_ms, 2),
+        chunks_searched=perf.chunks_searched,
+        results_found=len(results),
+        index_type=perf.index_type,
+        similarity_metric="cosine",
+        time_to_first_result_ms=round(elapsed_ms, 2),
+        cache_similarity=similarity,
+    )
+    return _ndjson(iter([
+        _frame({
+            "type": "results",
+            "stage": "cached",
+            "elapsed_ms": round(elapsed_ms, 2),
+            "results": [_result_item(r).model_dump() for r in results],
+        }),
+        _frame({"type": "performance", "performance": performance.model_dump()}),
+    ]))
+
+
+# Batches running in this worker; see search_batch_concurrency.
+_batches_running = 0
+
+
+@router.post("/search/batch", response_model=BatchSearchResponse, dependencies=[Depends(require_admin)])
+async def search_batch(request: BatchSearchRequest):
+    """Many searches at once, for evaluation scripts and internal tools.
+
+    One embedding call for all queries and one statement for all the vector
+    lookups. Needs X-Admin-Token and does not count against the per-IP quota;
+    bounded by search_batch_max_queries, search_batch_max_top_k and
+    search_batch_concurrency instead.
+    """
+    global _batches_running
+    total_start = time.time()
+    queries = request.queries
+    if not queries:
+        raise HTTPException(status_code=422, detail="No queries")
+    if len(queries) > settings.search_batch_max_queries:
+        raise HTTPException(
+            status_code=422, detail=f"At most {settings.search_batch_max_queries} queries per batch"
+        )
+    if any(q.granularity != "chunk" for q in queries):
+        raise HTTPException(status_code=422, detail="Batch search only supports granularity=chunk")
+    top_ks = [q.top_k or settings.top_k for q in queries]
+    if max(top_ks) > settings.search_batch_max_top_k or min(top_ks) < 1:
+        raise HTTPException(
+            status_code=422, detail=f"top_k must be between 1 and {settings.search_batch_max_top_k}"
+        )
+    try:
+        ensure_corpus_model(embedding_model_id())
+    except CorpusModelMismatch as e:
+        logger.error("batch search refused: %s", e)
+        raise HTTPException(
+            status_code=503, detail="Search is unavailable: the index was built with a different embedding model."
+        )
+    if _batches_running >= settings.search_batch_concurrency:
+        raise HTTPException(
+            status_code=429, detail="Too many batch searches running; retry shortly.", headers={"Retry-After": "5"}
+        )
+
+    _batches_running += 1
+    try:
+        embed_start = time.time()
+        try:
+            embeddings = await generate_embeddings([q.query for q in queries])
+        except EmbeddingError:
+            logger.exception("embedding provider error; batch search unavailable")
+            raise HTTPException(status_code=503, detail="The embedding provider did not respond.")
+        embedding_time_ms = (time.time() - embed_start) * 1000
+        grouped, query_time_ms = await batch_nearest_chunks(embeddings, top_ks, settings.similarity_threshold)
+        chunks_searched = await count_chunks()
+    finally:
+        _batches_running -= 1
+
+    total_time_ms = (time.time() - total_start) * 1000
+    return BatchSearchResponse(
+        results=[
+            BatchSearchResult(query=q.query, results=[_result_item(r) for r in results])
+            for q, results in zip(queries, grouped)
+        ],
+        performance=PerformanceStats(
+            query_time_ms=round(query_time_ms, 2),
+            embedding_time_ms=round(embedding_time_ms, 2),
+            total_time_ms=round(total_time_ms, 2),
+            chunks_searched=chunks_searched,
+            results_found=sum(len(r) for r in grouped),
+            index_type="hnsw",
+            similarity_metric="cosine",
         ),
     )
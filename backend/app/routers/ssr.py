@@ -1,14 +1,18 @@
 import html
 import logging
-import time
 from datetime import datetime
 
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse, Response
 from sqlalchemy import select, text as sql_text
 
-from app.database import async_session
-from app.models import Story, Chunk
+from app.config import settings
+from app.database import read_session
+from app.models import Story
+from app.services.deadline import DeadlineExceeded, deadline
+from app.services.metrics import REQUEST_ABORTS
+from app.services.stories import load_story
+from app.services.vector_search import find_related_stories
 
 logger = logging.getLogger(__name__)
 
@@ -29,45 +33,25 @@ def _format_date(dt: datetime) -> str:
 async def _fetch_related(story_id: str, limit: int = 5) -> dict:
     """Returns {"stories": [...], "query_time_ms": float, "chunks_searched": int}."""
     try:
-        async with async_session() as session:
-            count_result = await session.execute(
-                sql_text("SELECT COUNT(*) FROM chunks WHERE chunk_type = 'title'")
-            )
-            chunks_searched = count_result.scalar() or 0
-
-            start = time.time()
-            result = await session.execute(
-                sql_text("""
-                    SELECT
-                        s.slug, s.title, s.author, s.score, s.created_at,
-                        1 - (c.embedding <=> ref.embedding) AS similarity_score
-                    FROM chunks c
-                    JOIN stories s ON c.story_id = s.id
-                    CROSS JOIN (
-                        SELECT embedding FROM chunks
-                        WHERE story_id = :story_id AND chunk_type = 'title' LIMIT 1
-                    ) ref
-                    WHERE c.chunk_type = 'title' AND s.id != :story_id
-                      AND 1 - (c.embedding <=> ref.embedding) > 0.3
-                    ORDER BY c.embedding <=> ref.embedding
-                    LIMIT :limit
-                """),
-                {"story_id": story_id, "limit": limit},
-            )
-            query_time_ms = (time.time() - start) * 1000
-
-            stories = [
-                {
-                    "slug": r.slug,
-                    "title": r.title,
-                    "author": r.author,
-                    "score": r.score,
-                    "date": r.created_at.strftime("%B %d, %Y"),
-                    "similarity": round(float(r.similarity_score) * 100),
-                }
-                for r in result.fetchall()
-            ]
-            return {"stories": stories, "query_time_ms": round(query_time_ms, 1), "chunks_searched": chunks_searched}
+        with deadline(settings.related_deadline_ms / 1000):
+            rows, query_time_ms, chunks_searched = await find_related_stories(story_id, limit)
+
+        stories = [
+            {
+                "slug": r.slug,
+                "title": r.title,
+                "author": r.author,
+                "score": r.score,
+                "date": r.created_at.strftime("%B %d, %Y"),
+                "similarity": round(float(r.similarity_score) * 100),
+            }
+            for r in rows
+        ]
+        return {"stories": stories, "query_time_ms": round(query_time_ms, 1), "chunks_searched": chunks_searched}
+    except DeadlineExceeded:
+        # The page is still worth serving without them.
+        REQUEST_ABORTS.labels("/story/{slug}", "deadline").inc()
+        return {"stories": [], "query_time_ms": 0, "chunks_searched": 0}
     except Exception as e:
         logger.error(f"SSR related stories failed: {e}")
         return {"stories": [], "query_time_ms": 0, "chunks_searched": 0}
@@ -80,24 +64,12 @@ async def ssr_story_page(slug: str, request: Request):
     This gives Googlebot real content to index without waiting for JS rendering.
     The SPA JavaScript will hydrate and take over for interactive users.
     """
-    async with async_session() as session:
-        result = await session.execute(
-            select(Story).where(Story.slug == slug)
-        )
-        story = result.scalar_one_or_none()
-
-        if not story:
-            return HTMLResponse(
-                content=_not_found_html(),
-                status_code=404,
-            )
-
-        chunks_result = await session.execute(
-            select(Chunk.content, Chunk.chunk_type, Chunk.author, Chunk.created_at)
-            .where(Chunk.story_id == story.id)
-            .order_by(Chunk.created_at)
+    story, chunks = await load_story(slug)
+    if not story:
+        return HTMLResponse(
+            content=_not_found_html(),
+            status_code=404,
         )
-        chunks = chunks_result.fetchall()
 
     related_data = await _fetch_related(str(story.id))
     related = related_data["stories"]
@@ -105,7 +77,7 @@ async def ssr_story_page(slug: str, request: Request):
     chunks_searched = related_data["chunks_searched"]
 
     # Get total stories count for the footer
-    async with async_session() as session:
+    async with read_session() as session:
         total_stories = (await session.execute(sql_text("SELECT COUNT(*) FROM stories"))).scalar() or 0
         total_chunks = (await session.execute(sql_text("SELECT COUNT(*) FROM chunks"))).scalar() or 0
 
@@ -277,7 +249,7 @@ Semantic search powered by <a href="https://rivestack.io"><strong>Rivestack pgve
 @router.get("/sitemap.xml", response_class=Response)
 async def sitemap_xml():
     """Serve sitemap at /sitemap.xml on the public domain."""
-    async with async_session() as session:
+    async with read_session() as session:
         result = await session.execute(
             select(Story.slug, Story.created_at)
             .order_by(Story.created_at.desc())
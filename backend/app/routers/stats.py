@@ -1,9 +1,10 @@
 from fastapi import APIRouter
 from sqlalchemy import select, func
 
-from app.database import async_session
+from app.database import read_session
 from app.models import Story, Chunk
-from app.schemas import DbStats
+from app.schemas import DbStats, EmbeddingStatus
+from app.services.embeddings import embedding_status
 
 router = APIRouter(prefix="/api", tags=["stats"])
 
@@ -11,7 +12,7 @@ router = APIRouter(prefix="/api", tags=["stats"])
 @router.get("/stats", response_model=DbStats)
 async def get_stats():
     """Get database statistics."""
-    async with async_session() as session:
+    async with read_session() as session:
         story_count = (await session.execute(
             select(func.count(Story.id))
         )).scalar() or 0
@@ -34,4 +35,5 @@ async def get_stats():
             oldest_story=oldest.isoformat()[:10] if oldest else None,
             newest_story=newest.isoformat()[:10] if newest else None,
             index_type="hnsw",
+            embedding=EmbeddingStatus(**embedding_status()),
         )
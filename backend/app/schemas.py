@@ -1,9 +1,14 @@
+from typing import Literal
+
 from pydantic import BaseModel
 
 
 class SearchRequest(BaseModel):
     query: str
     top_k: int = 10
+    # "story": one result per story, ranked by the story's aggregate vector,
+    # with its best-matching chunk as the excerpt.
+    granularity: Literal["chunk", "story"] = "chunk"
 
 
 class SearchResultItem(BaseModel):
@@ -28,6 +33,12 @@ class PerformanceStats(BaseModel):
     results_found: int
     index_type: str
     similarity_metric: str
+    # Streamed searches only: when the first (fast) results were sent.
+    time_to_first_result_ms: float | None = None
+    # Set when the results came from the semantic query cache: how similar the
+    # cached query was. query_time_ms and chunks_searched are then the cached
+    # search's.
+    cache_similarity: float | None = None
 
 
 class SearchResponse(BaseModel):
@@ -35,27 +46,58 @@ class SearchResponse(BaseModel):
     performance: PerformanceStats
 
 
+class BatchSearchRequest(BaseModel):
+    queries: list[SearchRequest]
+
+
+class BatchSearchResult(BaseModel):
+    query: str
+    results: list[SearchResultItem]
+
+
+class BatchSearchResponse(BaseModel):
+    # In request order.
+    results: list[BatchSearchResult]
+    # For the whole batch; results_found counts results over all queries.
+    performance: PerformanceStats
+
+
+class EmbeddingStatus(BaseModel):
+    # "closed" (normal), "open" (searches refused without calling the provider)
+    # or "half_open" (one probe request decides). Per API worker.
+    state: str
+    retry_after_seconds: float
+    timeout_ms: float
+    hedge_after_ms: float | None
+
+
 class DbStats(BaseModel):
     total_stories: int
     total_chunks: int
     oldest_story: str | None
     newest_story: str | None
     index_type: str
+    embedding: EmbeddingStatus
+
+
+class IngestJobOut(BaseModel):
+    id: str
+    kind: str
+    status: str
+    days_done: int
+    days_total: int
+    checkpoint: str | None
+    attempts: int
+    error: str | None
+    # Running totals while the job runs, the final result once it succeeded.
+    result: dict | None
+    created_at: str
+    started_at: str | None
+    finished_at: str | None
 
 
-class IngestResponse(BaseModel):
-    stories_fetched: int
-    chunks_created: int
-    duration_seconds: float
-
-
-class PruneResponse(BaseModel):
-    stories_deleted: int
-    chunks_deleted: int
-    cutoff: str
-    retention_days: int
-    duration_seconds: float
-    quota_rows_deleted: int = 0
+class IngestJobsResponse(BaseModel):
+    jobs: list[IngestJobOut]
 
 
 class StoryChunk(BaseModel):
@@ -97,3 +139,73 @@ class StorySummary(BaseModel):
     slug: str
     title: str
     created_at: str
+
+
+class CapturedPlanOut(BaseModel):
+    query: str
+    reason: str
+    captured_at: str
+    observed_ms: float
+    execution_ms: float
+    planning_ms: float
+    expected_index: str
+    used_expected_index: bool
+    indexes: list[str]
+    seq_scans: list[str]
+    shared_hit_blocks: int
+    shared_read_blocks: int
+    buffer_hit_ratio: float | None
+    plan: dict | None = None
+
+
+class PlanSamplesResponse(BaseModel):
+    sample_rate: float
+    slow_query_ms: float
+    captured: int
+    missing_index: int
+    plans: list[CapturedPlanOut]
+
+
+class ProfileSummary(BaseModel):
+    id: str
+    method: str
+    path: str
+    status: int
+    reason: str
+    captured_at: str
+    duration_ms: float
+
+
+class LoopStallOut(BaseModel):
+    captured_at: str
+    lag_ms: float
+    stack: list[str]
+
+
+class ReplicaStatus(BaseModel):
+    name: str
+    healthy: bool
+    lag_seconds: float | None
+    latency_ms: float | None
+    last_error: str | None = None
+
+
+class IndexHealthOut(BaseModel):
+    measured_at: str
+    index_name: str
+    table_name: str
+    index_bytes: int
+    live_tuples: int
+    dead_tuples: int
+    recall: float | None
+    probe_p50_ms: float | None
+    probe_p99_ms: float | None
+    action: str | None
+    action_seconds: float | None
+
+
+class IndexHealthResponse(BaseModel):
+    # Latest measurement of every index still present.
+    indexes: list[IndexHealthOut]
+    # Recent rebuilds, deferrals and failures, newest first.
+    actions: list[IndexHealthOut]
@@ -0,0 +1,119 @@
+"""Admission control: bound how many searches run at once, and shed the excess early.
+
+Without a bound, a burst of searches queues on connection checkout and every
+route that needs the database, story pages included, waits behind it. Each
+AdmissionLimiter lets `concurrency` requests in, keeps at most `max_queue`
+waiting, and refuses a request up front (Overloaded) when the queue is full or
+its estimated wait, queue position times the recent mean service time divided
+by the concurrency, is over the deadline. A request that was queued but not
+admitted within the deadline is refused too. Callers answer Overloaded with
+503 and its retry_after.
+
+Searches call check() before taking from the caller's quota, so most sheds
+cost nothing, and acquire() only around the database work, after the
+embedding call and on a query cache miss; a search shed there is refunded.
+
+Per worker; depth and sheds are exported as hn_admission_queue_depth and
+hn_admission_shed_total.
+"""
+
+import asyncio
+import time
+
+from app.config import settings
+from app.database import FAST_POOL_SIZE, MAX_OVERFLOW, POOL_SIZE
+from app.services.metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_SHED
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"shed ({reason}); retry after {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Slot:
+    """An admitted request; release() exactly once, when its database work is done."""
+
+    def __init__(self, limiter: "AdmissionLimiter"):
+        self._limiter = limiter
+        self._start = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        # Idempotent: streamed responses release from more than one place.
+        if self._released:
+            return
+        self._released = True
+        self._limiter._release(time.monotonic() - self._start)
+
+
+class AdmissionLimiter:
+    def __init__(self, name: str, concurrency: int, max_queue: int, deadline_seconds: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.deadline = deadline_seconds
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._waiting = 0
+        self._running = 0
+        # Exponentially weighted mean time a slot is held.
+        self._service_seconds = 0.0
+
+    def estimated_wait(self) -> float:
+        """How long a request arriving now would wait for a slot."""
+        if not self._semaphore.locked():
+            return 0.0
+        return (self._waiting + 1) * self._service_seconds / self.concurrency
+
+    def _shed(self, reason: str, retry_after: float) -> Overloaded:
+        ADMISSION_SHED.labels(self.name, reason).inc()
+        return Overloaded(reason, max(retry_after, 1.0))
+
+    def check(self) -> None:
+        """Raise Overloaded if a request arriving now would be refused; costs nothing to call early."""
+        if not self._semaphore.locked():
+            return
+        if self._waiting >= self.max_queue:
+            raise self._shed("queue_full", self.estimated_wait())
+        if self.estimated_wait() > self.deadline:
+            raise self._shed("deadline", self.estimated_wait())
+
+    async def acquire(self) -> Slot:
+        if self._semaphore.locked():
+            self.check()
+            self._waiting += 1
+            ADMISSION_QUEUE_DEPTH.labels(self.name).inc()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.deadline)
+            except asyncio.TimeoutError:
+                raise self._shed("timeout", self.estimated_wait()) from None
+            finally:
+                self._waiting -= 1
+                ADMISSION_QUEUE_DEPTH.labels(self.name).dec()
+        else:
+            # A free slot: taken without suspending.
+            await self._semaphore.acquire()
+        self._running += 1
+        ADMISSION_IN_FLIGHT.labels(self.name).inc()
+        return Slot(self)
+
+    def _release(self, held_seconds: float) -> None:
+        self._running -= 1
+        ADMISSION_IN_FLIGHT.labels(self.name).dec()
+        self._service_seconds = 0.8 * self._service_seconds + 0.2 * held_seconds if self._service_seconds else held_seconds
+        self._semaphore.release()
+
+
+def _default_concurrency() -> int:
+    # Half of the worker's SQLAlchemy pool, so story pages always find a
+    # connection, plus the fast-path pool, which only serves hot queries.
+    return max(1, (POOL_SIZE + MAX_OVERFLOW) // 2 + FAST_POOL_SIZE)
+
+
+search_admission = AdmissionLimiter(
+    "search",
+    settings.search_max_concurrency or _default_concurrency(),
+    settings.search_max_queue,
+    settings.search_queue_deadline_ms / 1000,
+)
@@ -0,0 +1,65 @@
+"""Token-aware splitting of story text and comments, and token-budget batching.
+
+Lengths are counted with a tiktoken BPE encoding (chunk_tokenizer, cl100k_base
+by default: the one OpenAI's embedding models use). The vocabulary is read from
+TIKTOKEN_CACHE_DIR, which the Docker image fills at build time, so nothing is
+downloaded at runtime.
+
+A text longer than chunk_max_tokens becomes several overlapping windows of at
+most that many tokens, each starting chunk_overlap_tokens before the previous
+one ended, so a sentence cut at a boundary is whole in one of the two chunks.
+"""
+
+from functools import lru_cache
+
+import tiktoken
+
+from app.config import settings
+
+
+@lru_cache(maxsize=1)
+def _encoding() -> tiktoken.Encoding:
+    return tiktoken.get_encoding(settings.chunk_tokenizer)
+
+
+def count_tokens(text: str) -> int:
+    return len(_encoding().encode_ordinary(text))
+
+
+def split_text(text: str, max_tokens: int | None = None, overlap: int | None = None) -> list[str]:
+    """`text` as one or more windows of at most max_tokens tokens, overlapping by `overlap`."""
+    max_tokens = max_tokens or settings.chunk_max_tokens
+    overlap = settings.chunk_overlap_tokens if overlap is None else overlap
+    encoding = _encoding()
+    tokens = encoding.encode_ordinary(text)
+    if len(tokens) <= max_tokens:
+        return [text]
+    step = max(max_tokens - overlap, 1)
+    windows = []
+    for start in range(0, len(tokens), step):
+        # A window edge can fall inside a multi-byte character; drop the halves.
+        window = encoding.decode_bytes(tokens[start:start + max_tokens]).decode("utf-8", errors="ignore").strip()
+        if window:
+            windows.append(window)
+        if start + max_tokens >= len(tokens):
+            break
+    return windows
+
+
+def pack_batches(token_counts: list[int], max_tokens: int, max_items: int) -> list[list[int]]:
+    """Indexes of consecutive texts grouped so each batch stays within both limits.
+
+    A single text over max_tokens gets a batch of its own.
+    """
+    batches: list[list[int]] = []
+    current: list[int] = []
+    current_tokens = 0
+    for i, count in enumerate(token_counts):
+        if current and (current_tokens + count > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += count
+    if current:
+        batches.append(current)
+    return batches
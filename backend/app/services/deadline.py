@@ -0,0 +1,94 @@
+"""Per-request deadlines, and cancelling work whose client has gone away.
+
+A route opens `with deadline(seconds):`; every query fastpath.fetch runs under
+it gets SET LOCAL statement_timeout from the time left (set_config(...,
+true), the same thing), the query embedding call gets no more than that either,
+and once it has run out the next query is not even started: DeadlineExceeded.
+Postgres cancelling a query on statement_timeout surfaces as DeadlineExceeded
+too.
+
+cancel_on_disconnect(request, awaitable) runs the route's work as a task and
+cancels it if the client disconnects first. Cancelling an asyncpg query sends
+Postgres a cancel request and returns the connection to the pool; cancelling the
+embedding call closes its HTTP request. The route then raises ClientDisconnected,
+answered with 499 (nobody reads it).
+
+The deadline lives in a ContextVar, so tasks started inside the block, like the
+ones cancel_on_disconnect and hedged embedding calls create, inherit it.
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from fastapi import Request
+
+_expires: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before its work finished."""
+
+
+class ClientDisconnected(Exception):
+    """The client went away and the request's work was cancelled."""
+
+
+@contextmanager
+def deadline(seconds: float | None):
+    """Give the work inside the block `seconds` (None or 0: no deadline)."""
+    token = _expires.set(time.monotonic() + seconds if seconds else None)
+    try:
+        yield
+    finally:
+        _expires.reset(token)
+
+
+def expiry() -> float | None:
+    """The current deadline (time.monotonic()), to resume() it in a streamed response body."""
+    return _expires.get()
+
+
+def resume(at: float | None) -> None:
+    """Reinstate a deadline taken with expiry(), for work the route left running (a response stream)."""
+    _expires.set(at)
+
+
+def remaining() -> float | None:
+    """Seconds left, or None without a deadline. Negative once it has passed."""
+    at = _expires.get()
+    return None if at is None else at - time.monotonic()
+
+
+def statement_timeout_ms() -> int | None:
+    """statement_timeout for the next query, in milliseconds; raises DeadlineExceeded once none is left."""
+    left = remaining()
+    if left is None:
+        return None
+    if left <= 0:
+        raise DeadlineExceeded("deadline passed before the query started")
+    # 0 would mean no timeout at all.
+    return max(1, int(left * 1000))
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    # Once the body has been read, receive() only returns when the client goes.
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def cancel_on_disconnect(request: Request, awaitable):
+    """The awaitable's result, or ClientDisconnected after cancelling it if the client left first."""
+    work = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not work.done():
+            work.cancel()
+            await asyncio.gather(work, return_exceptions=True)
+    if work.cancelled():
+        raise ClientDisconnected
+    return work.result()
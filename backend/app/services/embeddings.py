@@ -1,23 +1,444 @@
-from openai import AsyncOpenAI
+"""Embedding providers.
+
+Everything that needs a vector goes through generate_embedding /
+generate_embeddings; which backend answers is chosen by
+settings.embedding_provider:
+
+    openai   the OpenAI embeddings API (default)
+    local    a model stored on disk, run in-process on CPU
+    hashing  deterministic feature hashing, for tests and benchmarks
+
+Vectors from different models are not comparable, so every provider has a
+model_id that is stored with each chunk (see vector_search.verify_corpus_model).
+
+generate_embedding, which every search waits on, also gets an adaptive
+timeout, an optional hedged second request and a circuit breaker (see
+app.services.resilience); embedding_status() reports them for /api/stats.
+"""
+
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+from openai import (
+    AsyncOpenAI,
+    BadRequestError,
+    DefaultAsyncHttpxClient,
+    OpenAIError,
+    RateLimitError,
+    UnprocessableEntityError,
+)
+
 from app.config import settings
+from app.services.chunker import count_tokens, pack_batches
+from app.services.metrics import (
+    EMBEDDING_BREAKER_OPEN,
+    EMBEDDING_HEDGES,
+    EMBEDDING_REJECTED,
+    EMBEDDING_SECONDS,
+    EMBEDDING_TEXTS,
+    httpx_event_hooks,
+    record_timing,
+)
+from app.services.deadline import DeadlineExceeded, remaining
+from app.services.resilience import CLOSED, OPEN, CircuitBreaker, LatencyWindow, hedged
+from app.utils.hash_embedding import hash_embedding
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingError(Exception):
+    """The embedding backend could not produce vectors."""
+
+
+class EmbeddingQuotaError(EmbeddingError):
+    """The embedding backend refused because a quota or rate limit ran out."""
+
+
+class EmbeddingInputRejected(EmbeddingError):
+    """The backend refused the input itself (a bad request, too many tokens); sending it again will not help."""
+
+
+class EmbeddingUnavailable(EmbeddingError):
+    """The circuit breaker is open: the backend kept failing and is not being called."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"embedding backend unavailable; next attempt in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class EmbeddingProvider(ABC):
+    model_id: str
+    dimensions: int
+
+    @abstractmethod
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        """Return one vector per input text, in input order."""
+
+    async def close(self) -> None:
+        pass
+
+
+class OpenAIProvider(EmbeddingProvider):
+    def __init__(self, model: str, dimensions: int):
+        self.model = model
+        self.model_id = f"openai:{model}"
+        self.dimensions = dimensions
+        self.client = AsyncOpenAI(
+            api_key=settings.openai_api_key,
+            base_url=settings.openai_base_url,
+            http_client=DefaultAsyncHttpxClient(event_hooks=httpx_event_hooks()),
+        )
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        try:
+            response = await self.client.embeddings.create(input=texts, model=self.model)
+        except RateLimitError as e:
+            raise EmbeddingQuotaError(str(e)) from e
+        except (BadRequestError, UnprocessableEntityError) as e:
+            raise EmbeddingInputRejected(str(e)) from e
+        except OpenAIError as e:
+            raise EmbeddingError(str(e)) from e
+        sorted_data = sorted(response.data, key=lambda x: x.index)
+        return [item.embedding for item in sorted_data]
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+class HashingProvider(EmbeddingProvider):
+    def __init__(self, dimensions: int):
+        self.model_id = f"hashing:{dimensions}"
+        self.dimensions = dimensions
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        return [hash_embedding(t, self.dimensions) for t in texts]
+
+
+def _load_sentence_transformer(path: Path, batch_size: int) -> Callable[[list[str]], np.ndarray]:
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError as e:
+        raise RuntimeError(
+            f"{path} is a sentence-transformers model; install sentence-transformers to use it"
+        ) from e
+    model = SentenceTransformer(str(path), device="cpu")
+
+    def encode(texts: list[str]) -> np.ndarray:
+        return model.encode(texts, batch_size=batch_size, normalize_embeddings=True, convert_to_numpy=True)
+
+    return encode
+
+
+def _load_onnx(path: Path, batch_size: int) -> Callable[[list[str]], np.ndarray]:
+    try:
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+    except ImportError as e:
+        raise RuntimeError(f"{path} is an ONNX model; install onnxruntime and tokenizers to use it") from e
+
+    tokenizer = Tokenizer.from_file(str(path / "tokenizer.json"))
+    tokenizer.enable_truncation(max_length=512)
+    tokenizer.enable_padding()
+    options = ort.SessionOptions()
+    # Parallelism comes from the thread pool, one batch per thread; letting each
+    # run also fan out over every core just makes the batches fight.
+    options.intra_op_num_threads = 1
+    session = ort.InferenceSession(str(path / "model.onnx"), options, providers=["CPUExecutionProvider"])
+    input_names = {i.name for i in session.get_inputs()}
+
+    def encode(texts: list[str]) -> np.ndarray:
+        out = []
+        for i in range(0, len(texts), batch_size):
+            encoded = tokenizer.encode_batch(texts[i : i + batch_size])
+            ids = np.array([e.ids for e in encoded], dtype=np.int64)
+            mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+            feeds = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in input_names:
+                feeds["token_type_ids"] = np.zeros_like(ids)
+            hidden = session.run(None, feeds)[0]
+            # Mean pooling over real tokens, then L2 normalise, as sentence-transformers does.
+            pooled = (hidden * mask[..., None]).sum(axis=1) / np.clip(mask.sum(axis=1, keepdims=True), 1, None)
+            out.append(pooled / np.linalg.norm(pooled, axis=1, keepdims=True))
+        return np.concatenate(out)
+
+    return encode
+
+
+class LocalProvider(EmbeddingProvider):
+    """Runs a model stored on disk, on CPU, off the event loop.
 
-client = AsyncOpenAI(api_key=settings.openai_api_key)
+    Accepts an ONNX export (a directory with model.onnx and tokenizer.json) or a
+    sentence-transformers model directory. Requests that arrive while the pool
+    is busy are coalesced into one batch, so a burst of searches costs a few
+    forward passes rather than one each.
+    """
+
+    def __init__(self, path: str, threads: int, batch_size: int, dimensions: int):
+        model_path = Path(path)
+        if (model_path / "model.onnx").exists():
+            self._encode = _load_onnx(model_path, batch_size)
+        else:
+            self._encode = _load_sentence_transformer(model_path, batch_size)
+        self.model_id = f"local:{model_path.name}"
+        self.dimensions = dimensions
+        self._batch_size = batch_size
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="embed")
+        self._slots = asyncio.Semaphore(threads)
+        self._queue: asyncio.Queue | None = None
+        self._batcher: asyncio.Task | None = None
+        self._inflight: set[asyncio.Task] = set()
+
+        probe = self._encode(["dimension probe"])
+        if probe.shape[1] != dimensions:
+            raise RuntimeError(
+                f"{self.model_id} produces {probe.shape[1]}-d vectors but embedding_dimensions is {dimensions}"
+            )
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        if self._batcher is None:
+            self._queue = asyncio.Queue()
+            self._batcher = asyncio.create_task(self._run_batches())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((texts, future))
+        return await future
+
+    async def _run_batches(self) -> None:
+        while True:
+            first = await self._queue.get()
+            # Wait for a free thread before draining, so everything that queued
+            # up meanwhile rides along in this batch.
+            await self._slots.acquire()
+            pending = [first]
+            count = len(first[0])
+            while count < self._batch_size and not self._queue.empty():
+                item = self._queue.get_nowait()
+                pending.append(item)
+                count += len(item[0])
+            task = asyncio.create_task(self._encode_batch(pending))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _encode_batch(self, pending: list[tuple[list[str], asyncio.Future]]) -> None:
+        texts = [t for item_texts, _ in pending for t in item_texts]
+        try:
+            vectors = await asyncio.get_running_loop().run_in_executor(self._executor, self._encode, texts)
+        except Exception as e:
+            logger.exception("local embedding batch of %d texts failed", len(texts))
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(EmbeddingError(str(e)))
+            return
+        finally:
+            self._slots.release()
+
+        offset = 0
+        for item_texts, future in pending:
+            if not future.done():
+                future.set_result(vectors[offset : offset + len(item_texts)].tolist())
+            offset += len(item_texts)
+
+    async def close(self) -> None:
+        if self._batcher is not None:
+            self._batcher.cancel()
+        self._executor.shutdown(wait=False)
+
+
+def create_provider(name: str) -> EmbeddingProvider:
+    if name == "openai":
+        return OpenAIProvider(settings.embedding_model, settings.embedding_dimensions)
+    if name == "local":
+        if not settings.embedding_local_model_path:
+            raise RuntimeError("embedding_provider=local needs embedding_local_model_path")
+        return LocalProvider(
+            settings.embedding_local_model_path,
+            threads=settings.embedding_local_threads,
+            batch_size=settings.embedding_local_batch_size,
+            dimensions=settings.embedding_dimensions,
+        )
+    if name == "hashing":
+        return HashingProvider(settings.embedding_dimensions)
+    raise ValueError(f"unknown embedding provider {name!r}")
+
+
+_provider: EmbeddingProvider | None = None
+
+
+def get_provider() -> EmbeddingProvider:
+    """The configured provider, created on first use (loading a local model is slow)."""
+    global _provider
+    if _provider is None:
+        _provider = create_provider(settings.embedding_provider)
+    return _provider
+
+
+def embedding_model_id() -> str:
+    """Model id of the configured provider, without loading it."""
+    if settings.embedding_provider == "openai":
+        return f"openai:{settings.embedding_model}"
+    if settings.embedding_provider == "local":
+        return f"local:{Path(settings.embedding_local_model_path or '').name}"
+    return f"hashing:{settings.embedding_dimensions}"
+
+
+async def close_provider() -> None:
+    global _provider
+    if _provider is not None:
+        await _provider.close()
+        _provider = None
+
+
+async def _embed(texts: list[str]) -> list[list[float]]:
+    provider = get_provider()
+    label = settings.embedding_provider
+    EMBEDDING_TEXTS.labels(label).inc(len(texts))
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        vectors = await provider.embed(texts)
+        outcome = "ok"
+        return vectors
+    except EmbeddingQuotaError:
+        outcome = "quota"
+        raise
+    except asyncio.CancelledError:
+        # Timed out, a losing hedge, or the client went away: not a provider error.
+        outcome = "cancelled"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        EMBEDDING_SECONDS.labels(label, outcome).observe(elapsed)
+        record_timing("embed", elapsed)
+
+
+_latency = LatencyWindow(settings.embedding_latency_window)
+_breaker = CircuitBreaker(settings.embedding_breaker_failures, settings.embedding_breaker_reset_seconds)
+
+
+def query_timeout() -> float:
+    """p99 of recent query embeddings times embedding_timeout_p99_multiplier, clamped to the min/max."""
+    p99 = _latency.quantile(0.99)
+    if p99 is None:
+        return settings.embedding_timeout_max_seconds
+    return min(max(p99 * settings.embedding_timeout_p99_multiplier, settings.embedding_timeout_min_seconds),
+               settings.embedding_timeout_max_seconds)
+
+
+def _hedge_delay() -> float | None:
+    return _latency.quantile(0.95) if settings.embedding_hedge else None
+
+
+def embedding_status() -> dict:
+    """This worker's breaker state and current timeout/hedge thresholds."""
+    hedge_after = _hedge_delay()
+    return {
+        "state": _breaker.state,
+        "retry_after_seconds": round(_breaker.retry_after(), 1),
+        "timeout_ms": round(query_timeout() * 1000, 1),
+        "hedge_after_ms": round(hedge_after * 1000, 1) if hedge_after is not None else None,
+    }
+
+
+def check_available() -> None:
+    """Raise EmbeddingUnavailable before anything is spent on a search that would be refused.
+
+    That is while the breaker is open, and while its half-open probe is out:
+    only the probe's own request should reach admission and the quota.
+    """
+    if not _breaker.would_allow():
+        raise EmbeddingUnavailable(_breaker.retry_after())
 
 
 async def generate_embedding(text: str) -> list[float]:
-    """Generate embedding for a single text."""
-    response = await client.embeddings.create(
-        input=text,
-        model=settings.embedding_model,
-    )
-    return response.data[0].embedding
+    """Generate embedding for a single text, within the adaptive timeout."""
+    if not _breaker.allow():
+        raise EmbeddingUnavailable(_breaker.retry_after())
+    attempts = 0
+
+    async def attempt() -> list[list[float]]:
+        nonlocal attempts
+        attempts += 1
+        if attempts == 2:
+            EMBEDDING_HEDGES.labels("sent").inc()
+        return await _embed([text])
+
+    timeout = query_timeout()
+    # The request's own deadline may leave less; running out of that is not the provider's fault.
+    left = remaining()
+    cut_by_deadline = left is not None and left < timeout
+    if cut_by_deadline:
+        timeout = max(left, 0.0)
+    start = time.perf_counter()
+    try:
+        vectors, from_hedge = await asyncio.wait_for(hedged(attempt, _hedge_delay()), timeout)
+    except asyncio.TimeoutError as e:
+        if cut_by_deadline:
+            _breaker.abandon()
+            raise DeadlineExceeded("deadline passed during the embedding call") from e
+        _failed()
+        raise EmbeddingError(f"no embedding within {timeout:.2f}s") from e
+    except EmbeddingError:
+        _failed()
+        raise
+    except asyncio.CancelledError:
+        # The caller went away; if this was the half-open probe, let another one through.
+        _breaker.abandon()
+        raise
+    _latency.add(time.perf_counter() - start)
+    if _breaker.state != CLOSED:
+        logger.info("embedding backend answered again; circuit closed")
+    _breaker.success()
+    EMBEDDING_BREAKER_OPEN.set(0)
+    if from_hedge:
+        EMBEDDING_HEDGES.labels("won").inc()
+    return vectors[0]
+
+
+def _failed() -> None:
+    was_open = _breaker.state != CLOSED
+    _breaker.failure()
+    if _breaker.state == OPEN:
+        EMBEDDING_BREAKER_OPEN.set(1)
+        if not was_open:
+            logger.warning("embedding backend failed %d times in a row; circuit open for %.0fs",
+                           settings.embedding_breaker_failures, settings.embedding_breaker_reset_seconds)
 
 
 async def generate_embeddings(texts: list[str]) -> list[list[float]]:
     """Generate embeddings for a batch of texts."""
-    response = await client.embeddings.create(
-        input=texts,
-        model=settings.embedding_model,
-    )
-    sorted_data = sorted(response.data, key=lambda x: x.index)
-    return [item.embedding for item in sorted_data]
+    return await _embed(texts)
+
+
+async def _embed_or_bisect(texts: list[str]) -> list[list[float] | None]:
+    # Only a rejected input is bisected. Anything else (quota, timeout, 5xx,
+    # outage) raises, so the ingest job fails and is retried instead of
+    # storing its stories without vectors.
+    try:
+        return await _embed(texts)
+    except EmbeddingInputRejected as e:
+        if len(texts) == 1:
+            EMBEDDING_REJECTED.labels(settings.embedding_provider).inc()
+            logger.warning("embedding rejected a %d-character text: %s", len(texts[0]), e)
+            return [None]
+    # Halve until the text the backend refuses is alone; the rest still get vectors.
+    middle = len(texts) // 2
+    return await _embed_or_bisect(texts[:middle]) + await _embed_or_bisect(texts[middle:])
+
+
+async def generate_embeddings_packed(texts: list[str]) -> list[list[float] | None]:
+    """Embed many texts in batches of at most embedding_batch_max_tokens tokens and
+    embedding_batch_size texts.
+
+    A batch the backend rejects as input is bisected, so one bad input costs
+    only its own vector: its slot is None. Any other error raises.
+    """
+    counts = [count_tokens(t) for t in texts]
+    vectors: list[list[float] | None] = []
+    for batch in pack_batches(counts, settings.embedding_batch_max_tokens, settings.embedding_batch_size):
+        vectors.extend(await _embed_or_bisect([texts[i] for i in batch]))
+    return vectors
@@ -0,0 +1,307 @@
+"""Direct asyncpg access for the hot read queries.
+
+Search, story load, related stories and the quota flush run through here.
+With db_fast_path on they go straight to an asyncpg pool and come back as
+records, skipping SQLAlchemy's session and text() compilation; otherwise
+they run on a session as before. Either way rows support attribute access,
+so callers do not care which path served them. Read-only statements are
+routed to a replica when app.database has a usable one, with a fast-path pool
+per replica opened on first use.
+
+Statements are written once with :name parameters, the same as text(), and
+rewritten to $n for asyncpg.
+
+Under a request deadline (app.services.deadline) each query runs in a
+transaction with statement_timeout set to the time left. A query cancelled
+by that timeout raises DeadlineExceeded; one whose caller was cancelled is
+cancelled on the server by asyncpg. Both are counted in
+hn_db_query_aborts_total, not as errors.
+
+Prepared statements: behind PgBouncer in transaction mode a named prepared
+statement can be executed on a different server connection than the one it
+was prepared on, which fails unless PgBouncer >= 1.21 has
+max_prepared_statements set and re-prepares it transparently. In "auto" mode
+the pool starts with asyncpg's named statement cache and probes it across
+several connections. If the probe or any later query reports a missing or
+duplicate statement, the pool is rebuilt with the cache off. That leaves
+asyncpg's protocol-level unnamed statements, which are safe behind any
+pooler, and is the same as the SQLAlchemy engine's statement_cache_size=0.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from contextlib import AsyncExitStack
+
+import asyncpg
+import numpy as np
+from pgvector.asyncpg import register_vector
+from sqlalchemy import text as sql_text
+from sqlalchemy.exc import DBAPIError
+
+from app.config import settings
+from app.database import FAST_POOL_SIZE, Replica, async_session, choose_replica, connect_args, db_url, replicas
+from app.services.deadline import DeadlineExceeded, statement_timeout_ms
+from app.services.metrics import DB_QUERY_ABORTS, DB_QUERY_SECONDS, record_timing, statement_label
+
+logger = logging.getLogger(__name__)
+
+_PARAM_RE = re.compile(r"(?<![:\w]):(\w+)")
+_STATEMENT_ERRORS = (asyncpg.exceptions.InvalidSQLStatementNameError, asyncpg.exceptions.DuplicatePreparedStatementError)
+
+
+class _Row(asyncpg.Record):
+    """asyncpg record with the attribute access SQLAlchemy rows have."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+_pool: asyncpg.Pool | None = None  # primary
+_replica_pools: dict[str, asyncpg.Pool] = {}
+_prepared = False
+_pool_lock = asyncio.Lock()
+_positional: dict[str, tuple[str, list[str]]] = {}
+
+
+def _to_positional(statement: str) -> tuple[str, list[str]]:
+    """':name' placeholders to '$n', remembering the parameter order."""
+    cached = _positional.get(statement)
+    if cached is None:
+        names: list[str] = []
+
+        def number(m: re.Match) -> str:
+            if m.group(1) not in names:
+                names.append(m.group(1))
+            return f"${names.index(m.group(1)) + 1}"
+
+        cached = _positional[statement] = (_PARAM_RE.sub(number, statement), names)
+    return cached
+
+
+def vector_text(value: np.ndarray) -> str:
+    """pgvector's text form, for vectors bound as text (e.g. inside a text[])."""
+    return "[" + ",".join(map(str, value.tolist())) + "]"
+
+
+def session_params(params: dict) -> dict:
+    """Vectors go to asyncpg as arrays (binary codec) but to SQLAlchemy as text."""
+    return {k: vector_text(v) if isinstance(v, np.ndarray) else v for k, v in params.items()}
+
+
+def enabled() -> bool:
+    return _pool is not None
+
+
+def mode() -> str:
+    """"session", "prepared" (named statement cache) or "unnamed"."""
+    if _pool is None:
+        return "session"
+    return "prepared" if _prepared else "unnamed"
+
+
+def _dsn(url: str) -> str:
+    return url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+async def _create_pool(prepared: bool, url: str = db_url, args: dict = connect_args) -> asyncpg.Pool:
+    return await asyncpg.create_pool(
+        _dsn(url),
+        min_size=min(2, FAST_POOL_SIZE),
+        max_size=FAST_POOL_SIZE,
+        ssl=args.get("ssl"),
+        statement_cache_size=settings.db_statement_cache_size if prepared else 0,
+        record_class=_Row,
+        init=register_vector,
+    )
+
+
+async def _pool_for(replica: Replica | None) -> asyncpg.Pool:
+    """The primary pool, or the replica's, opened on first use with the primary's statement mode."""
+    if replica is None:
+        return _pool
+    pool = _replica_pools.get(replica.name)
+    if pool is None:
+        async with _pool_lock:
+            pool = _replica_pools.get(replica.name)
+            if pool is None:
+                pool = _replica_pools[replica.name] = await _create_pool(_prepared, replica.url, replica.connect_args)
+    return pool
+
+
+async def _probe(pool: asyncpg.Pool) -> bool:
+    """Run one cached statement on several connections at once, twice over.
+
+    Behind a transaction pooler without prepared-statement support the second
+    round lands on server connections that never saw the statement.
+    """
+    try:
+        for _ in range(2):
+            await asyncio.gather(*(pool.fetchval("SELECT $1::int + 1", i) for i in range(pool.get_max_size())))
+        return True
+    except _STATEMENT_ERRORS as e:
+        logger.info("named prepared statements unavailable (%s); using unnamed statements", e)
+        return False
+
+
+async def start_fast_path(prepared: str | None = None) -> None:
+    """Open the pool if db_fast_path is on. `prepared` overrides db_prepared_statements."""
+    global _pool, _prepared
+    if not settings.db_fast_path or _pool is not None:
+        return
+    want = prepared or settings.db_prepared_statements
+    use_prepared = want != "off"
+    pool = await _create_pool(use_prepared)
+    if want == "auto" and not await _probe(pool):
+        await pool.close()
+        use_prepared = False
+        pool = await _create_pool(use_prepared)
+    _pool, _prepared = pool, use_prepared
+    logger.info("database fast path enabled (%s statements)", mode())
+
+
+async def stop_fast_path() -> None:
+    global _pool
+    pools = list(_replica_pools.values()) + ([_pool] if _pool is not None else [])
+    _pool = None
+    _replica_pools.clear()
+    for pool in pools:
+        await pool.close()
+
+
+async def prefill() -> None:
+    """Open every fast-path connection now (primary and replicas) instead of on first use."""
+    if _pool is None:
+        return
+    for pool in [_pool, *[await _pool_for(r) for r in replicas]]:
+        async with AsyncExitStack() as stack:
+            await asyncio.gather(*(
+                stack.enter_async_context(pool.acquire()) for _ in range(pool.get_max_size())
+            ))
+
+
+async def _downgrade(error: Exception) -> None:
+    """Rebuild the pools without the statement cache after a statement error."""
+    global _pool, _prepared
+    async with _pool_lock:
+        if not _prepared:
+            return
+        logger.warning("prepared statement error on the fast path (%s); switching to unnamed statements", error)
+        old = [_pool, *_replica_pools.values()]
+        _replica_pools.clear()
+        _pool, _prepared = await _create_pool(prepared=False), False
+    for pool in old:
+        await pool.close()
+
+
+def _local_settings(ef_search: str | None, timeout_ms: int | None) -> list[tuple[str, str]]:
+    """Settings for this query's transaction only (set_config(..., true))."""
+    local = []
+    if ef_search is not None:
+        local.append(("hnsw.ef_search", ef_search))
+    if timeout_ms is not None:
+        local.append(("statement_timeout", str(timeout_ms)))
+    return local
+
+
+def _set_config_sql(count: int, placeholder) -> str:
+    return "SELECT " + ", ".join(
+        f"set_config({placeholder(2 * i)}, {placeholder(2 * i + 1)}, true)" for i in range(count)
+    )
+
+
+async def _fetch_pool(statement: str, params: dict, local: list[tuple[str, str]], replica: Replica | None) -> list:
+    query, names = _to_positional(statement)
+    args = [params[n] for n in names]
+    for attempt in range(2):
+        pool = await _pool_for(replica)
+        try:
+            async with pool.acquire() as conn:
+                if not local:
+                    return await conn.fetch(query, *args)
+                async with conn.transaction():
+                    await conn.execute(
+                        _set_config_sql(len(local), lambda i: f"${i + 1}"), *(v for pair in local for v in pair)
+                    )
+                    return await conn.fetch(query, *args)
+        except _STATEMENT_ERRORS as e:
+            if attempt or not _prepared:
+                raise
+            await _downgrade(e)
+    raise AssertionError("unreachable")
+
+
+async def _fetch_session(statement: str, params: dict, local: list[tuple[str, str]], replica: Replica | None) -> list:
+    async with (replica.session if replica else async_session)() as session:
+        if local:
+            await session.execute(
+                sql_text(_set_config_sql(len(local), lambda i: f":s{i}")),
+                {f"s{i}": v for i, v in enumerate(v for pair in local for v in pair)},
+            )
+        result = await session.execute(sql_text(statement), session_params(params))
+        rows = result.fetchall() if result.returns_rows else []
+        await session.commit()
+        return rows
+
+
+def _statement_timed_out(error: Exception) -> bool:
+    if isinstance(error, DBAPIError):
+        error = error.orig.__cause__ or error.orig
+    return isinstance(error, asyncpg.exceptions.QueryCanceledError)
+
+
+async def fetch(
+    statement: str,
+    params: dict | None = None,
+    ef_search_floor: int | None = None,
+    read_only: bool = False,
+    ef_search: int | None = None,
+) -> list:
+    """Run `statement` and return all rows.
+
+    `ef_search_floor` applies hnsw.ef_search for this query the way
+    apply_ef_search does; `ef_search` replaces settings.hnsw_ef_search for it.
+    Vector parameters are passed as float32 ndarrays. `read_only` statements
+    may be served by a replica.
+    """
+    # Imported here: vector_search imports this module.
+    from app.services.vector_search import ef_search_value
+
+    params = params or {}
+    label = statement_label(statement)
+    try:
+        timeout_ms = statement_timeout_ms()
+    except DeadlineExceeded:
+        DB_QUERY_ABORTS.labels(label, "deadline").inc()
+        raise
+    replica = choose_replica() if read_only else None
+    ef = ef_search_value(ef_search_floor, ef_search) if ef_search_floor is not None else None
+    local = _local_settings(ef, timeout_ms)
+    start = time.perf_counter()
+    try:
+        if _pool is None:
+            return await _fetch_session(statement, params, local, replica)
+        try:
+            return await _fetch_pool(statement, params, local, replica)
+        finally:
+            # The SQLAlchemy engine events do not see these queries.
+            elapsed = time.perf_counter() - start
+            DB_QUERY_SECONDS.labels(label).observe(elapsed)
+            record_timing("db", elapsed)
+    except asyncio.CancelledError:
+        DB_QUERY_ABORTS.labels(label, "cancelled").inc()
+        raise
+    except Exception as e:
+        if timeout_ms is not None and _statement_timed_out(e):
+            DB_QUERY_ABORTS.labels(label, "deadline").inc()
+            raise DeadlineExceeded(f"statement_timeout ({timeout_ms}ms) cancelled {label}") from e
+        raise
+
+
+async def fetchval(statement: str, params: dict | None = None, read_only: bool = False):
+    rows = await fetch(statement, params, read_only=read_only)
+    return rows[0][0] if rows else None
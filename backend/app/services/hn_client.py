@@ -5,10 +5,9 @@ from dataclasses import dataclass
 
 import httpx
 
-logger = logging.getLogger(__name__)
+from app.config import settings
 
-HN_SEARCH_URL = "https://hn.algolia.com/api/v1/search_by_date"
-HN_ITEM_URL = "https://hn.algolia.com/api/v1/items"
+logger = logging.getLogger(__name__)
 
 # Limit concurrent comment fetches to avoid rate limiting
 _COMMENT_SEMAPHORE = asyncio.Semaphore(5)
@@ -51,7 +50,7 @@ async def fetch_story_ids_in_range(
             "hitsPerPage": 100,
             "page": page,
         }
-        response = await client.get(HN_SEARCH_URL, params=params)
+        response = await client.get(settings.hn_search_url, params=params)
         response.raise_for_status()
         data = response.json()
 
@@ -93,7 +92,7 @@ async def fetch_comments_for_story(
     """Fetch top-level comments for a story via Algolia items endpoint."""
     async with _COMMENT_SEMAPHORE:
         try:
-            response = await client.get(f"{HN_ITEM_URL}/{story_id}")
+            response = await client.get(f"{settings.hn_item_url}/{story_id}")
             response.raise_for_status()
             data = response.json()
 
@@ -0,0 +1,243 @@
+"""HNSW index health: track it per partition and rebuild degraded graphs.
+
+Run as the "index_maintenance" job, which the worker queues every
+index_check_interval_minutes. Each run, for every day partition's HNSW index:
+
+- records size, live and dead heap tuples, recall@k on a fixed probe set
+  (the first index_probe_count chunks of the partition by id, so the same
+  probes every run while the partition lives) against an exact scan, and the
+  per-probe search latency, into index_health;
+- flags the index when recall is under index_min_recall or dead tuples make up
+  more than index_max_dead_ratio of the heap;
+- inside index_maintenance_window (UTC) rebuilds flagged indexes with
+  REINDEX INDEX CONCURRENTLY, which builds a new graph next to the old one and
+  swaps it in without blocking searches.
+
+A rebuild is one statement and cannot be paused, so throttling happens between
+them: one index at a time, no parallel maintenance workers, at most
+index_max_rebuilds_per_run per run, and each only starts while the probe p99
+on the newest partition is within index_search_p99_budget_ms; otherwise it
+waits, and gives up when the window closes. Whatever was checked, rebuilt or
+deferred is the job's result and is kept in index_health for GET
+/api/admin/index-health.
+
+Statements run over migration_database_url when set, like the migration
+runner: a REINDEX CONCURRENTLY holds one server connection for minutes.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, time as dt_time, timezone
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+from app.database import _build_async_url
+from app.services.metrics import HNSW_INDEX_BYTES, HNSW_RECALL, INDEX_REBUILDS
+from app.services.vector_search import HNSW_INDEX
+
+logger = logging.getLogger(__name__)
+
+_INDEXES_SQL = """
+    SELECT idx.relname AS index_name, tbl.relname AS table_name,
+           pg_relation_size(idx.oid) AS index_bytes,
+           COALESCE(st.n_live_tup, 0) AS live_tuples,
+           COALESCE(st.n_dead_tup, 0) AS dead_tuples
+    FROM pg_class idx
+    JOIN pg_index ix ON ix.indexrelid = idx.oid
+    JOIN pg_class tbl ON tbl.oid = ix.indrelid
+    LEFT JOIN pg_stat_user_tables st ON st.relid = tbl.oid
+    WHERE idx.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(:index))
+       OR (idx.oid = to_regclass(:index) AND idx.relkind = 'i')
+    ORDER BY tbl.relname
+"""
+
+
+@dataclass
+class IndexCheck:
+    index_name: str
+    table_name: str
+    index_bytes: int
+    live_tuples: int
+    dead_tuples: int
+    recall: float | None = None
+    probe_p50_ms: float | None = None
+    probe_p99_ms: float | None = None
+
+    @property
+    def dead_ratio(self) -> float:
+        total = self.live_tuples + self.dead_tuples
+        return self.dead_tuples / total if total else 0.0
+
+    def problem(self) -> str | None:
+        if self.recall is not None and self.recall < settings.index_min_recall:
+            return f"recall {self.recall:.3f} < {settings.index_min_recall}"
+        if self.dead_ratio > settings.index_max_dead_ratio:
+            return f"dead tuples {self.dead_ratio:.1%} > {settings.index_max_dead_ratio:.0%}"
+        return None
+
+
+def in_window(now: datetime, window: str) -> bool:
+    """Whether `now` (UTC) falls in "HH:MM-HH:MM"; the window may wrap midnight."""
+    start, end = (dt_time.fromisoformat(t.strip()) for t in window.split("-"))
+    current = now.astimezone(timezone.utc).time()
+    return start <= current < end if start <= end else current >= start or current < end
+
+
+async def _probe(conn: AsyncConnection, check: IndexCheck) -> None:
+    """Recall@k and per-query latency of the index on the partition's fixed probes."""
+    k = settings.index_probe_k
+    if check.live_tuples <= k:
+        return
+    table = check.table_name
+    probes = (await conn.execute(
+        text(f"SELECT id FROM {table} ORDER BY id LIMIT :n"), {"n": settings.index_probe_count}
+    )).scalars().all()
+    query = text(f"""
+        SELECT c.id FROM {table} c, (SELECT embedding FROM {table} WHERE id = :probe) p
+        ORDER BY c.embedding <=> p.embedding LIMIT :k
+    """)
+
+    latencies, hits, approx = [], 0, {}
+    # Same ef_search as production searches, for this transaction only.
+    if settings.hnsw_ef_search is not None:
+        await conn.execute(text("SELECT set_config('hnsw.ef_search', :ef, true)"),
+                           {"ef": str(max(settings.hnsw_ef_search, k))})
+    for probe in probes:
+        start = time.perf_counter()
+        approx[probe] = set((await conn.execute(query, {"probe": probe, "k": k})).scalars())
+        latencies.append((time.perf_counter() - start) * 1000)
+    await conn.commit()
+    # Same query without the index: an exact scan of this one partition.
+    await conn.execute(text("SET LOCAL enable_indexscan = off"))
+    for probe in probes:
+        exact = set((await conn.execute(query, {"probe": probe, "k": k})).scalars())
+        hits += len(exact & approx[probe])
+    await conn.commit()
+
+    check.recall = round(hits / (len(probes) * k), 4)
+    check.probe_p50_ms = round(float(np.percentile(latencies, 50)), 2)
+    check.probe_p99_ms = round(float(np.percentile(latencies, 99)), 2)
+
+
+async def check_indexes(conn: AsyncConnection, index_name: str | None = None) -> list[IndexCheck]:
+    """Size, dead tuples and probe recall/latency for every partition's index, or only `index_name`."""
+    rows = (await conn.execute(text(_INDEXES_SQL), {"index": HNSW_INDEX})).fetchall()
+    await conn.commit()
+    checks = [IndexCheck(**row._mapping) for row in rows]
+    if index_name is not None:
+        checks = [c for c in checks if c.index_name == index_name]
+    for check in checks:
+        await _probe(conn, check)
+        HNSW_INDEX_BYTES.labels(check.index_name).set(check.index_bytes)
+        if check.recall is not None:
+            HNSW_RECALL.labels(check.index_name).set(check.recall)
+    return checks
+
+
+async def _record(conn: AsyncConnection, check: IndexCheck, action: str | None, action_seconds: float | None) -> None:
+    await conn.execute(text("""
+        INSERT INTO index_health (measured_at, index_name, table_name, index_bytes, live_tuples,
+                                  dead_tuples, recall, probe_p50_ms, probe_p99_ms, action, action_seconds)
+        VALUES (now(), :index_name, :table_name, :index_bytes, :live_tuples, :dead_tuples,
+                :recall, :probe_p50_ms, :probe_p99_ms, :action, :action_seconds)
+    """), {**asdict(check), "action": action, "action_seconds": action_seconds})
+
+
+async def _wait_for_headroom(conn: AsyncConnection, newest: IndexCheck | None) -> bool:
+    """Wait until probe p99 on the newest partition is within budget; False once the window closes."""
+    if newest is None:
+        return True
+    while in_window(datetime.now(timezone.utc), settings.index_maintenance_window):
+        await _probe(conn, newest)
+        if newest.probe_p99_ms is None or newest.probe_p99_ms <= settings.index_search_p99_budget_ms:
+            return True
+        logger.info("search p99 %.1fms over budget; delaying rebuild", newest.probe_p99_ms)
+        await asyncio.sleep(settings.index_throttle_wait_seconds)
+    return False
+
+
+async def _reindex(conn: AsyncConnection, check: IndexCheck) -> float:
+    # A cancelled REINDEX CONCURRENTLY leaves an invalid <index>_ccnew behind.
+    leftovers = (await conn.execute(text(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE i.indrelid = to_regclass(:table) AND NOT i.indisvalid AND c.relname LIKE :pattern"
+    ), {"table": check.table_name, "pattern": f"{check.index_name}_ccnew%"})).scalars().all()
+    for name in leftovers:
+        await conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+    start = time.perf_counter()
+    await conn.execute(text(f"REINDEX INDEX CONCURRENTLY {check.index_name}"))
+    return time.perf_counter() - start
+
+
+async def run_maintenance() -> dict:
+    """One health check, and rebuilds if due and inside the window. Returns the report."""
+    url, connect_args = _build_async_url(settings.migration_database_url or settings.database_url)
+    maintenance_engine = create_async_engine(url, poolclass=NullPool, connect_args=connect_args)
+    report = {"checked": 0, "flagged": [], "rebuilt": [], "deferred": [], "window": settings.index_maintenance_window}
+    try:
+        async with maintenance_engine.connect() as conn, maintenance_engine.connect() as ddl:
+            # CONCURRENTLY cannot run in a transaction block.
+            ddl = await ddl.execution_options(isolation_level="AUTOCOMMIT")
+            await ddl.execute(text("SET max_parallel_maintenance_workers = 0"))
+            checks = await check_indexes(conn)
+            report["checked"] = len(checks)
+            flagged = sorted(
+                ((c, c.problem()) for c in checks if c.problem()),
+                key=lambda item: (item[0].recall if item[0].recall is not None else 1.0, -item[0].dead_ratio),
+            )
+            report["flagged"] = [{"index": c.index_name, "reason": reason} for c, reason in flagged]
+
+            actions: dict[str, tuple[str, float | None]] = {}
+            in_progress = in_window(datetime.now(timezone.utc), settings.index_maintenance_window)
+            # Latency reference for throttling: the newest partition with data.
+            newest = next((c for c in reversed(checks) if c.probe_p99_ms is not None), None)
+            for i, (check, reason) in enumerate(flagged):
+                if not in_progress or i >= settings.index_max_rebuilds_per_run:
+                    why = "outside window" if not in_progress else "rebuild limit reached"
+                    report["deferred"].append({"index": check.index_name, "reason": why})
+                    actions[check.index_name] = (f"deferred: {why}", None)
+                    continue
+                if not await _wait_for_headroom(conn, newest):
+                    in_progress = False
+                    report["deferred"].append({"index": check.index_name, "reason": "window closed"})
+                    actions[check.index_name] = ("deferred: window closed", None)
+                    continue
+                before = {"recall": check.recall, "index_bytes": check.index_bytes}
+                try:
+                    seconds = await _reindex(ddl, check)
+                except Exception as e:
+                    INDEX_REBUILDS.labels("failed").inc()
+                    logger.warning("REINDEX of %s failed: %s", check.index_name, e)
+                    actions[check.index_name] = (f"failed: {e}", None)
+                    report["deferred"].append({"index": check.index_name, "reason": f"failed: {e}"})
+                    continue
+                INDEX_REBUILDS.labels("rebuilt").inc()
+                # Only the rebuilt index is probed again: each probe includes an
+                # exact scan, and searches are running meanwhile.
+                after, = await check_indexes(conn, check.index_name)
+                logger.info("rebuilt %s in %.1fs (%s): recall %s -> %s, %d -> %d bytes",
+                            check.index_name, seconds, reason, check.recall, after.recall,
+                            check.index_bytes, after.index_bytes)
+                report["rebuilt"].append({
+                    "index": check.index_name,
+                    "reason": reason,
+                    "seconds": round(seconds, 1),
+                    "before": before,
+                    "after": {"recall": after.recall, "index_bytes": after.index_bytes},
+                })
+                actions[check.index_name] = ("reindex", round(seconds, 1))
+                checks[checks.index(check)] = after
+
+            for check in checks:
+                action, seconds = actions.get(check.index_name, (None, None))
+                await _record(conn, check, action, seconds)
+            await conn.commit()
+    finally:
+        await maintenance_engine.dispose()
+    return report
@@ -3,12 +3,13 @@ import html
 import re
 import logging
 import time
+from collections.abc import Awaitable, Callable
 from datetime import datetime, timezone, timedelta
 
 import httpx
-from sqlalchemy import select, delete, func
+from sqlalchemy import select
 
-from app.database import async_session
+from app.database import async_session, engine, note_write
 from app.models import Story, Chunk, generate_slug
 from app.services.hn_client import (
     fetch_story_ids_in_range,
@@ -16,13 +17,21 @@ from app.services.hn_client import (
     fetch_comments_for_story,
     HNStory,
 )
-from app.services.embeddings import generate_embeddings
+from app.services.chunker import split_text
+from app.services.embeddings import embedding_model_id, generate_embeddings_packed
+from app.services.metrics import INGEST_ITEMS, INGEST_STAGE_SECONDS, httpx_event_hooks
+from app.services.partitions import drop_day, ensure_partitions, partition_days
+from app.services.query_cache import bump_corpus_generation
+from app.services.vector_search import ensure_corpus_model, story_vector, verify_corpus_model
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
 _HTML_TAG_RE = re.compile(r"<[^>]+>")
 
+# Stages reported in each ingest result's "stage_seconds", in pipeline order.
+INGEST_STAGES = ("fetch_stories", "fetch_comments", "embed", "store")
+
 
 def _strip_html(text: str) -> str:
     clean = _HTML_TAG_RE.sub(" ", text)
@@ -31,7 +40,10 @@ def _strip_html(text: str) -> str:
 
 
 def _create_chunks_for_story(story: HNStory) -> list[dict]:
-    """Create chunk dicts (content, chunk_type, author) for a story."""
+    """Create chunk dicts (content, chunk_type, author) for a story.
+
+    Long story text and comments become several chunks of the same type.
+    """
     chunks = []
 
     # Title + URL chunk
@@ -48,21 +60,23 @@ def _create_chunks_for_story(story: HNStory) -> list[dict]:
     if story.story_text and story.story_text.strip():
         clean_text = _strip_html(story.story_text)
         if clean_text:
-            chunks.append({
-                "content": clean_text,
-                "chunk_type": "story_text",
-                "author": None,
-            })
+            for window in split_text(clean_text):
+                chunks.append({
+                    "content": window,
+                    "chunk_type": "story_text",
+                    "author": None,
+                })
 
     # Comment chunks
     for comment in story.comments:
         clean_text = _strip_html(comment.text)
         if clean_text and len(clean_text) > 10:
-            chunks.append({
-                "content": clean_text,
-                "chunk_type": "comment",
-                "author": comment.author,
-            })
+            for window in split_text(clean_text):
+                chunks.append({
+                    "content": window,
+                    "chunk_type": "comment",
+                    "author": comment.author,
+                })
 
     return chunks
 
@@ -79,21 +93,30 @@ async def _get_existing_hn_ids(hn_ids: list[int]) -> set[int]:
 
 
 async def ingest_one_day(day_start: datetime, day_end: datetime) -> dict:
-    """Ingest stories for a single day. Returns counts."""
+    """Ingest stories for a single day. Returns counts and seconds spent per stage."""
     start_time = time.time()
+    stages = dict.fromkeys(INGEST_STAGES, 0.0)
+
+    # Never add vectors from one model to a corpus built with another.
+    model_id = embedding_model_id()
+    async with async_session() as session:
+        await verify_corpus_model(session)
+    ensure_corpus_model(model_id)
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with httpx.AsyncClient(timeout=30.0, event_hooks=httpx_event_hooks()) as client:
         # 1. Fetch story metadata (fast, no comments)
+        stage_start = time.time()
         hits = await fetch_story_ids_in_range(
             client,
             start_timestamp=int(day_start.timestamp()),
             end_timestamp=int(day_end.timestamp()),
             min_score=settings.hn_min_score,
         )
+        stages["fetch_stories"] = time.time() - stage_start
         logger.info(f"Day {day_start.date()}: found {len(hits)} stories from API")
 
         if not hits:
-            return {"stories_fetched": 0, "chunks_created": 0}
+            return {"stories_fetched": 0, "chunks_created": 0, "stage_seconds": stages}
 
         # 2. Parse stories and filter out existing ones
         parsed = [parse_story_from_hit(h) for h in hits]
@@ -104,9 +127,10 @@ async def ingest_one_day(day_start: datetime, day_end: datetime) -> dict:
         logger.info(f"Day {day_start.date()}: {len(new_stories)} new stories (skipping {len(existing_ids)} existing)")
 
         if not new_stories:
-            return {"stories_fetched": 0, "chunks_created": 0}
+            return {"stories_fetched": 0, "chunks_created": 0, "stage_seconds": stages}
 
         # 3. Fetch comments concurrently (only for new stories)
+        stage_start = time.time()
         comment_tasks = [
             fetch_comments_for_story(client, s.hn_id, settings.hn_max_comments_per_story)
             for s in new_stories
@@ -114,10 +138,18 @@ async def ingest_one_day(day_start: datetime, day_end: datetime) -> dict:
         all_comments = await asyncio.gather(*comment_tasks)
         for story, comments in zip(new_stories, all_comments):
             story.comments = comments
+        stages["fetch_comments"] = time.time() - stage_start
 
     # 4. Store stories and generate embeddings
     stories_created = 0
     chunks_created = 0
+    stage_start = time.time()
+
+    # Normally created ahead by the worker; a backfill reaches further back.
+    story_days = [s.created_at.astimezone(timezone.utc).date() for s in new_stories]
+    async with engine.connect() as conn:
+        await ensure_partitions(conn, min(story_days), max(story_days))
+        await conn.commit()
 
     async with async_session() as session:
         for story in new_stories:
@@ -133,54 +165,78 @@ async def ingest_one_day(day_start: datetime, day_end: datetime) -> dict:
                 created_at=story.created_at,
                 slug=generate_slug(story.title, story.hn_id),
             )
+
+            chunk_defs = _create_chunks_for_story(story)
+            # Batched by token count; a text the API refuses comes back as None
+            # and is skipped rather than failing the story.
+            embed_start = time.time()
+            embeddings = await generate_embeddings_packed([c["content"] for c in chunk_defs])
+            stages["embed"] += time.time() - embed_start
+            # Set before the insert, so the story row is written once.
+            vectors = [e for e in embeddings if e is not None]
+            if vectors:
+                db_story.embedding = story_vector(vectors)
             session.add(db_story)
             await session.flush()
 
-            chunk_defs = _create_chunks_for_story(story)
-            if not chunk_defs:
-                continue
-
-            # Generate embeddings in batches
-            texts = [c["content"] for c in chunk_defs]
-            all_embeddings: list[list[float]] = []
-            batch_size = settings.embedding_batch_size
-            for i in range(0, len(texts), batch_size):
-                batch = texts[i : i + batch_size]
-                embeddings = await generate_embeddings(batch)
-                all_embeddings.extend(embeddings)
-
-            for idx, chunk_def in enumerate(chunk_defs):
+            stored = 0
+            for chunk_def, embedding in zip(chunk_defs, embeddings):
+                if embedding is None:
+                    continue
                 db_chunk = Chunk(
                     story_id=db_story.id,
+                    story_created_at=db_story.created_at,
                     content=chunk_def["content"],
                     chunk_type=chunk_def["chunk_type"],
                     author=chunk_def["author"],
-                    embedding=all_embeddings[idx],
+                    embedding=embedding,
+                    embedding_model=model_id,
                 )
                 session.add(db_chunk)
+                stored += 1
 
             stories_created += 1
-            chunks_created += len(chunk_defs)
+            chunks_created += stored
 
             if stories_created % 25 == 0:
                 await session.commit()
                 logger.info(f"Day {day_start.date()}: committed {stories_created} stories, {chunks_created} chunks")
 
+        if stories_created:
+            await bump_corpus_generation(session)
         await session.commit()
+    await note_write()
+
+    # Everything in step 4 that was not waiting on the embedding API is DB work.
+    stages["store"] = time.time() - stage_start - stages["embed"]
+    for stage, seconds in stages.items():
+        INGEST_STAGE_SECONDS.labels(stage).inc(seconds)
+    INGEST_ITEMS.labels("stories").inc(stories_created)
+    INGEST_ITEMS.labels("chunks").inc(chunks_created)
 
     duration = time.time() - start_time
     logger.info(f"Day {day_start.date()}: done — {stories_created} stories, {chunks_created} chunks in {duration:.1f}s")
-    return {"stories_fetched": stories_created, "chunks_created": chunks_created}
+    return {"stories_fetched": stories_created, "chunks_created": chunks_created, "stage_seconds": stages}
 
 
-async def ingest_initial():
-    """Fetch 30 days of stories, one day at a time."""
+async def ingest_initial(
+    start_dt: datetime | None = None,
+    end_dt: datetime | None = None,
+    on_day: Callable[[datetime, dict], Awaitable[None]] | None = None,
+):
+    """Fetch hn_days_to_keep days of stories, one day at a time, newest first.
+
+    A resumed backfill passes its checkpoint as `end_dt`. `on_day(day_start,
+    result)` is awaited after each finished day, which is where the job worker
+    records its checkpoint.
+    """
     total_stories = 0
     total_chunks = 0
+    stages = dict.fromkeys(INGEST_STAGES, 0.0)
     start_time = time.time()
 
-    end_dt = datetime.now(timezone.utc)
-    start_dt = end_dt - timedelta(days=settings.hn_days_to_keep)
+    end_dt = end_dt or datetime.now(timezone.utc)
+    start_dt = start_dt or end_dt - timedelta(days=settings.hn_days_to_keep)
 
     # Process day by day (most recent first)
     current = end_dt
@@ -191,6 +247,10 @@ async def ingest_initial():
         result = await ingest_one_day(day_start, day_end)
         total_stories += result["stories_fetched"]
         total_chunks += result["chunks_created"]
+        for stage, seconds in result["stage_seconds"].items():
+            stages[stage] += seconds
+        if on_day is not None:
+            await on_day(day_start, result)
 
         current = day_start
 
@@ -200,56 +260,80 @@ async def ingest_initial():
         "stories_fetched": total_stories,
         "chunks_created": total_chunks,
         "duration_seconds": round(duration, 2),
+        "stage_seconds": {k: round(v, 2) for k, v in stages.items()},
     }
 
 
-async def ingest_daily():
-    """Fetch last 24 hours of stories. Retention is handled by prune_old_stories."""
-    end_dt = datetime.now(timezone.utc)
-    start_dt = end_dt - timedelta(hours=25)  # 25h overlap for safety
+async def ingest_daily(start_dt: datetime | None = None, end_dt: datetime | None = None):
+    """Fetch the last 24 hours of stories. Retention is handled by prune_old_stories."""
+    start = time.monotonic()
+    end_dt = end_dt or datetime.now(timezone.utc)
+    start_dt = start_dt or end_dt - timedelta(hours=25)  # 25h overlap for safety
 
     result = await ingest_one_day(start_dt, end_dt)
 
     return {
         "stories_fetched": result["stories_fetched"],
         "chunks_created": result["chunks_created"],
-        "duration_seconds": 0,
+        "duration_seconds": round(time.monotonic() - start, 2),
     }
 
 
 async def prune_old_stories() -> dict:
-    """Delete stories outside the retention window so the database stays bounded.
+    """Drop the day partitions outside the retention window, and create upcoming ones.
 
-    Chunks are removed by the stories.id ON DELETE CASCADE, which keeps this a
-    single statement instead of loading rows into the session.
+    Whole days go at once (DETACH + DROP, see app.services.partitions), so
+    there is no DELETE to wait for and nothing left behind for vacuum. A day
+    is dropped once all of it is older than the cutoff, so up to one extra day
+    is kept.
     """
     start = time.monotonic()
-    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.hn_days_to_keep)
-
-    async with async_session() as session:
-        chunks_to_delete = await session.scalar(
-            select(func.count())
-            .select_from(Chunk)
-            .join(Story, Story.id == Chunk.story_id)
-            .where(Story.created_at < cutoff)
-        )
-        result = await session.execute(
-            delete(Story).where(Story.created_at < cutoff),
-            execution_options={"synchronize_session": False},
-        )
-        await session.commit()
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(days=settings.hn_days_to_keep)
+    stories_deleted = chunks_deleted = dropped = 0
+    skipped: list[str] = []
+
+    try:
+        async with engine.connect() as conn:
+            expired = [d for d in await partition_days(conn) if d < cutoff.date()]
+            await conn.commit()
+            # One short transaction per day, so a lock timeout costs one day's
+            # drop (retried tomorrow) and never holds up searches for long.
+            for day in expired:
+                try:
+                    counts = await drop_day(conn, day)
+                    await bump_corpus_generation(conn)
+                    await conn.commit()
+                except Exception as e:
+                    await conn.rollback()
+                    logger.warning("could not drop partitions for %s, retrying next prune: %s", day, e)
+                    skipped.append(day.isoformat())
+                    continue
+                dropped += 1
+                stories_deleted += counts["stories"]
+                chunks_deleted += counts["chunks"]
+            today = now.date()
+            await ensure_partitions(conn, today, today + timedelta(days=settings.partition_days_ahead))
+            await conn.commit()
+    finally:
+        # Some days may have been dropped even if a later step failed.
+        await note_write()
 
     duration = time.monotonic() - start
     logger.info(
-        "Pruned %s stories / %s chunks older than %s (%.2fs)",
-        result.rowcount,
-        chunks_to_delete,
-        cutoff.isoformat(),
+        "Pruned %s stories / %s chunks in %d partitions older than %s (%d skipped, %.2fs)",
+        stories_deleted,
+        chunks_deleted,
+        dropped,
+        cutoff.date().isoformat(),
+        len(skipped),
         duration,
     )
     return {
-        "stories_deleted": result.rowcount,
-        "chunks_deleted": chunks_to_delete or 0,
+        "stories_deleted": stories_deleted,
+        "chunks_deleted": chunks_deleted,
+        "partitions_dropped": dropped,
+        "partitions_skipped": skipped,
         "cutoff": cutoff.isoformat(),
         "retention_days": settings.hn_days_to_keep,
         "duration_seconds": round(duration, 2),
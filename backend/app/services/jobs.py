@@ -0,0 +1,188 @@
+"""Durable ingest and prune jobs, queued in the ingest_jobs table.
+
+The API only enqueues; `python -m app.worker` claims and runs them, so a long
+backfill neither shares the API's event loop nor dies with an API pod. Any
+number of workers can poll the same table: a claim is one UPDATE over a
+FOR UPDATE SKIP LOCKED subselect, so two workers never get the same row and
+neither waits on the other's lock.
+
+A running job is owned by the worker named in `worker` for as long as it
+keeps heartbeat_at fresh. Once the heartbeat is older than job_stale_seconds
+(the worker was killed, its node went away) the job is claimed again, and a
+backfill resumes from its last per-day checkpoint. Every write from the
+running side is conditioned on still being the owner, so a worker that was
+merely slow finds out it lost the job instead of clobbering the new owner's
+progress. Polling rather than LISTEN/NOTIFY, because notifications do not
+make it through PgBouncer in transaction mode.
+"""
+
+import json
+import logging
+import math
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import async_session
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("initial", "daily", "prune", "index_maintenance")
+
+_COLUMNS = """
+    id, kind, status, window_start, window_end, checkpoint, days_total, days_done,
+    result, error, attempts, worker, run_after, created_at, started_at, heartbeat_at, finished_at
+"""
+
+_ENQUEUE_SQL = f"""
+    INSERT INTO ingest_jobs (id, kind, status, window_start, window_end, days_total, days_done,
+                             attempts, run_after, created_at)
+    VALUES (:id, :kind, 'queued', :window_start, :window_end, :days_total, 0, 0, now(), now())
+    ON CONFLICT (kind) WHERE status IN ('queued', 'running') DO NOTHING
+    RETURNING {_COLUMNS}
+"""
+
+_CLAIM_SQL = f"""
+    UPDATE ingest_jobs
+    SET status = 'running', worker = :worker, attempts = attempts + 1,
+        started_at = COALESCE(started_at, now()), heartbeat_at = now(), error = NULL
+    WHERE id = (
+        SELECT id FROM ingest_jobs
+        WHERE (status = 'queued' AND run_after <= now())
+           OR (status = 'running' AND heartbeat_at < now() - make_interval(secs => :stale))
+        ORDER BY created_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING {_COLUMNS}
+"""
+
+
+def _window(kind: str) -> tuple[datetime | None, datetime | None, int]:
+    """(window_start, window_end, days) fixed at enqueue, so a retry covers the same range."""
+    now = datetime.now(timezone.utc)
+    if kind == "initial":
+        return now - timedelta(days=settings.hn_days_to_keep), now, settings.hn_days_to_keep
+    if kind == "daily":
+        # 25h overlap for safety; already-stored stories are skipped.
+        return now - timedelta(hours=25), now, 1
+    return None, None, 0
+
+
+async def enqueue(kind: str) -> tuple[object, bool]:
+    """Queue a job of `kind`, or return the one already queued or running.
+
+    Returns (job row, created).
+    """
+    window_start, window_end, days = _window(kind)
+    async with async_session() as session:
+        row = (await session.execute(text(_ENQUEUE_SQL), {
+            "id": uuid.uuid4(),
+            "kind": kind,
+            "window_start": window_start,
+            "window_end": window_end,
+            "days_total": days,
+        })).first()
+        created = row is not None
+        if not created:
+            row = (await session.execute(
+                text(f"SELECT {_COLUMNS} FROM ingest_jobs WHERE kind = :kind AND status IN ('queued', 'running')"),
+                {"kind": kind},
+            )).first()
+        await session.commit()
+    if created:
+        logger.info("queued %s job %s", kind, row.id)
+    return row, created
+
+
+async def claim(worker: str):
+    """Take the oldest runnable job, or a running one whose worker stopped heartbeating."""
+    async with async_session() as session:
+        row = (await session.execute(
+            text(_CLAIM_SQL), {"worker": worker, "stale": float(settings.job_stale_seconds)}
+        )).first()
+        await session.commit()
+    return row
+
+
+async def _update_owned(job_id, worker: str, assignments: str, params: dict | None = None) -> bool:
+    """Apply `assignments` if `worker` still owns the running job; False if it lost it."""
+    async with async_session() as session:
+        row = (await session.execute(
+            text(f"UPDATE ingest_jobs SET {assignments} "
+                 "WHERE id = :id AND worker = :worker AND status = 'running' RETURNING id"),
+            {"id": job_id, "worker": worker, **(params or {})},
+        )).first()
+        await session.commit()
+    return row is not None
+
+
+# Recorded with every update that follows a job's writes, so API processes
+# (database.check_replicas) keep reads off replicas that have not replayed them.
+_WRITE_LSN = "write_lsn = (pg_current_wal_lsn() - '0/0'::pg_lsn)::bigint"
+
+
+async def heartbeat(job_id, worker: str) -> bool:
+    return await _update_owned(job_id, worker, "heartbeat_at = now()")
+
+
+async def save_checkpoint(job_id, worker: str, checkpoint: datetime, days_done: int, totals: dict) -> bool:
+    return await _update_owned(
+        job_id, worker,
+        "checkpoint = :checkpoint, days_done = :days_done, result = CAST(:result AS jsonb), heartbeat_at = now(), "
+        + _WRITE_LSN,
+        {"checkpoint": checkpoint, "days_done": days_done, "result": json.dumps(totals)},
+    )
+
+
+async def finish(job_id, worker: str, result: dict) -> bool:
+    return await _update_owned(
+        job_id, worker,
+        "status = 'succeeded', result = CAST(:result AS jsonb), finished_at = now(), " + _WRITE_LSN,
+        {"result": json.dumps(result)},
+    )
+
+
+async def fail(job_id, worker: str, error: str, attempts: int) -> bool:
+    """Requeue with exponential backoff, or mark failed after job_max_attempts."""
+    if attempts < settings.job_max_attempts:
+        delay = settings.job_retry_base_seconds * math.pow(2, attempts - 1)
+        return await _update_owned(
+            job_id, worker,
+            "status = 'queued', worker = NULL, error = :error, run_after = now() + make_interval(secs => :delay), "
+            + _WRITE_LSN,
+            {"error": error, "delay": float(delay)},
+        )
+    return await _update_owned(
+        job_id, worker, "status = 'failed', error = :error, finished_at = now(), " + _WRITE_LSN, {"error": error}
+    )
+
+
+async def release(job_id, worker: str) -> bool:
+    """Hand a job back on shutdown without counting the interrupted attempt."""
+    return await _update_owned(
+        job_id, worker, "status = 'queued', worker = NULL, attempts = attempts - 1, run_after = now(), " + _WRITE_LSN
+    )
+
+
+async def get_job(job_id):
+    async with async_session() as session:
+        return (await session.execute(
+            text(f"SELECT {_COLUMNS} FROM ingest_jobs WHERE id = :id"), {"id": job_id}
+        )).first()
+
+
+async def recent_jobs(limit: int = 20) -> list:
+    async with async_session() as session:
+        return (await session.execute(
+            text(f"SELECT {_COLUMNS} FROM ingest_jobs ORDER BY created_at DESC LIMIT :limit"), {"limit": limit}
+        )).fetchall()
+
+
+async def last_created(kind: str) -> datetime | None:
+    async with async_session() as session:
+        return (await session.execute(
+            text("SELECT MAX(created_at) FROM ingest_jobs WHERE kind = :kind"), {"kind": kind}
+        )).scalar()
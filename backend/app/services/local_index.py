@@ -0,0 +1,352 @@
+"""In-process vector search over a memory-mapped snapshot of the embeddings.
+
+With search_backend = "local", search_hn and find_related_stories are answered
+inside the API process instead of by the HNSW indexes: an exact scan of every
+chunk vector, in blocks of local_index_block_rows rows, each block one NumPy
+matrix-vector product and an argpartition for its top k. Only the winners go
+to Postgres, as a primary-key fetch of their chunk and story rows, which also
+computes their exact similarity. The database then does no vector work.
+
+The snapshot is a directory under local_index_dir per corpus generation
+(app.services.query_cache bumps it on every ingest and prune):
+
+    vectors.f16     N x D float16, L2-normalised, row-major (np.memmap)
+    chunk_ids.npy   N x 16 uint8, chunks.id
+    story_ids.npy   N x 16 uint8, chunks.story_id
+    story_days.npy  N int64, chunks.story_created_at in microseconds (partition key)
+    is_title.npy    N bool, chunk_type = 'title' (related stories)
+    meta.json       rows, dimensions, model, generation
+
+All workers of a pod map the same files, so the page cache holds one copy.
+Whichever worker first sees a new generation exports it under an flock; the
+others wait for it and map the result. Until a snapshot of the current
+generation is loaded, the previous one keeps serving, and until there is one
+at all, searches go to Postgres.
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import select
+
+from app.config import settings
+from app.database import choose_replica, engine
+from app.models import Chunk
+from app.services import fastpath
+from app.services.embeddings import embedding_model_id
+from app.services.metrics import LOCAL_INDEX_ROWS, LOCAL_INDEX_SECONDS
+from app.services.vector_search import HNSearchResult, SearchPerformance, search_result
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_EXPORT_BATCH = 5000
+
+# The chunk and story rows for the winners, with their exact similarity.
+HYDRATE_SQL = """
+    SELECT
+        s.title AS story_title,
+        s.slug AS story_slug,
+        s.url AS story_url,
+        s.author AS story_author,
+        s.score AS story_score,
+        s.hn_id AS story_hn_id,
+        c.content AS matched_content,
+        c.chunk_type,
+        c.author AS comment_author,
+        1 - (c.embedding <=> :query_vec) AS similarity_score,
+        s.created_at AS story_date
+    FROM unnest(CAST(:chunk_ids AS uuid[]), CAST(:story_days AS timestamptz[])) AS k(id, story_created_at)
+    JOIN chunks c ON c.id = k.id AND c.story_created_at = k.story_created_at
+    JOIN stories s ON s.id = c.story_id AND s.created_at = c.story_created_at
+    WHERE 1 - (c.embedding <=> :query_vec) > :threshold
+    ORDER BY c.embedding <=> :query_vec
+"""
+
+# Scored against the story's exact title vector, as RELATED_SQL does.
+HYDRATE_RELATED_SQL = """
+    SELECT s.slug, s.title, s.author, s.score, s.created_at,
+           1 - (c.embedding <=> ref.embedding) AS similarity_score
+    FROM unnest(CAST(:chunk_ids AS uuid[]), CAST(:story_days AS timestamptz[])) AS k(id, story_created_at)
+    JOIN chunks c ON c.id = k.id AND c.story_created_at = k.story_created_at
+    JOIN stories s ON s.id = c.story_id AND s.created_at = c.story_created_at
+    CROSS JOIN (
+        SELECT embedding FROM chunks
+        WHERE story_id = :story_id AND chunk_type = 'title'
+        LIMIT 1
+    ) ref
+    WHERE 1 - (c.embedding <=> ref.embedding) > 0.3
+    ORDER BY c.embedding <=> ref.embedding
+"""
+
+
+@dataclass
+class Snapshot:
+    generation: int
+    path: Path
+    vectors: np.ndarray
+    chunk_ids: np.ndarray
+    story_ids: np.ndarray
+    story_days: np.ndarray
+    is_title: np.ndarray
+    titles: int
+
+    @property
+    def rows(self) -> int:
+        return self.vectors.shape[0]
+
+
+_snapshot: Snapshot | None = None
+_refresher: asyncio.Task | None = None
+
+
+def active() -> bool:
+    """Whether searches should use the local snapshot right now."""
+    return settings.search_backend == "local" and _snapshot is not None
+
+
+def rows() -> int:
+    return _snapshot.rows if _snapshot is not None else 0
+
+
+def _root() -> Path:
+    return Path(settings.local_index_dir)
+
+
+def _micros(value: datetime) -> int:
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+def _from_micros(value: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=int(value))
+
+
+# --- Export and load ------------------------------------------------------------
+
+
+async def _export(target: Path, generation: int, model: str) -> None:
+    """Write a snapshot of the chunks embedded by `model` into `target`."""
+    target.mkdir(parents=True)
+    chunk_ids, story_ids, story_days, is_title = [], [], [], []
+    rows = 0
+    dimensions = settings.embedding_dimensions
+    stmt = (
+        select(Chunk.id, Chunk.story_id, Chunk.story_created_at, Chunk.chunk_type, Chunk.embedding)
+        .where(Chunk.embedding_model == model)
+    )
+    # A server-side cursor, from a replica when there is one; minutes at most.
+    replica = choose_replica()
+    source = replica.engine if replica else engine
+    with open(target / "vectors.f16", "wb") as out:
+        async with source.connect() as conn:
+            result = await conn.stream(stmt.execution_options(yield_per=_EXPORT_BATCH))
+            async for batch in result.partitions(_EXPORT_BATCH):
+                block = np.asarray([row.embedding for row in batch], dtype=np.float32)
+                norms = np.linalg.norm(block, axis=1, keepdims=True)
+                block /= np.where(norms == 0, 1, norms)
+                out.write(block.astype(np.float16).tobytes())
+                chunk_ids.extend(row.id.bytes for row in batch)
+                story_ids.extend(row.story_id.bytes for row in batch)
+                story_days.extend(_micros(row.story_created_at) for row in batch)
+                is_title.extend(row.chunk_type == "title" for row in batch)
+                rows += len(batch)
+
+    def as_bytes(values: list[bytes]) -> np.ndarray:
+        return np.frombuffer(b"".join(values), dtype=np.uint8).reshape(rows, 16)
+
+    np.save(target / "chunk_ids.npy", as_bytes(chunk_ids))
+    np.save(target / "story_ids.npy", as_bytes(story_ids))
+    np.save(target / "story_days.npy", np.asarray(story_days, dtype=np.int64))
+    np.save(target / "is_title.npy", np.asarray(is_title, dtype=bool))
+    # Written last: a directory without meta.json is an unfinished export.
+    (target / "meta.json").write_text(json.dumps(
+        {"rows": rows, "dimensions": dimensions, "model": model, "generation": generation}
+    ))
+
+
+def _load(path: Path) -> Snapshot:
+    meta = json.loads((path / "meta.json").read_text())
+    shape = (meta["rows"], meta["dimensions"])
+    vectors = (
+        np.memmap(path / "vectors.f16", dtype=np.float16, mode="r", shape=shape)
+        if meta["rows"] else np.zeros(shape, dtype=np.float16)
+    )
+    is_title = np.load(path / "is_title.npy", mmap_mode="r")
+    return Snapshot(
+        generation=meta["generation"],
+        path=path,
+        vectors=vectors,
+        chunk_ids=np.load(path / "chunk_ids.npy", mmap_mode="r"),
+        story_ids=np.load(path / "story_ids.npy", mmap_mode="r"),
+        story_days=np.load(path / "story_days.npy", mmap_mode="r"),
+        is_title=is_title,
+        titles=int(np.count_nonzero(is_title)),
+    )
+
+
+def _usable(path: Path, model: str) -> bool:
+    try:
+        return json.loads((path / "meta.json").read_text())["model"] == model
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+async def refresh() -> None:
+    """Load the snapshot of the current corpus generation, exporting it first if no worker has."""
+    global _snapshot
+    generation = await fastpath.fetchval("SELECT generation FROM corpus_generation", read_only=True)
+    if generation is None or (_snapshot is not None and _snapshot.generation == generation):
+        return
+    model = embedding_model_id()
+    root = _root()
+    root.mkdir(parents=True, exist_ok=True)
+    path = root / f"g{generation}"
+
+    if not _usable(path, model):
+        with open(root / ".lock", "w") as lock:
+            # Blocks while another worker exports; it will usually have done this one.
+            await asyncio.to_thread(fcntl.flock, lock, fcntl.LOCK_EX)
+            try:
+                if not _usable(path, model):
+                    start = time.perf_counter()
+                    shutil.rmtree(path, ignore_errors=True)
+                    staging = root / f".g{generation}-{os.getpid()}"
+                    shutil.rmtree(staging, ignore_errors=True)
+                    await _export(staging, generation, model)
+                    staging.rename(path)
+                    LOCAL_INDEX_SECONDS.observe(time.perf_counter() - start)
+                    logger.info("exported vector snapshot g%s in %.1fs", generation, time.perf_counter() - start)
+                # Older generations; workers still mapping them keep their pages.
+                for old in root.iterdir():
+                    if old != path and old.name != ".lock":
+                        shutil.rmtree(old, ignore_errors=True)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    _snapshot = _load(path)
+    LOCAL_INDEX_ROWS.set(_snapshot.rows)
+    logger.info("serving searches from vector snapshot g%s (%d rows)", generation, _snapshot.rows)
+
+
+async def _run_refresher() -> None:
+    while True:
+        try:
+            await refresh()
+        except Exception:
+            logger.exception("vector snapshot refresh failed; still serving g%s",
+                             _snapshot.generation if _snapshot else None)
+        await asyncio.sleep(settings.local_index_refresh_seconds)
+
+
+def start_local_index() -> None:
+    """Export or load the snapshot in the background; Postgres serves until it is ready."""
+    global _refresher
+    if settings.search_backend == "local" and _refresher is None:
+        _refresher = asyncio.create_task(_run_refresher())
+
+
+async def stop_local_index() -> None:
+    global _refresher
+    if _refresher is not None:
+        _refresher.cancel()
+        try:
+            await _refresher
+        except asyncio.CancelledError:
+            pass
+        _refresher = None
+
+
+# --- Search ---------------------------------------------------------------------
+
+
+def _top_k(snapshot: Snapshot, query: np.ndarray, k: int, mask=None) -> np.ndarray:
+    """Row numbers of the k best-scoring rows, best first. `mask(start, end)` marks rows to skip."""
+    best_rows = np.empty(0, dtype=np.int64)
+    best_scores = np.empty(0, dtype=np.float32)
+    block_rows = settings.local_index_block_rows
+    for start in range(0, snapshot.rows, block_rows):
+        end = min(start + block_rows, snapshot.rows)
+        scores = snapshot.vectors[start:end].astype(np.float32) @ query
+        if mask is not None:
+            scores[mask(start, end)] = -np.inf
+        if len(scores) > k:
+            keep = np.argpartition(scores, -k)[-k:]
+        else:
+            keep = np.arange(len(scores))
+        best_rows = np.concatenate([best_rows, keep + start])
+        best_scores = np.concatenate([best_scores, scores[keep]])
+        if len(best_scores) > k:
+            keep = np.argpartition(best_scores, -k)[-k:]
+            best_rows, best_scores = best_rows[keep], best_scores[keep]
+    order = np.argsort(best_scores)[::-1]
+    return best_rows[order][np.isfinite(best_scores[order])]
+
+
+def _normalise(vector) -> np.ndarray:
+    query = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(query)
+    return query / norm if norm else query
+
+
+def _keys(snapshot: Snapshot, rows: np.ndarray) -> dict:
+    return {
+        "chunk_ids": [uuid.UUID(bytes=snapshot.chunk_ids[r].tobytes()) for r in rows],
+        "story_days": [_from_micros(snapshot.story_days[r]) for r in rows],
+    }
+
+
+async def search(
+    query_embedding: list[float], top_k: int, threshold: float
+) -> tuple[list[HNSearchResult], SearchPerformance]:
+    """search_hn against the snapshot: exact top_k, then a primary-key fetch."""
+    snapshot = _snapshot
+    start = time.time()
+    # In a thread: NumPy releases the GIL for the products, so the event loop
+    # keeps serving while a scan runs.
+    winners = await asyncio.to_thread(_top_k, snapshot, _normalise(query_embedding), top_k)
+    params = {
+        **_keys(snapshot, winners),
+        "query_vec": np.asarray(query_embedding, dtype=np.float32),
+        "threshold": threshold,
+    }
+    hydrated = await fastpath.fetch(HYDRATE_SQL, params, read_only=True)
+    query_time = (time.time() - start) * 1000
+    perf = SearchPerformance(query_time_ms=round(query_time, 2), chunks_searched=snapshot.rows, index_type="local-f16")
+    return [search_result(row) for row in hydrated], perf
+
+
+async def related(story_id, limit: int) -> tuple[list, float, int] | None:
+    """find_related_stories against the snapshot; None when the story is not in it."""
+    snapshot = _snapshot
+    start = time.time()
+    story_id = uuid.UUID(str(story_id))
+    target = np.frombuffer(story_id.bytes, dtype=np.uint8)
+
+    def nearest_titles():
+        own = np.flatnonzero((snapshot.story_ids == target).all(axis=1) & snapshot.is_title)
+        if not len(own):
+            return None
+        # Ranked by the float16 copy; similarities come from Postgres.
+        reference = snapshot.vectors[own[0]].astype(np.float32)
+
+        def skip(lo: int, hi: int) -> np.ndarray:
+            return ~snapshot.is_title[lo:hi] | (snapshot.story_ids[lo:hi] == target).all(axis=1)
+
+        return _top_k(snapshot, reference, limit, mask=skip)
+
+    winners = await asyncio.to_thread(nearest_titles)
+    if winners is None:
+        return None
+    params = {**_keys(snapshot, winners), "story_id": story_id}
+    hydrated = await fastpath.fetch(HYDRATE_RELATED_SQL, params, read_only=True)
+    return hydrated, (time.time() - start) * 1000, snapshot.titles
@@ -0,0 +1,275 @@
+"""Prometheus metrics and the per-request Server-Timing breakdown.
+
+Timings are collected where the work happens — SQLAlchemy engine and pool
+events, httpx event hooks, the embedding facade — rather than by timers
+scattered around call sites. Anything timed as "db" or "embed" is also added
+to the current request's Server-Timing header.
+"""
+
+import os
+import re
+import time
+from contextvars import ContextVar
+
+import httpx
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, multiprocess, start_http_server
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+_FAST = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "hn_http_request_seconds", "Request latency by route", ["method", "route", "status"], buckets=_FAST
+)
+EMBEDDING_SECONDS = Histogram(
+    "hn_embedding_seconds", "Embedding calls by provider and outcome", ["provider", "outcome"], buckets=_FAST
+)
+EMBEDDING_TEXTS = Counter("hn_embedding_texts_total", "Texts sent for embedding", ["provider"])
+EMBEDDING_REJECTED = Counter(
+    "hn_embedding_rejected_total", "Texts the embedding backend refused, isolated by bisecting their batch", ["provider"]
+)
+EMBEDDING_HEDGES = Counter(
+    "hn_embedding_hedges_total", "Hedged query embedding requests sent, and those that answered first", ["result"]
+)
+EMBEDDING_BREAKER_OPEN = Gauge(
+    "hn_embedding_breaker_open", "1 while the embedding circuit breaker is open", multiprocess_mode="livemax"
+)
+DB_QUERY_SECONDS = Histogram(
+    "hn_db_query_seconds", "Statement execution time, by statement shape", ["statement"], buckets=_FAST
+)
+DB_QUERY_ABORTS = Counter(
+    "hn_db_query_aborts_total", "Hot-path queries cut short: request deadline passed or caller cancelled",
+    ["statement", "reason"],
+)
+REQUEST_ABORTS = Counter(
+    "hn_request_aborts_total", "Requests ended early because the client disconnected or the deadline passed",
+    ["route", "reason"],
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "hn_db_pool_checkout_seconds", "Time spent waiting for a pooled connection", ["pool"], buckets=_FAST
+)
+# multiprocess_mode only matters with several workers (see start_metrics_server).
+DB_POOL_IN_USE = Gauge(
+    "hn_db_pool_in_use", "Pooled connections checked out", ["pool"], multiprocess_mode="livesum"
+)
+DB_POOL_SATURATION = Gauge(
+    "hn_db_pool_saturation", "Checked-out connections / pool_size + max_overflow", ["pool"],
+    multiprocess_mode="livemax",
+)
+DB_READ_ROUTE = Counter("hn_db_read_route_total", "Read-only queries by target replica", ["target"])
+REPLICA_LAG_SECONDS = Gauge(
+    "hn_replica_lag_seconds", "Replay lag per read replica", ["replica"], multiprocess_mode="livemax"
+)
+REPLICA_HEALTHY = Gauge(
+    "hn_replica_healthy", "1 while a replica is in read rotation", ["replica"], multiprocess_mode="livemin"
+)
+HTTP_CLIENT_SECONDS = Histogram(
+    "hn_http_client_seconds", "Outbound HTTP requests", ["host", "status"], buckets=_FAST
+)
+CACHE_REQUESTS = Counter("hn_cache_requests_total", "Cache lookups", ["cache", "result"])
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "hn_admission_queue_depth", "Requests waiting for an admission slot", ["endpoint"], multiprocess_mode="livesum"
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "hn_admission_in_flight", "Requests holding an admission slot", ["endpoint"], multiprocess_mode="livesum"
+)
+ADMISSION_SHED = Counter(
+    "hn_admission_shed_total", "Requests refused by admission control", ["endpoint", "reason"]
+)
+RATE_LIMIT_DECISIONS = Counter("hn_rate_limit_decisions_total", "Search quota decisions", ["decision"])
+INGEST_STAGE_SECONDS = Counter("hn_ingest_stage_seconds_total", "Seconds spent per ingest stage", ["stage"])
+INGEST_ITEMS = Counter("hn_ingest_items_total", "Stories and chunks written by ingest", ["kind"])
+INGEST_JOBS = Counter("hn_ingest_jobs_total", "Ingest/prune jobs finished by the worker", ["kind", "outcome"])
+SEARCH_STREAM_SECONDS = Histogram(
+    "hn_search_stream_seconds", "Streamed search: time to first results and to the final frame", ["stage"],
+    buckets=_FAST,
+)
+QUERY_CACHE_HIT_SIMILARITY = Histogram(
+    "hn_query_cache_hit_similarity", "Cosine similarity between a query and the cached search that answered it",
+    buckets=(0.9, 0.95, 0.97, 0.98, 0.99, 0.995, 0.999, 1.0),
+)
+QUERY_CACHE_ENTRIES = Gauge(
+    "hn_query_cache_entries", "Searches held in the semantic query cache", multiprocess_mode="livesum"
+)
+LOCAL_INDEX_ROWS = Gauge(
+    "hn_local_index_rows", "Chunks in the loaded local vector snapshot", multiprocess_mode="max"
+)
+LOCAL_INDEX_SECONDS = Histogram(
+    "hn_local_index_export_seconds", "Time to export a local vector snapshot",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600),
+)
+LOOP_LAG_SECONDS = Histogram(
+    "hn_event_loop_lag_seconds", "How late the loop monitor's heartbeat woke up", buckets=_FAST
+)
+LOOP_STALLS = Counter("hn_event_loop_stalls_total", "Loop stalls over loop_stall_threshold_ms")
+# Set by the job worker's index_maintenance runs; served on worker_metrics_port.
+HNSW_RECALL = Gauge(
+    "hn_hnsw_recall", "Recall@k on the fixed probe set, per HNSW index", ["index"], multiprocess_mode="mostrecent"
+)
+HNSW_INDEX_BYTES = Gauge(
+    "hn_hnsw_index_bytes", "HNSW index size, per partition index", ["index"], multiprocess_mode="mostrecent"
+)
+INDEX_REBUILDS = Counter("hn_hnsw_rebuilds_total", "REINDEX CONCURRENTLY runs by outcome", ["outcome"])
+PLAN_SAMPLES = Counter(
+    "hn_plan_samples_total", "Sampled query plans by whether they used the expected index", ["query", "result"]
+)
+
+
+# --- Scrape endpoint -----------------------------------------------------------
+# Served by prometheus_client's own HTTP server on settings.metrics_port, not as
+# a route of the app: the ingress sends the app's port to the internet, and
+# these series name replicas, pools and queues.
+#
+# With WEB_CONCURRENCY > 1 each uvicorn worker has its own registry.
+# PROMETHEUS_MULTIPROC_DIR (set by docker-entrypoint.sh) makes prometheus_client
+# keep values in files there; the endpoint aggregates all workers' files, so
+# whichever worker binds the port first serves the whole pod.
+
+_metrics_server = None
+
+
+def start_metrics_server(port: int) -> None:
+    global _metrics_server
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    try:
+        _metrics_server, _ = start_http_server(port, registry=registry)
+    except OSError:
+        pass  # another worker of this pod holds the port and serves the aggregate
+
+
+def stop_metrics_server() -> None:
+    global _metrics_server
+    if _metrics_server is not None:
+        _metrics_server.shutdown()
+        _metrics_server.server_close()
+        _metrics_server = None
+
+
+def mark_worker_exit() -> None:
+    """Drop this worker's live gauges from the aggregate on shutdown."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+# --- Server-Timing -----------------------------------------------------------
+
+_request_timings: ContextVar[dict[str, float] | None] = ContextVar("request_timings", default=None)
+
+
+def start_request_timings() -> dict[str, float]:
+    """Begin collecting timings for the current request; returns the live dict."""
+    timings: dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def record_timing(name: str, seconds: float) -> None:
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def format_server_timing(timings: dict[str, float], total: float) -> str:
+    """embed/db as measured, render as whatever is left of the request."""
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    render = max(0.0, total - sum(timings.values()))
+    parts.append(f"render;dur={render * 1000:.1f}")
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+# --- SQLAlchemy ----------------------------------------------------------------
+
+_VERB_RE = re.compile(r"^\s*(\w+)")
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN)\s+([a-z_][a-z0-9_]*)", re.IGNORECASE)
+_statement_labels: dict[str, str] = {}
+
+
+def statement_label(statement: str) -> str:
+    """Low-cardinality label for a SQL statement, e.g. "select_chunks_ann"."""
+    label = _statement_labels.get(statement)
+    if label is None:
+        verb = _VERB_RE.match(statement)
+        table = _TABLE_RE.search(statement)
+        label = f"{verb.group(1).lower() if verb else 'other'}_{table.group(1).lower() if table else 'none'}"
+        if "<=>" in statement:
+            label += "_ann"
+        if len(_statement_labels) < 1000:
+            _statement_labels[statement] = label
+    return label
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """The default asyncpg pool, timing how long checkouts wait for a connection."""
+
+    metrics_name = "primary"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.labels(self.metrics_name).observe(time.perf_counter() - start)
+
+
+def instrument_engine(engine: AsyncEngine, capacity: int, pool: str = "primary") -> None:
+    """Time every statement and track pool usage through engine/pool events."""
+    sync_engine = engine.sync_engine
+    sync_engine.pool.metrics_name = pool
+    in_use_gauge = DB_POOL_IN_USE.labels(pool)
+    saturation_gauge = DB_POOL_SATURATION.labels(pool)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        DB_QUERY_SECONDS.labels(statement_label(statement)).observe(elapsed)
+        record_timing("db", elapsed)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+    in_use = 0
+
+    @event.listens_for(sync_engine.pool, "checkout")
+    def _checkout(dbapi_conn, record, proxy):
+        nonlocal in_use
+        in_use += 1
+        in_use_gauge.set(in_use)
+        saturation_gauge.set(in_use / capacity)
+
+    @event.listens_for(sync_engine.pool, "checkin")
+    def _checkin(dbapi_conn, record):
+        nonlocal in_use
+        in_use = max(0, in_use - 1)
+        in_use_gauge.set(in_use)
+        saturation_gauge.set(in_use / capacity)
+
+
+# --- httpx -----------------------------------------------------------------------
+
+async def _on_request(request: httpx.Request) -> None:
+    request.extensions["metrics_start"] = time.perf_counter()
+
+
+async def _on_response(response: httpx.Response) -> None:
+    start = response.request.extensions.get("metrics_start")
+    if start is not None:
+        HTTP_CLIENT_SECONDS.labels(response.request.url.host, str(response.status_code)).observe(
+            time.perf_counter() - start
+        )
+
+
+def httpx_event_hooks() -> dict:
+    """Event hooks for any outbound httpx client (HN API, OpenAI)."""
+    return {"request": [_on_request], "response": [_on_response]}
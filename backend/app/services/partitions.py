@@ -0,0 +1,117 @@
+"""Daily range partitions of stories and chunks.
+
+Both tables are partitioned by the story's UTC day (stories.created_at,
+chunks.story_created_at), one partition per day, named stories_pYYYYMMDD and
+chunks_pYYYYMMDD. Indexes are declared on the parent tables, so every new
+partition gets its own HNSW indexes; those are renamed to
+idx_chunks_embedding_hnsw_pYYYYMMDD and idx_stories_embedding_hnsw_pYYYYMMDD
+so plans and pg_prewarm can find them.
+
+Retention drops whole partitions instead of deleting rows: no long-running
+DELETE, no dead tuples in the heap or the HNSW graph, nothing for vacuum to
+catch up on. Creating, detaching and dropping a partition each take a brief
+ACCESS EXCLUSIVE lock on the parent, which queues behind running searches and
+queues new ones behind itself, so all of it runs under a short lock_timeout,
+and partitions are created ahead of time by the worker rather than on demand.
+
+Chunk partitions are dropped before their story partition, since chunks
+reference stories.
+"""
+
+import logging
+import re
+from datetime import date, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.config import settings
+from app.services.vector_search import HNSW_INDEX, STORY_HNSW_INDEX
+
+logger = logging.getLogger(__name__)
+
+TABLES = ("stories", "chunks")
+_SUFFIX_RE = re.compile(r"_p(\d{8})$")
+
+
+def partition_name(table: str, day: date) -> str:
+    return f"{table}_p{day:%Y%m%d}"
+
+
+async def _lock_timeout(conn: AsyncConnection) -> None:
+    await conn.execute(text("SELECT set_config('lock_timeout', :timeout, true)"),
+                       {"timeout": f"{settings.partition_lock_timeout_ms}ms"})
+
+
+async def partition_days(conn: AsyncConnection, table: str = "stories") -> list[date]:
+    """Days that have a partition of `table`, oldest first."""
+    rows = (await conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table)"
+    ), {"table": table})).scalars()
+    days = []
+    for name in rows:
+        m = _SUFFIX_RE.search(name)
+        if m:
+            days.append(date(int(m[1][:4]), int(m[1][4:6]), int(m[1][6:])))
+    return sorted(days)
+
+
+async def ensure_partitions(conn: AsyncConnection, first: date, last: date) -> list[date]:
+    """Create the missing day partitions from `first` to `last` inclusive; returns the days created.
+
+    Runs in the caller's transaction, which should commit promptly.
+    """
+    created: list[date] = []
+    await _lock_timeout(conn)
+    for table in TABLES:
+        have = set(await partition_days(conn, table))
+        day = first
+        while day <= last:
+            if day not in have:
+                # Bounds in UTC, whatever the session's TimeZone.
+                await conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {partition_name(table, day)} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{day} 00:00:00+00') TO ('{day + timedelta(days=1)} 00:00:00+00')"
+                ))
+                if table == TABLES[0]:
+                    created.append(day)
+            day += timedelta(days=1)
+    if created:
+        await name_hnsw_partitions(conn)
+        logger.info("created partitions for %s .. %s", created[0], created[-1])
+    return created
+
+
+async def name_hnsw_partitions(conn: AsyncConnection) -> None:
+    """Rename the per-partition HNSW indexes Postgres created as <partition>_embedding_idx."""
+    for parent in (HNSW_INDEX, STORY_HNSW_INDEX):
+        rows = (await conn.execute(text("""
+            SELECT idx.relname AS index_name, tbl.relname AS table_name
+            FROM pg_inherits i
+            JOIN pg_class idx ON idx.oid = i.inhrelid
+            JOIN pg_index ix ON ix.indexrelid = idx.oid
+            JOIN pg_class tbl ON tbl.oid = ix.indrelid
+            WHERE i.inhparent = to_regclass(:index)
+        """), {"index": parent})).fetchall()
+        for row in rows:
+            m = _SUFFIX_RE.search(row.table_name)
+            wanted = f"{parent}_p{m[1]}" if m else None
+            if wanted and row.index_name != wanted:
+                await conn.execute(text(f'ALTER INDEX "{row.index_name}" RENAME TO {wanted}'))
+
+
+async def drop_day(conn: AsyncConnection, day: date) -> dict:
+    """Detach and drop one day's chunk and story partitions; returns the row counts dropped.
+
+    Runs in the caller's transaction; commit right after, one day at a time,
+    so the parent tables are locked only for that long.
+    """
+    counts = {}
+    await _lock_timeout(conn)
+    for table in reversed(TABLES):
+        name = partition_name(table, day)
+        counts[table] = (await conn.execute(text(f"SELECT COUNT(*) FROM {name}"))).scalar()
+        await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+        await conn.execute(text(f"DROP TABLE {name}"))
+    return counts
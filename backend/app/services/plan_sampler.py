@@ -0,0 +1,166 @@
+"""Capture EXPLAIN (ANALYZE, BUFFERS) plans for a sample of vector queries.
+
+A configurable fraction of search and related-story queries, plus every one
+slower than plan_slow_query_ms, is re-run under EXPLAIN in the background and
+the summarised plan kept in a small ring buffer (GET /api/admin/plans).
+
+The explain is a second execution, so its buffer counts describe the re-run:
+a query that was slow when observed but explains fast with a high hit ratio
+points at cold cache on the original, not at the plan. A plan that never
+touches the expected index is the other common cause, and is flagged.
+
+At most one explain runs at a time; samples that arrive while one is running
+are dropped rather than queued, so the sampler cannot pile load onto a
+database that is already slow.
+"""
+
+import asyncio
+import json
+import logging
+import random
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from sqlalchemy import text as sql_text
+
+from app.config import settings
+from app.database import read_session
+from app.services.fastpath import session_params
+from app.services.metrics import PLAN_SAMPLES
+
+logger = logging.getLogger(__name__)
+
+_INDEX_NODES = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+
+@dataclass
+class CapturedPlan:
+    query: str
+    reason: str  # "sampled" or "slow"
+    captured_at: str
+    observed_ms: float
+    execution_ms: float
+    planning_ms: float
+    expected_index: str
+    used_expected_index: bool
+    indexes: list[str]
+    seq_scans: list[str]
+    shared_hit_blocks: int
+    shared_read_blocks: int
+    buffer_hit_ratio: float | None
+    plan: dict = field(repr=False)
+
+
+_plans: deque[CapturedPlan] = deque(maxlen=settings.plan_buffer_size)
+_explain_lock = asyncio.Lock()
+_tasks: set[asyncio.Task] = set()
+
+
+def recent_plans() -> list[CapturedPlan]:
+    """Captured plans, newest first."""
+    return list(reversed(_plans))
+
+
+def observe(
+    query: str,
+    statement: str,
+    params: dict,
+    observed_ms: float,
+    expected_index: str,
+    ef_search_floor: int,
+) -> None:
+    """Record a finished query; schedule an explain if it is sampled or slow.
+
+    `ef_search_floor` is passed to apply_ef_search so the explain plans with the
+    same hnsw.ef_search as the query it re-runs.
+    """
+    if observed_ms >= settings.plan_slow_query_ms:
+        reason = "slow"
+    elif settings.plan_sample_rate > 0 and random.random() < settings.plan_sample_rate:
+        reason = "sampled"
+    else:
+        return
+    if _explain_lock.locked():
+        PLAN_SAMPLES.labels(query, "dropped").inc()
+        return
+    task = asyncio.create_task(
+        _explain(query, reason, statement, params, observed_ms, expected_index, ef_search_floor)
+    )
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def _explain(
+    query: str,
+    reason: str,
+    statement: str,
+    params: dict,
+    observed_ms: float,
+    expected_index: str,
+    ef_search_floor: int,
+) -> None:
+    # Imported here: vector_search imports this module.
+    from app.services.vector_search import apply_ef_search
+
+    async with _explain_lock:
+        try:
+            async with read_session() as session:
+                await session.execute(sql_text("SELECT set_config('statement_timeout', '10s', true)"))
+                await apply_ef_search(session, ef_search_floor)
+                raw = (await session.execute(
+                    sql_text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}"), session_params(params)
+                )).scalar()
+        except Exception as e:
+            PLAN_SAMPLES.labels(query, "failed").inc()
+            logger.warning("explain for %s failed: %s", query, e)
+            return
+
+    document = (json.loads(raw) if isinstance(raw, str) else raw)[0]
+    captured = summarize(query, reason, observed_ms, expected_index, document)
+    _plans.append(captured)
+    PLAN_SAMPLES.labels(query, "index" if captured.used_expected_index else "no_index").inc()
+    if not captured.used_expected_index:
+        logger.warning(
+            "%s plan did not use %s (seq scans: %s, observed %.1fms)",
+            query, expected_index, ", ".join(captured.seq_scans) or "none", observed_ms,
+        )
+
+
+def _is_index(name: str, expected: str) -> bool:
+    """`expected` itself, or one of its per-partition indexes (`expected`_pYYYYMMDD)."""
+    return name == expected or name.startswith(f"{expected}_p")
+
+
+def summarize(query: str, reason: str, observed_ms: float, expected_index: str, document: dict) -> CapturedPlan:
+    """Reduce one EXPLAIN (FORMAT JSON) document to the fields worth alerting on."""
+    indexes: list[str] = []
+    seq_scans: list[str] = []
+    stack = [document["Plan"]]
+    while stack:
+        node = stack.pop()
+        if node["Node Type"] in _INDEX_NODES and "Index Name" in node:
+            indexes.append(node["Index Name"])
+        elif node["Node Type"] == "Seq Scan":
+            seq_scans.append(node.get("Relation Name", "?"))
+        stack.extend(node.get("Plans", []))
+
+    # The root node's buffer counts include all of its children.
+    hit = document["Plan"].get("Shared Hit Blocks", 0)
+    read = document["Plan"].get("Shared Read Blocks", 0)
+    return CapturedPlan(
+        query=query,
+        reason=reason,
+        captured_at=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        observed_ms=round(observed_ms, 2),
+        execution_ms=round(document.get("Execution Time", 0.0), 2),
+        planning_ms=round(document.get("Planning Time", 0.0), 2),
+        expected_index=expected_index,
+        used_expected_index=any(_is_index(i, expected_index) for i in indexes),
+        indexes=sorted(set(indexes)),
+        seq_scans=sorted(set(seq_scans)),
+        shared_hit_blocks=hit,
+        shared_read_blocks=read,
+        buffer_hit_ratio=round(hit / (hit + read), 4) if hit + read else None,
+        plan=document,
+    )
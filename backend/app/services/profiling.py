@@ -0,0 +1,241 @@
+"""On-demand request profiling and event-loop stall detection.
+
+Neither piece is installed unless switched on: ProfilingMiddleware is only
+added to the app when profiling_enabled is set, and the loop monitor only
+runs when loop_monitor_enabled is set, so a default deployment pays nothing.
+
+Requests are profiled with pyinstrument (an optional dependency, like the
+local embedding runtimes) when they carry X-Profile plus a valid admin token,
+or fall in profile_sample_rate. `X-Profile: inline` returns the HTML profile
+instead of the normal response; anything else stores it for download from
+/api/admin/profiles and names it in the X-Profile-Id response header.
+
+The loop monitor is a heartbeat task plus a watchdog thread. When the
+heartbeat is late by more than loop_stall_threshold_ms, the watchdog grabs the
+event loop thread's stack, which is whatever synchronous code is hogging the
+loop, and keeps it for /api/admin/loop-stalls.
+"""
+
+import asyncio
+import logging
+import random
+import secrets
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from app.config import settings
+from app.services.metrics import LOOP_LAG_SECONDS, LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+
+# --- request profiles ---------------------------------------------------------
+
+@dataclass
+class StoredProfile:
+    id: str
+    method: str
+    path: str
+    status: int
+    reason: str  # "requested" or "sampled"
+    captured_at: str
+    duration_ms: float
+    session: object = field(repr=False)  # pyinstrument.session.Session
+
+
+_profiles: deque[StoredProfile] = deque(maxlen=settings.profile_buffer_size)
+
+
+def recent_profiles() -> list[StoredProfile]:
+    return list(reversed(_profiles))
+
+
+def get_profile(profile_id: str) -> StoredProfile | None:
+    return next((p for p in _profiles if p.id == profile_id), None)
+
+
+def render_profile(profile: StoredProfile, fmt: str) -> tuple[str, str]:
+    """(body, media type) for a stored profile in html, text or speedscope format."""
+    from pyinstrument.renderers import ConsoleRenderer, HTMLRenderer, SpeedscopeRenderer
+
+    if fmt == "text":
+        return ConsoleRenderer(unicode=True, color=False).render(profile.session), "text/plain"
+    if fmt == "speedscope":
+        return SpeedscopeRenderer().render(profile.session), "application/json"
+    return HTMLRenderer().render(profile.session), "text/html"
+
+
+def _header(scope, name: bytes) -> str | None:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class ProfilingMiddleware:
+    """Pure ASGI, so the profiler wraps the whole request including serialization."""
+
+    def __init__(self, app):
+        try:
+            from pyinstrument import Profiler
+        except ImportError as e:
+            raise RuntimeError("profiling_enabled needs pyinstrument installed") from e
+        self.app = app
+        self._profiler_cls = Profiler
+        # pyinstrument profiles one async context per thread at a time; a request
+        # that arrives while another is being profiled just runs unprofiled.
+        self._busy = False
+
+    def _wanted(self, scope) -> str | None:
+        requested = _header(scope, b"x-profile")
+        if requested is not None:
+            token = _header(scope, b"x-admin-token") or ""
+            if settings.admin_token and secrets.compare_digest(token, settings.admin_token):
+                return "inline" if requested == "inline" else "requested"
+        if settings.profile_sample_rate > 0 and random.random() < settings.profile_sample_rate:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._busy:
+            return await self.app(scope, receive, send)
+        mode = self._wanted(scope)
+        if mode is None:
+            return await self.app(scope, receive, send)
+
+        self._busy = True
+        profile_id = uuid.uuid4().hex[:12]
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if mode == "inline":
+                    return
+                message.setdefault("headers", []).append((b"x-profile-id", profile_id.encode()))
+            elif mode == "inline" and message["type"] == "http.response.body":
+                return
+            await send(message)
+
+        profiler = self._profiler_cls(interval=settings.profile_interval_ms / 1000, async_mode="enabled")
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            self._busy = False
+
+        stored = StoredProfile(
+            id=profile_id,
+            method=scope["method"],
+            path=scope["path"],
+            status=status,
+            reason="requested" if mode == "inline" else mode,
+            captured_at=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            duration_ms=round((time.perf_counter() - start) * 1000, 2),
+            session=profiler.last_session,
+        )
+        _profiles.append(stored)
+
+        if mode == "inline":
+            body = profiler.output_html().encode()
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/html; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"x-profile-id", profile_id.encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+
+
+# --- event-loop stalls ----------------------------------------------------------
+
+@dataclass
+class LoopStall:
+    captured_at: str
+    lag_ms: float
+    stack: list[str]
+
+
+_stalls: deque[LoopStall] = deque(maxlen=settings.profile_buffer_size)
+_monitor_task: asyncio.Task | None = None
+_watchdog: threading.Thread | None = None
+_stop = threading.Event()
+_heartbeat = 0.0
+
+
+def recent_stalls() -> list[LoopStall]:
+    return list(reversed(_stalls))
+
+
+async def _beat(interval: float) -> None:
+    global _heartbeat
+    while True:
+        _heartbeat = time.monotonic()
+        await asyncio.sleep(interval)
+        LOOP_LAG_SECONDS.observe(max(0.0, time.monotonic() - _heartbeat - interval))
+
+
+def _watch(loop_thread_id: int, interval: float, threshold: float) -> None:
+    # One capture per stall: wait for the heartbeat to move before arming again.
+    reported_for = 0.0
+    while not _stop.wait(interval):
+        beat = _heartbeat
+        lag = time.monotonic() - beat - interval
+        if lag < threshold or beat == reported_for:
+            continue
+        frame = sys._current_frames().get(loop_thread_id)
+        if frame is None:
+            continue
+        reported_for = beat
+        stack = traceback.format_stack(frame)
+        _stalls.append(LoopStall(
+            captured_at=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            lag_ms=round(lag * 1000, 1),
+            stack=stack,
+        ))
+        LOOP_STALLS.inc()
+        logger.warning("event loop blocked for %.0fms at:\n%s", lag * 1000, "".join(stack[-6:]))
+
+
+async def start_loop_monitor() -> None:
+    """Start the heartbeat and watchdog if loop_monitor_enabled. Call from the running loop."""
+    global _monitor_task, _watchdog, _heartbeat
+    if not settings.loop_monitor_enabled or _monitor_task is not None:
+        return
+    interval = settings.loop_monitor_interval_ms / 1000
+    _heartbeat = time.monotonic()
+    _stop.clear()
+    _monitor_task = asyncio.create_task(_beat(interval))
+    _watchdog = threading.Thread(
+        target=_watch,
+        args=(threading.get_ident(), interval, settings.loop_stall_threshold_ms / 1000),
+        name="loop-watchdog",
+        daemon=True,
+    )
+    _watchdog.start()
+
+
+async def stop_loop_monitor() -> None:
+    global _monitor_task, _watchdog
+    if _monitor_task is None:
+        return
+    _stop.set()
+    _monitor_task.cancel()
+    try:
+        await _monitor_task
+    except asyncio.CancelledError:
+        pass
+    _monitor_task = None
+    _watchdog = None
@@ -0,0 +1,183 @@
+"""Semantic cache of recent searches, keyed by query vector.
+
+Public-demo queries are often paraphrases of each other ("best rust web
+framework" / "which web framework for rust"). Once a query is embedded, the
+vectors of the last query_cache_size searches are compared with it in one
+matrix-vector product; if the nearest is at least query_cache_min_similarity
+(cosine), that search's results are served and the database is not touched.
+
+The vectors live in one preallocated float32 matrix, L2-normalised on the way
+in so the dot product is the cosine similarity, and overwritten as a ring.
+Entries expire after query_cache_ttl_seconds and are all dropped when the
+corpus generation changes: ingest and prune bump corpus_generation.generation
+in the same database, and each worker polls it every
+query_cache_generation_poll_seconds (from a replica when there is one, which
+lags no more than the searches it would otherwise run). Until the next poll a
+worker may still serve results from before the change.
+
+Per worker, like the rest of the in-process state; hits and misses are counted
+in hn_cache_requests_total{cache="query"} and the similarity of served hits in
+hn_query_cache_hit_similarity.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.config import settings
+from app.services import fastpath
+from app.services.metrics import CACHE_REQUESTS, QUERY_CACHE_ENTRIES, QUERY_CACHE_HIT_SIMILARITY
+from app.services.vector_search import HNSearchResult, SearchPerformance
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedSearch:
+    top_k: int
+    granularity: str
+    results: list[HNSearchResult]
+    perf: SearchPerformance
+    stored_at: float
+
+
+class QueryCache:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._vectors: np.ndarray | None = None  # allocated on first store, once the dimension is known
+        self._entries: list[CachedSearch | None] = [None] * capacity
+        self._filled = 0
+        self._next = 0
+        self.generation: int | None = None
+
+    def clear(self) -> None:
+        self._entries = [None] * self.capacity
+        self._filled = self._next = 0
+        QUERY_CACHE_ENTRIES.set(0)
+
+    def lookup(self, vector: np.ndarray, top_k: int, granularity: str) -> tuple[CachedSearch, float] | None:
+        """The cached search nearest to `vector` if it is similar enough, with its similarity."""
+        if not self._filled or self._vectors is None or vector.shape[0] != self._vectors.shape[1]:
+            return None
+        similarities = self._vectors[: self._filled] @ vector
+        # Best candidates first; almost always the first one decides.
+        now = time.monotonic()
+        for i in np.argsort(similarities)[::-1][:4]:
+            similarity = float(similarities[i])
+            if similarity < settings.query_cache_min_similarity:
+                return None
+            entry = self._entries[i]
+            if (
+                entry
+                and entry.top_k >= top_k
+                and entry.granularity == granularity
+                and now - entry.stored_at < settings.query_cache_ttl_seconds
+            ):
+                return entry, similarity
+        return None
+
+    def store(self, vector: np.ndarray, entry: CachedSearch) -> None:
+        if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+            self._vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+            self.clear()
+        self._vectors[self._next] = vector
+        self._entries[self._next] = entry
+        self._next = (self._next + 1) % self.capacity
+        self._filled = min(self._filled + 1, self.capacity)
+        QUERY_CACHE_ENTRIES.set(self._filled)
+
+
+_cache = QueryCache(settings.query_cache_size) if settings.query_cache_size > 0 else None
+_poller: asyncio.Task | None = None
+
+
+def _normalise(query_embedding: list[float]) -> np.ndarray:
+    vector = np.asarray(query_embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def current_generation() -> int | None:
+    """Pass to store(), taken before the search, so results that straddle a corpus change are not kept."""
+    return _cache.generation if _cache is not None else None
+
+
+def lookup(
+    query_embedding: list[float], top_k: int, granularity: str = "chunk"
+) -> tuple[list[HNSearchResult], SearchPerformance, float] | None:
+    """(results[:top_k], perf, similarity) of a recent near-duplicate search, or None."""
+    if _cache is None or _cache.generation is None:
+        return None
+    hit = _cache.lookup(_normalise(query_embedding), top_k, granularity)
+    CACHE_REQUESTS.labels("query", "hit" if hit else "miss").inc()
+    if hit is None:
+        return None
+    entry, similarity = hit
+    similarity = round(min(similarity, 1.0), 4)  # float32 rounding can overshoot 1
+    QUERY_CACHE_HIT_SIMILARITY.observe(similarity)
+    return entry.results[:top_k], entry.perf, similarity
+
+
+def store(
+    query_embedding: list[float],
+    top_k: int,
+    results: list[HNSearchResult],
+    perf: SearchPerformance,
+    generation: int | None,
+    granularity: str = "chunk",
+) -> None:
+    """Remember a search answered from the database, if the corpus has not changed since it started."""
+    if _cache is None or generation is None or generation != _cache.generation:
+        return
+    _cache.store(_normalise(query_embedding), CachedSearch(top_k, granularity, results, perf, time.monotonic()))
+
+
+async def bump_corpus_generation(conn: AsyncConnection | AsyncSession) -> None:
+    """Mark the corpus as changed, in the caller's transaction; every worker's cache empties."""
+    await conn.execute(text("UPDATE corpus_generation SET generation = generation + 1, changed_at = now()"))
+
+
+async def _check_generation() -> None:
+    generation = await fastpath.fetchval("SELECT generation FROM corpus_generation", read_only=True)
+    if generation != _cache.generation:
+        if _cache.generation is not None:
+            logger.info("corpus generation %s -> %s; query cache cleared", _cache.generation, generation)
+        _cache.clear()
+        _cache.generation = generation
+
+
+async def _run_poller() -> None:
+    while True:
+        await asyncio.sleep(settings.query_cache_generation_poll_seconds)
+        try:
+            await _check_generation()
+        except Exception as e:
+            # Serving on with a stale generation is bounded by the TTL.
+            logger.warning("corpus generation check failed: %s", e)
+
+
+async def start_query_cache() -> None:
+    global _poller
+    if _cache is None or _poller is not None:
+        return
+    try:
+        await _check_generation()
+    except Exception:
+        logger.exception("corpus generation check failed; query cache stays off until it succeeds")
+    _poller = asyncio.create_task(_run_poller())
+
+
+async def stop_query_cache() -> None:
+    global _poller
+    if _poller is not None:
+        _poller.cancel()
+        try:
+            await _poller
+        except asyncio.CancelledError:
+            pass
+        _poller = None
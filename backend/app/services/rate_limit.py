@@ -1,17 +1,35 @@
 """Per-IP daily cap on searches.
 
 Each search costs one embedding call, so on a public demo this is the spend cap.
+
+The hot path never touches Postgres: each worker keeps today's counters in a
+dict and answers from it, and a background task writes the aggregated
+increments to search_quota every quota_flush_interval_ms. Each flush returns
+the global count for the IPs it wrote, which is how a worker learns about
+searches other workers admitted. On startup today's rows are loaded back, so a
+Recreate rollout or pod restart does not hand everyone a fresh allowance.
+
+Overshoot: with one worker the cap is exact. With W workers a worker can admit
+at most quota_max_unflushed searches for an IP on a stale view before it is
+forced to flush that IP synchronously and see the global count, so an IP can
+exceed the cap by at most W * quota_max_unflushed searches per day (by 4 with
+the defaults and two workers). Only a caller bursting across workers within
+one flush interval gets near that.
 """
 
+import asyncio
 import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
 
 from fastapi import Request
-from sqlalchemy import delete, func, select
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import delete, func, text
 
 from app.config import settings
 from app.database import async_session
 from app.models import SearchQuota
+from app.services import fastpath
+from app.services.metrics import CACHE_REQUESTS, RATE_LIMIT_DECISIONS
 
 logger = logging.getLogger(__name__)
 
@@ -40,36 +58,58 @@ def get_client_ip(request: Request) -> str:
     return "unknown"
 
 
+@dataclass
+class _Allowance:
+    # Global count in search_quota as of this worker's last load or flush.
+    persisted: int = 0
+    # Local increments (refunds are negative) not yet written to search_quota.
+    pending: int = 0
+    # Guards against an older flush's RETURNING overwriting a newer one's.
+    flush_seq: int = 0
+    applied_seq: int = 0
+
+    @property
+    def used(self) -> int:
+        return self.persisted + self.pending
+
+
+_allowances: dict[tuple[str, date], _Allowance] = {}
+_flusher: asyncio.Task | None = None
+
+
+def _today() -> date:
+    # The 429 message promises a reset at midnight UTC.
+    return datetime.now(timezone.utc).date()
+
+
 async def consume_search(client_ip: str) -> tuple[bool, int, int]:
     """Count one search against today's allowance for this IP.
 
-    Increments and reads in a single statement so concurrent requests cannot both
-    observe the same pre-increment value and slip past the cap.
+    Check and increment happen with no await in between, so concurrent requests
+    in this worker cannot both observe the same count and slip past the cap.
+    A denied search is not counted.
 
     Returns (allowed, used, limit).
     """
     limit = settings.search_rate_limit_per_day
-
-    stmt = (
-        insert(SearchQuota)
-        .values(client_ip=client_ip, day=func.current_date(), count=1)
-        .on_conflict_do_update(
-            index_elements=["client_ip", "day"],
-            set_={"count": SearchQuota.count + 1},
-        )
-        .returning(SearchQuota.count)
-    )
-
-    try:
-        async with async_session() as session:
-            used = await session.scalar(stmt)
-            await session.commit()
-    except Exception:
-        # Never let a counter problem take search down; log loudly and allow.
-        logger.exception("search quota check failed for %s; allowing request", client_ip)
-        return True, 0, limit
-
-    return used <= limit, used, limit
+    key = (client_ip, _today())
+    entry = _allowances.get(key)
+    CACHE_REQUESTS.labels("quota", "hit" if entry else "miss").inc()
+    if entry is None:
+        entry = _allowances[key] = _Allowance()
+
+    if entry.used >= limit:
+        RATE_LIMIT_DECISIONS.labels("denied").inc()
+        return False, entry.used, limit
+    RATE_LIMIT_DECISIONS.labels("allowed").inc()
+    entry.pending += 1
+    used = entry.used
+
+    if entry.pending >= settings.quota_max_unflushed:
+        # This IP is bursting on a view that may be stale; sync it now so other
+        # workers' searches count before we admit more.
+        await _flush([key])
+    return True, used, limit
 
 
 async def refund_search(client_ip: str) -> None:
@@ -80,19 +120,102 @@ async def refund_search(client_ip: str) -> None:
     and should not lose their allowance — during the embedding outage that would
     have silently burned every visitor's five searches on failures.
     """
+    entry = _allowances.get((client_ip, _today()))
+    if entry and entry.used > 0:
+        entry.pending -= 1
+        RATE_LIMIT_DECISIONS.labels("refunded").inc()
+
+
+_FLUSH_SQL = """
+    INSERT INTO search_quota (client_ip, day, count)
+    SELECT ip, d, delta
+    FROM unnest(CAST(:ips AS varchar[]), CAST(:days AS date[]), CAST(:deltas AS int[])) AS t(ip, d, delta)
+    ON CONFLICT (client_ip, day)
+    DO UPDATE SET count = GREATEST(search_quota.count + EXCLUDED.count, 0)
+    RETURNING client_ip, day, count
+"""
+
+
+async def _flush(keys: list[tuple[str, date]] | None = None) -> None:
+    """Write pending increments for `keys` (default: all) in one statement."""
+    batch = []
+    for key in keys if keys is not None else list(_allowances):
+        entry = _allowances.get(key)
+        if entry is None or entry.pending == 0:
+            continue
+        # Take the delta with no await in between, so a concurrent flush of the
+        # same key cannot write it twice.
+        delta, entry.pending = entry.pending, 0
+        entry.flush_seq += 1
+        batch.append((key, entry, delta, entry.flush_seq))
+    if not batch:
+        return
+
+    try:
+        rows = await fastpath.fetch(_FLUSH_SQL, {
+            "ips": [key[0] for key, *_ in batch],
+            "days": [key[1] for key, *_ in batch],
+            "deltas": [delta for _, _, delta, _ in batch],
+        })
+        counts = {(row.client_ip, row.day): row.count for row in rows}
+    except Exception:
+        # Keep the increments and retry on the next tick. Admission keeps
+        # working from memory meanwhile.
+        logger.exception("search quota flush of %d counters failed", len(batch))
+        for _, entry, delta, _ in batch:
+            entry.pending += delta
+        return
+
+    for key, entry, _, seq in batch:
+        if key in counts and seq > entry.applied_seq:
+            entry.persisted = counts[key]
+            entry.applied_seq = seq
+
+
+async def load_quota_state() -> None:
+    """Reload today's counters, so a restart does not reset anyone's allowance."""
+    today = _today()
     try:
         async with async_session() as session:
-            row = await session.scalar(
-                select(SearchQuota).where(
-                    SearchQuota.client_ip == client_ip,
-                    SearchQuota.day == func.current_date(),
-                )
+            result = await session.execute(
+                text("SELECT client_ip, count FROM search_quota WHERE day = :day"), {"day": today}
             )
-            if row and row.count > 0:
-                row.count -= 1
-                await session.commit()
+            for row in result:
+                entry = _allowances.setdefault((row.client_ip, today), _Allowance())
+                entry.persisted = max(entry.persisted, row.count)
     except Exception:
-        logger.exception("failed to refund search quota for %s", client_ip)
+        # Never let a counter problem take search down; start from empty.
+        logger.exception("failed to load search quota state; starting with empty counters")
+
+
+async def _run_flusher() -> None:
+    interval = settings.quota_flush_interval_ms / 1000
+    while True:
+        await asyncio.sleep(interval)
+        await _flush()
+        # Yesterday's counters are never read again once flushed.
+        today = _today()
+        for key in [k for k, e in _allowances.items() if k[1] < today and e.pending == 0]:
+            del _allowances[key]
+
+
+async def start_quota_flusher() -> None:
+    global _flusher
+    await load_quota_state()
+    _flusher = asyncio.create_task(_run_flusher())
+
+
+async def stop_quota_flusher() -> None:
+    """Stop the background task and write whatever is still pending."""
+    global _flusher
+    if _flusher is not None:
+        _flusher.cancel()
+        try:
+            await _flusher
+        except asyncio.CancelledError:
+            pass
+        _flusher = None
+    await _flush()
 
 
 async def prune_quota(keep_days: int = 7) -> int:
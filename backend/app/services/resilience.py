@@ -0,0 +1,123 @@
+"""Latency tracking, hedging and a circuit breaker for calls to an outside service.
+
+Used around the query embedding call (app.services.embeddings), which sits on
+every search's critical path:
+
+- LatencyWindow keeps the last N successful latencies; the call's timeout is
+  its p99 times a multiplier, clamped to [min, max], so a provider that is
+  usually fast is given up on quickly when it stalls.
+- hedged() starts a second, identical call when the first has not answered
+  after a delay (the window's p95) and returns whichever finishes first.
+- CircuitBreaker opens after a run of consecutive failures and fails every
+  call fast for reset_seconds; then lets one probe call through (half-open)
+  and closes again if it succeeds.
+
+All state is per worker process.
+"""
+
+import asyncio
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+
+class LatencyWindow:
+    def __init__(self, size: int, min_samples: int = 20):
+        self._samples: deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> float | None:
+        """The q-quantile (0-1) of recent latencies, or None until there are enough of them."""
+        if len(self._samples) < self.min_samples:
+            return None
+        return float(np.quantile(np.fromiter(self._samples, dtype=np.float64), q))
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return CLOSED
+        if self._probing or time.monotonic() - self._opened_at >= self.reset_seconds:
+            return HALF_OPEN
+        return OPEN
+
+    def retry_after(self) -> float:
+        """Seconds until the next probe is allowed; 0 unless open."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+
+    def would_allow(self) -> bool:
+        """allow() without taking the probe slot: closed, or half-open with no probe out."""
+        state = self.state
+        return state == CLOSED or (state == HALF_OPEN and not self._probing)
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead. In half-open, only one probe at a time."""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def abandon(self) -> None:
+        """A call that was let through ended without an outcome (cancelled)."""
+        self._probing = False
+
+    def failure(self) -> None:
+        self._failures += 1
+        if self._probing or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+
+async def hedged(call: Callable[[], Awaitable[T]], delay: float | None) -> tuple[T, bool]:
+    """call()'s result, and whether it came from a hedge started after `delay` seconds.
+
+    With no delay there is no hedge. If one attempt fails the other is still
+    awaited; the first success wins and the loser is cancelled.
+    """
+    first = asyncio.ensure_future(call())
+    pending = {first}
+    error: BaseException | None = None
+    try:
+        if delay is not None:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                pending.add(asyncio.ensure_future(call()))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), task is not first
+                error = task.exception()
+        raise error
+    finally:
+        # Also reached when the caller is cancelled, e.g. by a timeout.
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,31 @@
+from app.services import fastpath
+
+STORY_SQL = """
+    SELECT id, hn_id, title, url, author, score, num_comments, story_text,
+           slug, story_type, created_at
+    FROM stories
+    WHERE slug = :slug
+"""
+
+CHUNKS_SQL = """
+    SELECT content, chunk_type, author, created_at
+    FROM chunks
+    WHERE story_id = :story_id AND story_created_at = :story_created_at
+    ORDER BY created_at
+"""
+
+
+async def load_story(slug: str) -> tuple[object | None, list]:
+    """A story row and its chunks in display order, or (None, []) if there is no such slug."""
+    rows = await fastpath.fetch(STORY_SQL, {"slug": slug}, read_only=True)
+    if not rows:
+        return None, []
+    story = rows[0]
+    # The partition key lets the planner read one day's partition only.
+    return story, await fastpath.fetch(
+        CHUNKS_SQL, {"story_id": story.id, "story_created_at": story.created_at}, read_only=True
+    )
+
+
+async def story_id_for_slug(slug: str):
+    return await fastpath.fetchval("SELECT id FROM stories WHERE slug = :slug", {"slug": slug}, read_only=True)
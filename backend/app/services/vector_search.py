@@ -1,9 +1,65 @@
+import logging
 import time
 from dataclasses import dataclass
 
+import numpy as np
 from sqlalchemy import text as sql_text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
 
-from app.database import async_session
+from app.config import settings
+from app.services import fastpath, plan_sampler
+from app.services.embeddings import embedding_model_id
+
+logger = logging.getLogger(__name__)
+
+# The parent index on partitioned chunks; each day partition's own index is
+# named HNSW_INDEX + "_pYYYYMMDD" (app.services.partitions).
+HNSW_INDEX = "idx_chunks_embedding_hnsw"
+# The same for stories.embedding, the story-level aggregate vectors.
+STORY_HNSW_INDEX = "idx_stories_embedding_hnsw"
+
+
+class CorpusModelMismatch(Exception):
+    """The stored vectors were not produced by the active embedding model."""
+
+
+# Set by verify_corpus_model when the corpus holds vectors from another model.
+_corpus_problem: str | None = None
+
+
+async def verify_corpus_model(conn: AsyncConnection | AsyncSession) -> None:
+    """Check that every chunk was embedded by the active model.
+
+    Two index probes on idx_chunks_embedding_model, for any model id sorting
+    before or after the active one, instead of a DISTINCT over the whole table.
+    The result is remembered, so search can refuse without asking again.
+    """
+    global _corpus_problem
+    active = embedding_model_id()
+    row = (await conn.execute(sql_text("""
+        SELECT
+            (SELECT embedding_model FROM chunks WHERE embedding_model < :model
+             ORDER BY embedding_model DESC LIMIT 1) AS below,
+            (SELECT embedding_model FROM chunks WHERE embedding_model > :model
+             ORDER BY embedding_model LIMIT 1) AS above
+    """), {"model": active})).one()
+    others = [m for m in (row.below, row.above) if m]
+    if others:
+        _corpus_problem = (
+            f"the corpus contains vectors from {', '.join(others)} but the active "
+            f"embedding model is {active}; re-ingest or switch embedding_provider back"
+        )
+        logger.error("refusing mixed corpus: %s", _corpus_problem)
+    else:
+        _corpus_problem = None
+
+
+def ensure_corpus_model(model_id: str) -> None:
+    """Raise CorpusModelMismatch unless vectors from `model_id` can be compared with the corpus."""
+    if model_id != embedding_model_id():
+        raise CorpusModelMismatch(f"query vector is from {model_id}, corpus expects {embedding_model_id()}")
+    if _corpus_problem:
+        raise CorpusModelMismatch(_corpus_problem)
 
 
 @dataclass
@@ -28,69 +84,327 @@ class SearchPerformance:
     index_type: str
 
 
+def ef_search_value(top_k: int, ef_search: int | None = None) -> str | None:
+    """The hnsw.ef_search to set for a query of `top_k` results, or None for the default.
+
+    `ef_search` overrides settings.hnsw_ef_search. An HNSW scan returns at most
+    ef_search rows, so it is never set below the number of results asked for.
+    """
+    ef = ef_search if ef_search is not None else settings.hnsw_ef_search
+    return None if ef is None else str(max(ef, top_k))
+
+
+async def apply_ef_search(session: AsyncSession, top_k: int) -> None:
+    """Set hnsw.ef_search for the current transaction, if configured."""
+    ef = ef_search_value(top_k)
+    if ef is None:
+        return
+    await session.execute(sql_text("SELECT set_config('hnsw.ef_search', :ef, true)"), {"ef": ef})
+
+
+# chunks is partitioned by day with an HNSW index per partition. The inner
+# ORDER BY ... LIMIT runs as a Merge Append over the partitions' index scans:
+# each partition yields its nearest chunks in distance order and the merge
+# keeps the global top_k, which are then joined to their stories (one
+# partition each, by the partition key). The similarity threshold is applied
+# to those top_k; since it is monotonic in distance this returns the same rows
+# as filtering inside.
+SEARCH_SQL = """
+    SELECT
+        s.title AS story_title,
+        s.slug AS story_slug,
+        s.url AS story_url,
+        s.author AS story_author,
+        s.score AS story_score,
+        s.hn_id AS story_hn_id,
+        c.content AS matched_content,
+        c.chunk_type,
+        c.author AS comment_author,
+        1 - c.distance AS similarity_score,
+        s.created_at AS story_date
+    FROM (
+        SELECT story_id, story_created_at, content, chunk_type, author,
+               embedding <=> :query_vec AS distance
+        FROM chunks
+        ORDER BY embedding <=> :query_vec
+        LIMIT :top_k
+    ) c
+    JOIN stories s ON s.id = c.story_id AND s.created_at = c.story_created_at
+    WHERE 1 - c.distance > :threshold
+    ORDER BY c.distance
+"""
+
+# Many queries in one round trip: each query vector runs the same inner
+# ORDER BY ... LIMIT as SEARCH_SQL, as a LATERAL subquery, with its own top_k.
+# Vectors are sent as text[], which both the asyncpg and SQLAlchemy paths bind.
+BATCH_SEARCH_SQL = """
+    SELECT
+        q.ord AS query_index,
+        s.title AS story_title,
+        s.slug AS story_slug,
+        s.url AS story_url,
+        s.author AS story_author,
+        s.score AS story_score,
+        s.hn_id AS story_hn_id,
+        c.content AS matched_content,
+        c.chunk_type,
+        c.author AS comment_author,
+        1 - c.distance AS similarity_score,
+        s.created_at AS story_date
+    FROM unnest(CAST(CAST(:query_vecs AS text[]) AS vector[]), CAST(:top_ks AS int[]))
+         WITH ORDINALITY AS q(vec, top_k, ord)
+    CROSS JOIN LATERAL (
+        SELECT story_id, story_created_at, content, chunk_type, author,
+               embedding <=> q.vec AS distance
+        FROM chunks
+        ORDER BY embedding <=> q.vec
+        LIMIT q.top_k
+    ) c
+    JOIN stories s ON s.id = c.story_id AND s.created_at = c.story_created_at
+    WHERE 1 - c.distance > :threshold
+    ORDER BY q.ord, c.distance
+"""
+
+RELATED_SQL = """
+    SELECT
+        s.slug,
+        s.title,
+        s.author,
+        s.score,
+        s.created_at,
+        1 - (c.embedding <=> ref.embedding) AS similarity_score
+    FROM chunks c
+    JOIN stories s ON s.id = c.story_id AND s.created_at = c.story_created_at
+    CROSS JOIN (
+        SELECT embedding FROM chunks
+        WHERE story_id = :story_id AND chunk_type = 'title'
+        LIMIT 1
+    ) ref
+    WHERE c.chunk_type = 'title'
+      AND c.story_id != :story_id
+      AND 1 - (c.embedding <=> ref.embedding) > 0.3
+    ORDER BY c.embedding <=> ref.embedding
+    LIMIT :limit
+"""
+
+
+# granularity=story: the nearest story vectors (Merge Append over the
+# stories partitions' HNSW indexes, like SEARCH_SQL), then for each story its
+# chunk nearest to the query, to show as the match. That second ORDER BY sorts
+# on similarity rather than on the <=> operator, so it cannot turn into an HNSW
+# scan of the whole chunks table: it reads the story's few chunks through
+# idx_chunks_story_id and sorts them. The threshold applies to that chunk.
+STORY_SEARCH_SQL = """
+    SELECT
+        s.title AS story_title,
+        s.slug AS story_slug,
+        s.url AS story_url,
+        s.author AS story_author,
+        s.score AS story_score,
+        s.hn_id AS story_hn_id,
+        c.content AS matched_content,
+        c.chunk_type,
+        c.author AS comment_author,
+        c.similarity AS similarity_score,
+        s.created_at AS story_date
+    FROM (
+        SELECT id, created_at, embedding <=> :query_vec AS distance
+        FROM stories
+        WHERE embedding IS NOT NULL
+        ORDER BY embedding <=> :query_vec
+        LIMIT :top_k
+    ) top
+    JOIN stories s ON s.id = top.id AND s.created_at = top.created_at
+    CROSS JOIN LATERAL (
+        SELECT content, chunk_type, author, 1 - (embedding <=> :query_vec) AS similarity
+        FROM chunks
+        WHERE story_id = top.id AND story_created_at = top.created_at
+        ORDER BY similarity DESC
+        LIMIT 1
+    ) c
+    WHERE c.similarity > :threshold
+    ORDER BY top.distance
+"""
+
+
+def story_vector(embeddings: list) -> list[float]:
+    """A story's aggregate vector: the normalised mean of its (unit) chunk embeddings."""
+    mean = np.mean(np.asarray(embeddings, dtype=np.float32), axis=0)
+    norm = np.linalg.norm(mean)
+    return (mean / norm if norm else mean).tolist()
+
+
+def search_result(row) -> HNSearchResult:
+    """An HNSearchResult from a row with SEARCH_SQL's columns."""
+    return HNSearchResult(
+        story_title=row.story_title,
+        story_slug=row.story_slug,
+        story_url=row.story_url,
+        story_author=row.story_author,
+        story_score=row.story_score,
+        story_hn_id=row.story_hn_id,
+        matched_content=row.matched_content,
+        chunk_type=row.chunk_type,
+        comment_author=row.comment_author,
+        similarity_score=round(float(row.similarity_score), 4),
+        story_date=row.story_date.isoformat()[:10],
+    )
+
+
+def _local_index():
+    # Imported here: local_index imports this module.
+    from app.services import local_index
+
+    return local_index if local_index.active() else None
+
+
+def index_type() -> str:
+    return "local-f16" if _local_index() else "hnsw"
+
+
+async def count_chunks() -> int:
+    if local := _local_index():
+        return local.rows()
+    return await fastpath.fetchval("SELECT COUNT(*) FROM chunks", read_only=True) or 0
+
+
+async def nearest_chunks(
+    query_embedding: list[float],
+    top_k: int,
+    threshold: float,
+    ef_search: int | None = None,
+) -> tuple[list[HNSearchResult], float]:
+    """The top_k chunks nearest to `query_embedding` with their stories; returns (results, query_time_ms).
+
+    `ef_search` overrides settings.hnsw_ef_search for this query, trading
+    recall for latency. Only default-ef queries are plan-sampled, since the
+    explain re-runs with the configured value. With the local backend the
+    scan is exact and ef_search does not apply.
+    """
+    if local := _local_index():
+        results, perf = await local.search(query_embedding, top_k, threshold)
+        return results, perf.query_time_ms
+    params = {
+        "query_vec": np.asarray(query_embedding, dtype=np.float32),
+        "threshold": threshold,
+        "top_k": top_k,
+    }
+    start = time.time()
+    rows = await fastpath.fetch(SEARCH_SQL, params, ef_search_floor=top_k, read_only=True, ef_search=ef_search)
+    query_time = (time.time() - start) * 1000
+    if ef_search is None:
+        plan_sampler.observe("search", SEARCH_SQL, params, query_time, HNSW_INDEX, top_k)
+
+    return [search_result(row) for row in rows], query_time
+
+
+async def batch_nearest_chunks(
+    query_embeddings: list[list[float]],
+    top_ks: list[int],
+    threshold: float,
+) -> tuple[list[list[HNSearchResult]], float]:
+    """nearest_chunks for many queries in one statement; returns (results per query, query_time_ms)."""
+    params = {
+        "query_vecs": [fastpath.vector_text(np.asarray(v, dtype=np.float32)) for v in query_embeddings],
+        "top_ks": top_ks,
+        "threshold": threshold,
+    }
+    floor = max(top_ks)
+    start = time.time()
+    rows = await fastpath.fetch(BATCH_SEARCH_SQL, params, ef_search_floor=floor, read_only=True)
+    query_time = (time.time() - start) * 1000
+    plan_sampler.observe("search_batch", BATCH_SEARCH_SQL, params, query_time, HNSW_INDEX, floor)
+
+    grouped: list[list[HNSearchResult]] = [[] for _ in query_embeddings]
+    for row in rows:
+        grouped[row.query_index - 1].append(search_result(row))
+    return grouped, query_time
+
+
 async def search_hn(
     query_embedding: list[float],
     top_k: int = 10,
     threshold: float = 0.1,
+    model_id: str | None = None,
 ) -> tuple[list[HNSearchResult], SearchPerformance]:
-    """Semantic search across all HN chunks, returning results with story metadata."""
-    async with async_session() as session:
-        count_result = await session.execute(
-            sql_text("SELECT COUNT(*) FROM chunks")
-        )
-        total_chunks = count_result.scalar()
-
-        start = time.time()
-
-        query = sql_text("""
-            SELECT
-                s.title AS story_title,
-                s.slug AS story_slug,
-                s.url AS story_url,
-                s.author AS story_author,
-                s.score AS story_score,
-                s.hn_id AS story_hn_id,
-                c.content AS matched_content,
-                c.chunk_type,
-                c.author AS comment_author,
-                1 - (c.embedding <=> :query_vec) AS similarity_score,
-                s.created_at AS story_date
-            FROM chunks c
-            JOIN stories s ON c.story_id = s.id
-            WHERE 1 - (c.embedding <=> :query_vec) > :threshold
-            ORDER BY c.embedding <=> :query_vec
-            LIMIT :top_k
-        """)
-
-        result = await session.execute(query, {
-            "query_vec": str(query_embedding),
-            "threshold": threshold,
-            "top_k": top_k,
-        })
-
-        query_time = (time.time() - start) * 1000
-
-        results = [
-            HNSearchResult(
-                story_title=row.story_title,
-                story_slug=row.story_slug,
-                story_url=row.story_url,
-                story_author=row.story_author,
-                story_score=row.story_score,
-                story_hn_id=row.story_hn_id,
-                matched_content=row.matched_content,
-                chunk_type=row.chunk_type,
-                comment_author=row.comment_author,
-                similarity_score=round(float(row.similarity_score), 4),
-                story_date=row.story_date.isoformat()[:10],
-            )
-            for row in result.fetchall()
-        ]
-
-        perf = SearchPerformance(
-            query_time_ms=round(query_time, 2),
-            chunks_searched=total_chunks or 0,
-            index_type="hnsw",
-        )
+    """Semantic search across all HN chunks, returning results with story metadata.
+
+    `model_id` is the model that produced `query_embedding`; it defaults to the
+    active provider's.
+    """
+    ensure_corpus_model(model_id or embedding_model_id())
+    if local := _local_index():
+        return await local.search(query_embedding, top_k, threshold)
+    total_chunks = await count_chunks()
+    results, query_time = await nearest_chunks(query_embedding, top_k, threshold)
+
+    perf = SearchPerformance(
+        query_time_ms=round(query_time, 2),
+        chunks_searched=total_chunks,
+        index_type="hnsw",
+    )
+
+    return results, perf
+
+
+async def count_stories() -> int:
+    return await fastpath.fetchval("SELECT COUNT(*) FROM stories", read_only=True) or 0
+
+
+async def nearest_stories(
+    query_embedding: list[float], top_k: int, threshold: float
+) -> tuple[list[HNSearchResult], float]:
+    """The top_k stories nearest by story vector, each with its best-matching chunk, and the query time in ms."""
+    params = {
+        "query_vec": np.asarray(query_embedding, dtype=np.float32),
+        "threshold": threshold,
+        "top_k": top_k,
+    }
+    start = time.time()
+    rows = await fastpath.fetch(STORY_SEARCH_SQL, params, ef_search_floor=top_k, read_only=True)
+    query_time = (time.time() - start) * 1000
+    plan_sampler.observe("search_stories", STORY_SEARCH_SQL, params, query_time, STORY_HNSW_INDEX, top_k)
+    return [search_result(row) for row in rows], query_time
+
+
+async def search_stories(
+    query_embedding: list[float],
+    top_k: int = 10,
+    threshold: float = 0.1,
+    model_id: str | None = None,
+) -> tuple[list[HNSearchResult], SearchPerformance]:
+    """granularity=story: distinct stories nearest by story vector, each with its best-matching chunk.
+
+    Always answered by Postgres; the local backend only holds chunk vectors.
+    SearchPerformance.chunks_searched counts the stories searched.
+    """
+    ensure_corpus_model(model_id or embedding_model_id())
+    total_stories = await count_stories()
+    results, query_time = await nearest_stories(query_embedding, top_k, threshold)
+    perf = SearchPerformance(
+        query_time_ms=round(query_time, 2),
+        chunks_searched=total_stories,
+        index_type="hnsw-story",
+    )
+    return results, perf
+
+
+async def find_related_stories(story_id, limit: int) -> tuple[list, float, int]:
+    """Stories whose title chunk is nearest to this story's.
+
+    Returns (rows, query_time_ms, title chunks searched).
+    """
+    if local := _local_index():
+        found = await local.related(story_id, limit)
+        if found is not None:
+            return found
+    chunks_searched = await fastpath.fetchval(
+        "SELECT COUNT(*) FROM chunks WHERE chunk_type = 'title'", read_only=True
+    ) or 0
 
-        return results, perf
+    params = {"story_id": story_id, "limit": limit}
+    start = time.time()
+    rows = await fastpath.fetch(RELATED_SQL, params, ef_search_floor=limit, read_only=True)
+    query_time_ms = (time.time() - start) * 1000
+    plan_sampler.observe("related", RELATED_SQL, params, query_time_ms, HNSW_INDEX, limit)
+    return rows, query_time_ms, chunks_searched
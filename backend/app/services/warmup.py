@@ -0,0 +1,152 @@
+"""Readiness warmup: fill the pools, load the HNSW index, run real queries.
+
+Runs as a background task once the app has started, so liveness
+(/api/health) answers immediately while readiness (/api/ready) stays 503
+until every step has succeeded. Kubernetes only sends traffic after that,
+so the first search after a deploy or a scale-up is not the one that pays
+for connection setup, a cold index and a cold embedding client.
+
+Database steps are retried with backoff until they succeed. The embedding
+call is best-effort as before: story pages and browsing do not need it, and
+without it the representative search runs on a random vector instead.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import AsyncExitStack
+
+import numpy as np
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import POOL_SIZE, engine, replicas
+from app.services import fastpath
+from app.services.embeddings import generate_embedding
+from app.services.stories import load_story
+from app.services.vector_search import HNSW_INDEX, STORY_HNSW_INDEX, CorpusModelMismatch, find_related_stories, search_hn
+
+logger = logging.getLogger(__name__)
+
+_ready = False
+_step_seconds: dict[str, float] = {}
+_last_error: str | None = None
+_task: asyncio.Task | None = None
+
+
+def is_ready() -> bool:
+    return _ready
+
+
+def readiness() -> dict:
+    return {
+        "status": "ready" if _ready else "warming_up",
+        "warmup_seconds": {k: round(v, 3) for k, v in _step_seconds.items()},
+        "last_error": _last_error,
+    }
+
+
+async def _fill(target_engine, connections: int) -> None:
+    """Open `connections` pooled connections at once, so they are there when traffic arrives."""
+    async with AsyncExitStack() as stack:
+        async def one():
+            conn = await stack.enter_async_context(target_engine.connect())
+            await conn.execute(text("SELECT 1"))
+
+        await asyncio.gather(*(one() for _ in range(connections)))
+
+
+async def _prefill_pools() -> None:
+    await _fill(engine, POOL_SIZE)
+    for replica in replicas:
+        await _fill(replica.engine, settings.replica_pool_size)
+    await fastpath.prefill()
+
+
+async def _prewarm_index() -> None:
+    """pg_prewarm the HNSW indexes on the primary and every replica, where installed."""
+    for target in [engine, *(r.engine for r in replicas)]:
+        async with target.connect() as conn:
+            installed = (await conn.execute(
+                text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_prewarm')")
+            )).scalar()
+            if not installed:
+                logger.info("pg_prewarm not installed on %s; relying on warmup queries", target.url.host)
+                continue
+            # The parent index has no storage; its per-partition indexes do.
+            for index in (HNSW_INDEX, STORY_HNSW_INDEX):
+                blocks = (await conn.execute(text(
+                    "SELECT COALESCE(SUM(pg_prewarm(inhrelid)), 0) FROM pg_inherits WHERE inhparent = to_regclass(:index)"
+                ), {"index": index})).scalar()
+                logger.info("prewarmed %s partitions: %s blocks", index, blocks)
+
+
+async def _query_vector() -> list[float]:
+    try:
+        return await generate_embedding("warmup")
+    except Exception as e:
+        logger.warning("Embedding warmup failed, continuing without it: %s", e)
+        vector = np.random.default_rng().standard_normal(settings.embedding_dimensions)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+
+async def _representative_queries() -> None:
+    """A search, a story page and a related lookup, through the same code as requests."""
+    vector = await _query_vector()
+    # Once per read target, since round-robin spreads these over the replicas.
+    for _ in range(max(1, len(replicas))):
+        try:
+            await search_hn(vector, top_k=settings.top_k, threshold=settings.similarity_threshold)
+        except CorpusModelMismatch:
+            # Search is refused until re-ingest; nothing to warm for it.
+            break
+    slug = await fastpath.fetchval("SELECT slug FROM stories ORDER BY created_at DESC LIMIT 1", read_only=True)
+    if slug:
+        story, _ = await load_story(slug)
+        if story is not None:
+            await find_related_stories(story.id, 5)
+
+
+STEPS = (
+    ("prefill_pools", _prefill_pools),
+    ("prewarm_index", _prewarm_index),
+    ("representative_queries", _representative_queries),
+)
+
+
+async def _run() -> None:
+    global _ready, _last_error
+    delay = 1.0
+    for name, step in STEPS:
+        while True:
+            start = time.perf_counter()
+            try:
+                await step()
+            except Exception as e:
+                _last_error = f"{name}: {e}"
+                logger.warning("warmup step %s failed, retrying in %.0fs: %s", name, delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+            _step_seconds[name] = time.perf_counter() - start
+            break
+    _ready, _last_error = True, None
+    logger.info("warmup done in %.2fs: %s", sum(_step_seconds.values()), _step_seconds)
+
+
+def start_warmup() -> None:
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_run())
+
+
+async def stop_warmup() -> None:
+    global _task, _ready
+    _ready = False
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
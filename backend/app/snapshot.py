@@ -0,0 +1,336 @@
+"""Corpus snapshots: stories and chunks, embeddings included, in a compact binary form.
+
+    python -m app.snapshot export DIR [--float16]   # write the current corpus to DIR
+    python -m app.snapshot import DIR [--truncate]  # load DIR into an empty corpus
+
+Seeding an environment from a snapshot takes minutes and no Algolia or
+embedding calls, where ingest_initial takes hours of both. bench/synth_corpus.py
+writes and reads the same format (--snapshot), so benchmark corpora can be
+reproduced exactly without regenerating them.
+
+A snapshot is a directory of raw column files plus manifest.json, one file set
+per column of stories and chunks, in the same row order:
+
+    <table>.<column>.bin       fixed-width values: uuid as 16 bytes, integers
+                               and timestamps (microseconds since the epoch) as
+                               int64, embeddings as an N x D float32 or float16
+                               matrix
+    <table>.<column>.bin       for text, the UTF-8 bytes of all values end to
+    <table>.<column>.offsets   end, and N + 1 int64 offsets into them
+    <table>.<column>.nulls     one byte per row for nullable columns
+
+Columns come from the models, so a snapshot always matches the schema version
+recorded in its manifest; import refuses any other. Export reads both tables
+in one REPEATABLE READ transaction. Import creates the day partitions, loads
+with binary COPY without the HNSW indexes, and builds them once at the end.
+
+Both run over migration_database_url when set, like the migration runner.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+from pgvector.asyncpg import register_vector
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import DateTime, Integer, String, Text, select, text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+from app.database import _build_async_url
+from app.migrate import check_schema_version, current_version
+from app.models import Chunk, Story
+from app.services.embeddings import embedding_model_id
+from app.services.partitions import ensure_partitions, name_hnsw_partitions
+from app.services.query_cache import bump_corpus_generation
+from app.services.vector_search import HNSW_INDEX, STORY_HNSW_INDEX
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 1
+TABLES = (Story.__table__, Chunk.__table__)
+# Export order: by day, so import fills one partition at a time, and the
+# chunks of a story end up next to each other. (The chunk primary key,
+# (id, story_created_at), would scatter them.)
+EXPORT_ORDER = {
+    "stories": ("created_at", "id"),
+    "chunks": ("story_created_at", "story_id", "id"),
+}
+BATCH = 10_000
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _kind(column) -> str:
+    if isinstance(column.type, UUID):
+        return "uuid"
+    if isinstance(column.type, Integer):
+        return "int64"
+    if isinstance(column.type, DateTime):
+        return "timestamp"
+    if isinstance(column.type, Vector):
+        return "vector"
+    if isinstance(column.type, (String, Text)):
+        return "text"
+    raise TypeError(f"no snapshot encoding for {column.table.name}.{column.name} ({column.type})")
+
+
+class _ColumnWriter:
+    def __init__(self, directory: Path, table: str, column, vector_dtype: str):
+        self.name = column.name
+        self.kind = _kind(column)
+        self.nullable = column.nullable
+        self.vector_dtype = np.dtype(vector_dtype)
+        # Written in place of a null vector (stories.embedding), so rows stay fixed-size.
+        self.zero = np.zeros(column.type.dim, dtype=np.float32) if self.kind == "vector" else None
+        base = directory / f"{table}.{column.name}"
+        self.data = open(f"{base}.bin", "wb")
+        self.nulls = open(f"{base}.nulls", "wb") if self.nullable else None
+        self.offsets = open(f"{base}.offsets", "wb") if self.kind == "text" else None
+        self.position = 0
+        if self.offsets:
+            self.offsets.write(np.zeros(1, dtype=np.int64).tobytes())
+
+    def write(self, values: list) -> None:
+        if self.nulls:
+            self.nulls.write(np.fromiter((v is None for v in values), dtype=np.uint8, count=len(values)).tobytes())
+        if self.kind == "uuid":
+            self.data.write(b"".join(v.bytes if v is not None else bytes(16) for v in values))
+        elif self.kind == "int64":
+            self.data.write(np.asarray([v or 0 for v in values], dtype=np.int64).tobytes())
+        elif self.kind == "timestamp":
+            micros = [(v - _EPOCH) // timedelta(microseconds=1) if v is not None else 0 for v in values]
+            self.data.write(np.asarray(micros, dtype=np.int64).tobytes())
+        elif self.kind == "vector":
+            vectors = [v if v is not None else self.zero for v in values]
+            self.data.write(np.asarray(vectors, dtype=np.float32).astype(self.vector_dtype).tobytes())
+        else:
+            encoded = [v.encode() if v is not None else b"" for v in values]
+            self.data.write(b"".join(encoded))
+            ends = self.position + np.cumsum([len(e) for e in encoded], dtype=np.int64)
+            self.position = int(ends[-1]) if len(ends) else self.position
+            self.offsets.write(ends.tobytes())
+
+    def close(self) -> None:
+        for f in (self.data, self.nulls, self.offsets):
+            if f:
+                f.close()
+
+
+class _ColumnReader:
+    """Slices of a column as Python values, read from memory maps so a column never has to fit in memory."""
+
+    def __init__(self, directory: Path, table: str, spec: dict, rows: int, manifest: dict):
+        base = directory / f"{table}.{spec['name']}"
+        self.kind = spec["kind"]
+        self.nulls = self.offsets = None
+        if rows == 0:
+            self.data = None
+            return
+        if spec["nullable"]:
+            self.nulls = np.memmap(f"{base}.nulls", dtype=np.uint8, mode="r", shape=(rows,))
+        if self.kind == "vector":
+            shape = (rows, manifest["dimensions"])
+            self.data = np.memmap(f"{base}.bin", dtype=manifest["vector_dtype"], mode="r", shape=shape)
+        elif self.kind == "uuid":
+            self.data = np.memmap(f"{base}.bin", dtype=np.uint8, mode="r", shape=(rows, 16))
+        elif self.kind in ("int64", "timestamp"):
+            self.data = np.memmap(f"{base}.bin", dtype=np.int64, mode="r", shape=(rows,))
+        else:
+            self.offsets = np.memmap(f"{base}.offsets", dtype=np.int64, mode="r", shape=(rows + 1,))
+            size = int(self.offsets[-1])
+            self.data = np.memmap(f"{base}.bin", dtype=np.uint8, mode="r", shape=(size,)) if size else b""
+
+    def read(self, start: int, end: int) -> list:
+        if self.kind == "vector":
+            values = list(np.asarray(self.data[start:end], dtype=np.float32))
+        elif self.kind == "uuid":
+            values = [uuid.UUID(bytes=row.tobytes()) for row in self.data[start:end]]
+        elif self.kind == "int64":
+            values = self.data[start:end].tolist()
+        elif self.kind == "timestamp":
+            values = [_EPOCH + timedelta(microseconds=m) for m in self.data[start:end].tolist()]
+        else:
+            offsets = self.offsets[start:end + 1].tolist()
+            blob = bytes(self.data[offsets[0]:offsets[-1]])
+            base = offsets[0]
+            values = [blob[a - base:b - base].decode() for a, b in zip(offsets, offsets[1:])]
+        if self.nulls is not None:
+            values = [None if null else v for v, null in zip(values, self.nulls[start:end].tolist())]
+        return values
+
+
+def _engine():
+    url, connect_args = _build_async_url(settings.migration_database_url or settings.database_url)
+    return create_async_engine(url, poolclass=NullPool, connect_args=connect_args)
+
+
+# --- Export -------------------------------------------------------------------------
+
+
+async def export_snapshot(directory: Path, vector_dtype: str = "float32") -> dict:
+    directory.mkdir(parents=True, exist_ok=True)
+    if (directory / "manifest.json").exists():
+        raise SystemExit(f"{directory} already holds a snapshot")
+    start = time.perf_counter()
+    engine = _engine()
+    manifest = {
+        "format": FORMAT,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "dimensions": settings.embedding_dimensions,
+        "vector_dtype": vector_dtype,
+        "tables": {},
+    }
+    try:
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="REPEATABLE READ")
+            manifest["schema_version"] = await current_version(conn)
+            for table in TABLES:
+                writers = [_ColumnWriter(directory, table.name, c, vector_dtype) for c in table.columns]
+                rows = 0
+                stmt = select(*table.columns).order_by(*(table.c[name] for name in EXPORT_ORDER[table.name]))
+                result = await conn.stream(stmt.execution_options(yield_per=BATCH))
+                async for batch in result.partitions(BATCH):
+                    for writer in writers:
+                        writer.write([row._mapping[writer.name] for row in batch])
+                    rows += len(batch)
+                for writer in writers:
+                    writer.close()
+                manifest["tables"][table.name] = {
+                    "rows": rows,
+                    "columns": [{"name": w.name, "kind": w.kind, "nullable": w.nullable} for w in writers],
+                }
+                logger.info("exported %d %s", rows, table.name)
+            models = (await conn.execute(text("SELECT DISTINCT embedding_model FROM chunks"))).scalars().all()
+            manifest["embedding_models"] = sorted(models)
+            await conn.commit()
+    finally:
+        await engine.dispose()
+    # Written last: a directory without a manifest is an unfinished export.
+    (directory / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    return {
+        "stories": manifest["tables"]["stories"]["rows"],
+        "chunks": manifest["tables"]["chunks"]["rows"],
+        "bytes": sum(f.stat().st_size for f in directory.iterdir()),
+        "seconds": round(time.perf_counter() - start, 1),
+    }
+
+
+# --- Import -------------------------------------------------------------------------
+
+
+async def build_hnsw_index(conn: AsyncConnection) -> None:
+    """Build the HNSW indexes on chunks and stories in one go, one graph per partition, and name them."""
+    await conn.execute(text("SET maintenance_work_mem = '2GB'"))
+    for index, table in ((HNSW_INDEX, "chunks"), (STORY_HNSW_INDEX, "stories")):
+        await conn.execute(text(f"""
+            CREATE INDEX IF NOT EXISTS {index}
+            ON {table} USING hnsw (embedding vector_cosine_ops)
+            WITH (m = {settings.hnsw_m}, ef_construction = {settings.hnsw_ef_construction})
+        """))
+    await name_hnsw_partitions(conn)
+
+
+async def _copy_table(pg, directory: Path, table: str, manifest: dict) -> None:
+    spec = manifest["tables"][table]
+    rows = spec["rows"]
+    columns = [c["name"] for c in spec["columns"]]
+    readers = [_ColumnReader(directory, table, c, rows, manifest) for c in spec["columns"]]
+    for start in range(0, rows, BATCH):
+        end = min(start + BATCH, rows)
+        records = list(zip(*(reader.read(start, end) for reader in readers)))
+        await pg.copy_records_to_table(table, records=records, columns=columns)
+        logger.info("loaded %d / %d %s", end, rows, table)
+
+
+async def import_snapshot(directory: Path, truncate: bool = False) -> dict:
+    manifest = json.loads((directory / "manifest.json").read_text())
+    if manifest["format"] != FORMAT:
+        raise SystemExit(f"snapshot format {manifest['format']} is not supported (expected {FORMAT})")
+    if manifest["dimensions"] != settings.embedding_dimensions:
+        raise SystemExit(
+            f"snapshot vectors have {manifest['dimensions']} dimensions, "
+            f"embedding_dimensions is {settings.embedding_dimensions}"
+        )
+    models = manifest.get("embedding_models", [])
+    if models and models != [embedding_model_id()]:
+        # Loaded anyway; searches refuse the corpus until the provider matches.
+        logger.warning("snapshot embeddings are from %s, the configured provider is %s",
+                       ", ".join(models), embedding_model_id())
+    start = time.perf_counter()
+    engine = _engine()
+    try:
+        async with engine.connect() as conn:
+            await check_schema_version(conn)
+            if await current_version(conn) != manifest["schema_version"]:
+                raise SystemExit(
+                    f"snapshot is from schema version {manifest['schema_version']}; "
+                    "export it again with this version of the code"
+                )
+            if truncate:
+                await conn.execute(text("TRUNCATE stories, chunks"))
+            elif (await conn.execute(text("SELECT EXISTS (SELECT 1 FROM stories)"))).scalar():
+                raise SystemExit("stories is not empty; pass --truncate to replace the corpus")
+
+            raw = await conn.get_raw_connection()
+            pg = raw.driver_connection
+            await register_vector(pg)
+
+            # Partitions for every day in the snapshot, then the rows without
+            # the HNSW indexes: building once at the end is far faster.
+            created = np.fromfile(directory / "stories.created_at.bin", dtype=np.int64)
+            if len(created):
+                first, last = (_EPOCH + timedelta(microseconds=int(m)) for m in (created.min(), created.max()))
+                await ensure_partitions(conn, first.date(), last.date())
+            await conn.execute(text(f"DROP INDEX IF EXISTS {HNSW_INDEX}, {STORY_HNSW_INDEX}"))
+            await conn.commit()
+
+            for table in TABLES:
+                await _copy_table(pg, directory, table.name, manifest)
+            load_seconds = time.perf_counter() - start
+
+            await build_hnsw_index(conn)
+            await bump_corpus_generation(conn)
+            await conn.commit()
+            await conn.execute(text("ANALYZE stories"))
+            await conn.execute(text("ANALYZE chunks"))
+            await conn.commit()
+    finally:
+        await engine.dispose()
+    return {
+        "stories": manifest["tables"]["stories"]["rows"],
+        "chunks": manifest["tables"]["chunks"]["rows"],
+        "embedding_models": models,
+        "load_seconds": round(load_seconds, 1),
+        "index_seconds": round(time.perf_counter() - start - load_seconds, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export or import a corpus snapshot.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write stories and chunks to DIR")
+    export.add_argument("directory", type=Path)
+    export.add_argument("--float16", action="store_true", help="store embeddings as float16 (half the size)")
+    load = commands.add_parser("import", help="load DIR into an empty corpus")
+    load.add_argument("directory", type=Path)
+    load.add_argument("--truncate", action="store_true", help="replace the current stories and chunks")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.command == "export":
+        result = asyncio.run(export_snapshot(args.directory, "float16" if args.float16 else "float32"))
+    else:
+        result = asyncio.run(import_snapshot(args.directory, args.truncate))
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
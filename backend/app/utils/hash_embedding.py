@@ -0,0 +1,31 @@
+import hashlib
+import re
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def token_bucket(token: str, dimensions: int) -> tuple[int, float]:
+    """Dimension and sign a token contributes to in hash_embedding."""
+    h = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+    return h % dimensions, 1.0 if (h >> 63) & 1 else -1.0
+
+
+def hash_embedding(text: str, dimensions: int) -> list[float]:
+    """Deterministic unit vector for a text.
+
+    Feature hashing over lowercase word tokens, so texts that share words land
+    near each other — enough for a search against a fake corpus to return
+    something that looks related. Used by the "hashing" embedding provider and
+    by the stand-in embeddings endpoint in bench/stub_server.py.
+    """
+    vec = np.zeros(dimensions, dtype=np.float32)
+    for token in _TOKEN_RE.findall(text.lower()):
+        index, sign = token_bucket(token, dimensions)
+        vec[index] += sign
+    if not vec.any():
+        seed = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+        vec = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    vec /= np.linalg.norm(vec)
+    return vec.tolist()
@@ -0,0 +1,185 @@
+"""Job worker: runs the ingest and prune jobs the API queues, and index maintenance.
+
+    python -m app.worker          # poll for jobs until SIGTERM
+    python -m app.worker --once   # run whatever is runnable now, then exit
+
+Runs as its own deployment, so ingest never competes with search on an API
+event loop and API pods only serve reads. See app.services.jobs for how jobs
+are claimed, heartbeated and resumed, and app.services.index_health for the
+index_maintenance job the worker queues for itself. On SIGTERM the current
+job is cancelled and handed back to the queue; a backfill loses at most the
+day in progress.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+
+from prometheus_client import start_http_server
+
+from app.config import settings
+from app.database import engine
+from app.migrate import check_schema_version
+from app.services import jobs
+from app.services.embeddings import close_provider
+from app.services.index_health import run_maintenance
+from app.services.ingest import INGEST_STAGES, ingest_daily, ingest_initial, prune_old_stories
+from app.services.metrics import INGEST_JOBS
+from app.services.rate_limit import prune_quota
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LostJob(Exception):
+    """Another worker took the job over after our heartbeat went stale."""
+
+
+async def _run_job(job) -> dict:
+    if job.kind == "prune":
+        result = await prune_old_stories()
+        result["quota_rows_deleted"] = await prune_quota()
+        return result
+    if job.kind == "daily":
+        return await ingest_daily(job.window_start, job.window_end)
+    if job.kind == "index_maintenance":
+        return await run_maintenance()
+
+    # Backfill: carry totals over from earlier attempts and checkpoint each day.
+    totals = job.result or {
+        "stories_fetched": 0, "chunks_created": 0, "stage_seconds": dict.fromkeys(INGEST_STAGES, 0.0)
+    }
+    days_done = job.days_done
+
+    async def on_day(day_start, day: dict) -> None:
+        nonlocal days_done
+        days_done += 1
+        totals["stories_fetched"] += day["stories_fetched"]
+        totals["chunks_created"] += day["chunks_created"]
+        for stage, seconds in day["stage_seconds"].items():
+            totals["stage_seconds"][stage] = round(totals["stage_seconds"].get(stage, 0.0) + seconds, 2)
+        if not await jobs.save_checkpoint(job.id, WORKER_ID, day_start, days_done, totals):
+            raise LostJob
+
+    if job.checkpoint is not None:
+        logger.info("resuming %s job %s below %s (%d/%d days done)",
+                    job.kind, job.id, job.checkpoint.date(), job.days_done, job.days_total)
+    await ingest_initial(job.window_start, job.checkpoint or job.window_end, on_day=on_day)
+    return totals
+
+
+async def _execute(job, stop: asyncio.Event) -> None:
+    logger.info("running %s job %s (attempt %d)", job.kind, job.id, job.attempts)
+    task = asyncio.create_task(_run_job(job))
+    stopping = asyncio.create_task(stop.wait())
+    try:
+        while not task.done():
+            await asyncio.wait({task, stopping}, timeout=settings.job_heartbeat_seconds,
+                               return_when=asyncio.FIRST_COMPLETED)
+            if task.done():
+                break
+            if stop.is_set():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await jobs.release(job.id, WORKER_ID)
+                logger.info("shutting down; %s job %s handed back to the queue", job.kind, job.id)
+                return
+            if not await jobs.heartbeat(job.id, WORKER_ID):
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise LostJob
+    except LostJob:
+        INGEST_JOBS.labels(job.kind, "lost").inc()
+        logger.warning("%s job %s was taken over by another worker", job.kind, job.id)
+        return
+    finally:
+        stopping.cancel()
+
+    try:
+        result = task.result()
+    except LostJob:
+        INGEST_JOBS.labels(job.kind, "lost").inc()
+        logger.warning("%s job %s was taken over by another worker", job.kind, job.id)
+    except Exception as e:
+        logger.exception("%s job %s failed", job.kind, job.id)
+        INGEST_JOBS.labels(job.kind, "failed").inc()
+        await jobs.fail(job.id, WORKER_ID, f"{type(e).__name__}: {e}", job.attempts)
+    else:
+        INGEST_JOBS.labels(job.kind, "succeeded").inc()
+        await jobs.finish(job.id, WORKER_ID, result)
+        logger.info("%s job %s done: %s", job.kind, job.id, result)
+
+
+async def _schedule_maintenance() -> None:
+    """Queue an index_maintenance job when the last one is older than the interval.
+
+    Every worker does this; the one-active-job-per-kind index drops duplicates.
+    """
+    interval = timedelta(minutes=settings.index_check_interval_minutes)
+    last = await jobs.last_created("index_maintenance")
+    if last is None or datetime.now(timezone.utc) - last >= interval:
+        await jobs.enqueue("index_maintenance")
+
+
+async def run_worker(stop: asyncio.Event, once: bool = False) -> None:
+    async with engine.connect() as conn:
+        await check_schema_version(conn)
+    logger.info("worker %s polling for jobs", WORKER_ID)
+    next_schedule = 0.0
+    while not stop.is_set():
+        if not once and settings.index_check_interval_minutes > 0 and time.monotonic() >= next_schedule:
+            next_schedule = time.monotonic() + 60
+            try:
+                await _schedule_maintenance()
+            except Exception as e:
+                logger.warning("scheduling index maintenance failed: %s", e)
+        try:
+            job = await jobs.claim(WORKER_ID)
+        except Exception as e:
+            logger.warning("claiming a job failed: %s", e)
+            job = None
+        if job is not None:
+            if job.attempts > settings.job_max_attempts:
+                # Reclaimed after its worker kept dying mid-run (OOM, eviction).
+                await jobs.fail(job.id, WORKER_ID, "worker lost too many times", job.attempts)
+                continue
+            await _execute(job, stop)
+            continue
+        if once:
+            return
+        try:
+            await asyncio.wait_for(stop.wait(), settings.job_poll_seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _main(once: bool) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await run_worker(stop, once)
+    finally:
+        await close_provider()
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run queued ingest and prune jobs.")
+    parser.add_argument("--once", action="store_true", help="exit when no job is runnable")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if settings.worker_metrics_port:
+        start_http_server(settings.worker_metrics_port)
+    asyncio.run(_main(args.once))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""Helpers shared by the benchmark scripts."""
+
+import json
+import sys
+from pathlib import Path
+
+
+def write_report(report: dict, output: Path | None) -> None:
+    """Print the report as JSON, and also save it when an output path is given."""
+    text = json.dumps(report, indent=2, default=str)
+    print(text)
+    if output is not None:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(text + "\n")
+        print(f"wrote {output}", file=sys.stderr)
+
+
+def percentiles(samples_ms: list[float]) -> dict:
+    """Summary of a latency sample in milliseconds: count, mean, p50/p95/p99, max."""
+    if not samples_ms:
+        return {"count": 0}
+    ordered = sorted(samples_ms)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ordered[-1], 3),
+    }
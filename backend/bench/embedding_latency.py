@@ -0,0 +1,93 @@
+"""Embedding latency per provider.
+
+For each provider: sequential single-text calls (what a search pays),
+concurrent single-text calls (shows the local provider's request coalescing)
+and fixed-size batches (what ingest pays). Reports percentiles in ms as JSON.
+
+    python -m bench.embedding_latency --providers hashing local --requests 200
+    python -m bench.embedding_latency --providers openai --requests 50 --output bench/results/embed.json
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from pathlib import Path
+
+from bench.common import percentiles, write_report
+from app.services.embeddings import create_provider
+
+_WORDS = "postgres vector index latency rust python kernel database cache query planner model".split()
+
+
+def _text(rng: random.Random) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(rng.randint(3, 40)))
+
+
+async def _timed(coro) -> float:
+    start = time.perf_counter()
+    await coro
+    return (time.perf_counter() - start) * 1000
+
+
+async def bench_provider(name: str, requests: int, concurrency: int, batch_size: int) -> dict:
+    rng = random.Random(0)
+    provider = create_provider(name)
+    try:
+        await provider.embed(["warmup"])
+
+        sequential = [await _timed(provider.embed([_text(rng)])) for _ in range(requests)]
+
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one() -> float:
+            async with sem:
+                return await _timed(provider.embed([_text(rng)]))
+
+        start = time.perf_counter()
+        concurrent = await asyncio.gather(*(one() for _ in range(requests)))
+        concurrent_wall = time.perf_counter() - start
+
+        batches = [
+            await _timed(provider.embed([_text(rng) for _ in range(batch_size)]))
+            for _ in range(max(1, requests // batch_size))
+        ]
+    finally:
+        await provider.close()
+
+    return {
+        "model_id": provider.model_id,
+        "single_ms": percentiles(sequential),
+        "concurrent_ms": percentiles(list(concurrent)),
+        "concurrent_per_s": round(requests / concurrent_wall, 1),
+        "batch_ms": percentiles(batches),
+        "batch_size": batch_size,
+    }
+
+
+async def run(providers: list[str], requests: int, concurrency: int, batch_size: int) -> dict:
+    results = {}
+    for name in providers:
+        results[name] = await bench_provider(name, requests, concurrency, batch_size)
+    return {
+        "benchmark": "embedding_latency",
+        "requests": requests,
+        "concurrency": concurrency,
+        "providers": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--providers", nargs="+", default=["hashing"], choices=("openai", "local", "hashing"))
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+    report = asyncio.run(run(args.providers, args.requests, args.concurrency, args.batch_size))
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Hot-query latency: SQLAlchemy sessions vs the asyncpg fast path.
+
+Runs the data-access calls behind search, story pages, related stories and
+the quota flush with a fixed concurrency, once per access mode:
+
+    session   SQLAlchemy session + text(), statement_cache_size=0 (the default)
+    unnamed   asyncpg pool, protocol-level unnamed statements
+    prepared  asyncpg pool with the named statement cache
+
+"prepared" is skipped with a note if the probe shows the pooler in front of
+the database cannot keep named statements (PgBouncer < 1.21, or without
+max_prepared_statements). Run it against the same endpoint production uses,
+since the PgBouncer hop is most of what this measures. Needs a corpus, e.g.
+from bench/synth_corpus.py:
+
+    python -m bench.fastpath --iterations 2000 --concurrency 8 --output bench/results/fastpath.json
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+# Query vectors come from the hashing provider, like the synthetic corpus.
+os.environ.setdefault("EMBEDDING_PROVIDER", "hashing")
+# Bring a scratch database up to the current schema.
+os.environ.setdefault("MIGRATE_ON_STARTUP", "true")
+
+from app.config import settings  # noqa: E402
+from app.main import app, lifespan  # noqa: E402
+from app.services import fastpath  # noqa: E402
+from app.services.embeddings import generate_embeddings  # noqa: E402
+from app.services.rate_limit import _FLUSH_SQL  # noqa: E402
+from app.services.stories import load_story, story_id_for_slug  # noqa: E402
+from app.services.vector_search import find_related_stories, search_hn  # noqa: E402
+from bench.common import percentiles, write_report  # noqa: E402
+from bench.synth_corpus import TopicText  # noqa: E402
+
+QUERIES = ("search", "story", "related", "quota")
+BENCH_IP_PREFIX = "bench-fastpath-"
+
+
+async def _run_mode(args, vectors: list[list[float]], slugs: list[str], story_ids: list[str]) -> dict:
+    today = datetime.now(timezone.utc).date()
+
+    async def one(name: str, rng: random.Random) -> None:
+        if name == "search":
+            await search_hn(rng.choice(vectors), top_k=args.top_k, threshold=settings.similarity_threshold)
+        elif name == "story":
+            await load_story(rng.choice(slugs))
+        elif name == "related":
+            await find_related_stories(rng.choice(story_ids), 5)
+        else:
+            await fastpath.fetch(_FLUSH_SQL, {
+                "ips": [f"{BENCH_IP_PREFIX}{rng.randrange(1000)}"],
+                "days": [today],
+                "deltas": [1],
+            })
+
+    results = {}
+    for name in args.queries:
+        latencies: list[float] = []
+        remaining = args.iterations + args.warmup
+
+        async def worker(worker_id: int) -> None:
+            nonlocal remaining
+            rng = random.Random(args.seed + worker_id)
+            while remaining > 0:
+                remaining -= 1
+                warm = remaining >= args.iterations
+                start = time.perf_counter()
+                await one(name, rng)
+                if not warm:
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+        wall = time.perf_counter() - start
+        results[name] = {"ops_per_second": round(len(latencies) / wall, 1), "latency_ms": percentiles(latencies)}
+    return results
+
+
+async def run(args) -> dict:
+    topics = TopicText(args.topics, settings.embedding_dimensions, args.seed)
+    np_rng = np.random.default_rng(args.seed)
+    vectors = await generate_embeddings([topics.query(np_rng) for _ in range(200)])
+
+    modes: dict[str, dict] = {}
+    notes = []
+    async with lifespan(app):
+        # The lifespan may already have opened the pool; every mode starts clean.
+        await fastpath.stop_fast_path()
+        rows = await fastpath.fetch("SELECT slug FROM stories TABLESAMPLE SYSTEM (1) LIMIT 500")
+        if len(rows) < 50:
+            rows = await fastpath.fetch("SELECT slug FROM stories LIMIT 500")
+        if not rows:
+            raise SystemExit("no stories; load a corpus first (python -m bench.synth_corpus)")
+        slugs = [r.slug for r in rows]
+        story_ids = [str(await story_id_for_slug(s)) for s in slugs[:100]]
+
+        enabled = settings.db_fast_path
+        settings.db_fast_path = True
+        try:
+            for mode in args.modes:
+                if mode != "session":
+                    await fastpath.start_fast_path(prepared="on" if mode == "prepared" else "off")
+                    if mode == "prepared" and not await fastpath._probe(fastpath._pool):
+                        notes.append("named prepared statements do not survive this pooler; prepared mode skipped")
+                        await fastpath.stop_fast_path()
+                        continue
+                modes[mode] = await _run_mode(args, vectors, slugs, story_ids)
+                await fastpath.stop_fast_path()
+        finally:
+            settings.db_fast_path = enabled
+            await fastpath.fetch("DELETE FROM search_quota WHERE client_ip LIKE :prefix", {"prefix": f"{BENCH_IP_PREFIX}%"})
+
+    baseline = modes.get("session")
+    speedup = {}
+    if baseline:
+        for mode, result in modes.items():
+            if mode != "session":
+                speedup[mode] = {
+                    q: round(baseline[q]["latency_ms"]["p50"] / result[q]["latency_ms"]["p50"], 2)
+                    for q in result
+                    if result[q]["latency_ms"].get("p50")
+                }
+    return {
+        "benchmark": "fastpath",
+        "iterations": args.iterations,
+        "concurrency": args.concurrency,
+        "modes": modes,
+        "p50_speedup_vs_session": speedup,
+        "notes": notes,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1000, help="measured calls per query and mode")
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--queries", nargs="+", choices=QUERIES, default=list(QUERIES))
+    parser.add_argument("--modes", nargs="+", choices=("session", "unnamed", "prepared"),
+                        default=["session", "unnamed", "prepared"])
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--topics", type=int, default=500, help="must match the synth_corpus run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+    write_report(asyncio.run(run(args)), args.output)
+
+
+if __name__ == "__main__":
+    main()
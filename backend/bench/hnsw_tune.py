@@ -0,0 +1,171 @@
+"""HNSW recall/latency evaluation and parameter recommendation.
+
+Copies a sample of chunk embeddings (or synthetic clustered vectors) into a
+scratch table, computes exact top-k neighbours for a set of held-out query
+vectors with a sequential scan, then for every m / ef_construction pair builds
+an HNSW index and measures recall@k and query latency at each ef_search.
+
+It recommends the lowest-p95 setting that meets the target recall and prints
+it as HNSW_M / HNSW_EF_CONSTRUCTION / HNSW_EF_SEARCH for the backend's env.
+The production chunks table and its index are only read, never modified.
+
+    python -m bench.hnsw_tune --sample 200000 --queries 200 --target-recall 0.95
+    python -m bench.hnsw_tune --synthetic --sample 100000 --m 8 16 32 --ef-search 20 40 80
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+from pgvector.asyncpg import register_vector
+
+from bench.common import percentiles, write_report
+from app.config import settings
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+SCRATCH = "hnsw_tune_vectors"
+
+
+def _synthetic(n: int, dimensions: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    vecs = centroids[rng.integers(clusters, size=n)] + 0.6 * rng.standard_normal((n, dimensions)).astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+async def _load_sample(pg, sample: int, queries: int, synthetic: bool, seed: int) -> np.ndarray:
+    """Fill the scratch table and return the held-out query vectors."""
+    dims = settings.embedding_dimensions
+    await pg.execute(f"DROP TABLE IF EXISTS {SCRATCH}")
+    await pg.execute(f"CREATE UNLOGGED TABLE {SCRATCH} (id bigint PRIMARY KEY, embedding vector({dims}))")
+
+    if synthetic:
+        rng = np.random.default_rng(seed)
+        vecs = _synthetic(sample + queries, dims, clusters=max(10, sample // 500), rng=rng)
+        await pg.copy_records_to_table(
+            SCRATCH, records=((i, v) for i, v in enumerate(vecs[:sample])), columns=["id", "embedding"]
+        )
+        return vecs[sample:]
+
+    total = await pg.fetchval("SELECT reltuples::bigint FROM pg_class WHERE relname = 'chunks'")
+    percent = min(100.0, 100.0 * (sample + queries) * 1.5 / max(total or 1, 1))
+    rows = await pg.fetch(
+        f"SELECT embedding FROM chunks TABLESAMPLE BERNOULLI ({percent}) REPEATABLE ({seed}) LIMIT $1",
+        sample + queries,
+    )
+    if len(rows) < sample + queries:
+        raise SystemExit(f"only {len(rows)} chunks available; lower --sample or --queries")
+    # Queries are real chunk vectors that are not in the indexed sample, so the
+    # exact nearest neighbour is never the query itself.
+    await pg.copy_records_to_table(
+        SCRATCH, records=((i, r["embedding"]) for i, r in enumerate(rows[:sample])), columns=["id", "embedding"]
+    )
+    return np.array([r["embedding"] for r in rows[sample:]], dtype=np.float32)
+
+
+async def _top_k(pg, query: np.ndarray, k: int) -> list[int]:
+    rows = await pg.fetch(f"SELECT id FROM {SCRATCH} ORDER BY embedding <=> $1 LIMIT $2", query, k)
+    return [r["id"] for r in rows]
+
+
+async def run(args) -> dict:
+    async with engine.connect() as conn:
+        raw = await conn.get_raw_connection()
+        pg = raw.driver_connection
+        await register_vector(pg)
+        await pg.execute("SET maintenance_work_mem = '2GB'")
+
+        queries = await _load_sample(pg, args.sample, args.queries, args.synthetic, args.seed)
+        await pg.execute(f"ANALYZE {SCRATCH}")
+
+        # Ground truth before any index exists, so this is an exact scan.
+        start = time.perf_counter()
+        truth = [set(await _top_k(pg, q, args.k)) for q in queries]
+        exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        results = []
+        for m, ef_construction in itertools.product(args.m, args.ef_construction):
+            await pg.execute(f"DROP INDEX IF EXISTS {SCRATCH}_hnsw")
+            start = time.perf_counter()
+            await pg.execute(
+                f"CREATE INDEX {SCRATCH}_hnsw ON {SCRATCH} USING hnsw (embedding vector_cosine_ops) "
+                f"WITH (m = {m}, ef_construction = {ef_construction})"
+            )
+            build_seconds = time.perf_counter() - start
+            index_bytes = await pg.fetchval(f"SELECT pg_relation_size('{SCRATCH}_hnsw')")
+
+            for ef_search in args.ef_search:
+                if ef_search < args.k:
+                    continue
+                await pg.execute(f"SET hnsw.ef_search = {ef_search}")
+                latencies, recalls = [], []
+                for q, expected in zip(queries, truth):
+                    start = time.perf_counter()
+                    found = await _top_k(pg, q, args.k)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    recalls.append(len(expected.intersection(found)) / args.k)
+                result = {
+                    "m": m,
+                    "ef_construction": ef_construction,
+                    "ef_search": ef_search,
+                    "recall": round(float(np.mean(recalls)), 4),
+                    "recall_p5": round(float(np.percentile(recalls, 5)), 4),
+                    "latency_ms": percentiles(latencies),
+                    "build_seconds": round(build_seconds, 2),
+                    "index_mb": round(index_bytes / 2**20, 1),
+                }
+                logger.warning("m=%d efc=%d ef=%d recall=%.3f p95=%.2fms", m, ef_construction, ef_search,
+                               result["recall"], result["latency_ms"]["p95"])
+                results.append(result)
+
+        await pg.execute("RESET hnsw.ef_search")
+        if not args.keep:
+            await pg.execute(f"DROP TABLE {SCRATCH}")
+
+    meeting = [r for r in results if r["recall"] >= args.target_recall]
+    best = min(meeting, key=lambda r: (r["latency_ms"]["p95"], r["build_seconds"])) if meeting else None
+    return {
+        "benchmark": "hnsw_tune",
+        "source": "synthetic" if args.synthetic else "chunks",
+        "sample": args.sample,
+        "queries": args.queries,
+        "k": args.k,
+        "target_recall": args.target_recall,
+        "exact_scan_ms": round(exact_ms, 2),
+        "current": {"m": settings.hnsw_m, "ef_construction": settings.hnsw_ef_construction,
+                    "ef_search": settings.hnsw_ef_search or 40},
+        "recommendation": best and {
+            **best,
+            "env": {"HNSW_M": best["m"], "HNSW_EF_CONSTRUCTION": best["ef_construction"],
+                    "HNSW_EF_SEARCH": best["ef_search"]},
+        },
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sample", type=int, default=100_000, help="vectors in the scratch index")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=settings.top_k)
+    parser.add_argument("--m", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--ef-construction", type=int, nargs="+", default=[64, 128])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[10, 20, 40, 80, 160, 320])
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--synthetic", action="store_true", help="clustered random vectors instead of chunks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help=f"leave the {SCRATCH} table behind")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(message)s")
+    write_report(asyncio.run(run(args)), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Ingest throughput benchmark.
+
+Runs the real ingest pipeline day by day over a fixed window, so repeated runs
+see the same stories, and reports stories/s, chunks/s and seconds per stage.
+Meant to run against bench/stub_server.py and a scratch database:
+
+    python -m bench.stub_server --mode replay --fixtures bench/fixtures &
+    HN_SEARCH_URL=http://localhost:9100/api/v1/search_by_date \\
+    HN_ITEM_URL=http://localhost:9100/api/v1/items \\
+    OPENAI_BASE_URL=http://localhost:9100/v1 \\
+    python -m bench.ingest_throughput --days 3 --end 2026-10-01 --truncate
+
+--truncate empties stories and chunks first; without it, stories already in the
+database are skipped and the run measures mostly the fetch stages.
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy import text
+
+from bench.common import write_report
+from app.config import settings
+from app.database import engine
+from app.main import app, lifespan
+from app.migrate import run_migrations
+from app.services.ingest import INGEST_STAGES, ingest_one_day
+
+
+async def run(days: int, end: datetime, truncate: bool) -> dict:
+    await run_migrations()
+    async with lifespan(app):
+        if truncate:
+            async with engine.begin() as conn:
+                await conn.execute(text("TRUNCATE stories, chunks"))
+
+        stages = dict.fromkeys(INGEST_STAGES, 0.0)
+        stories = chunks = 0
+        per_day = []
+        start = time.perf_counter()
+        for i in range(days):
+            day_end = end - timedelta(days=i)
+            day_start = day_end - timedelta(days=1)
+            day_t0 = time.perf_counter()
+            result = await ingest_one_day(day_start, day_end)
+            stories += result["stories_fetched"]
+            chunks += result["chunks_created"]
+            for stage, seconds in result["stage_seconds"].items():
+                stages[stage] += seconds
+            per_day.append({
+                "day": day_start.date().isoformat(),
+                "stories": result["stories_fetched"],
+                "chunks": result["chunks_created"],
+                "seconds": round(time.perf_counter() - day_t0, 3),
+            })
+        wall = time.perf_counter() - start
+
+    return {
+        "benchmark": "ingest_throughput",
+        "hn_search_url": settings.hn_search_url,
+        "openai_base_url": settings.openai_base_url,
+        "embedding_batch_size": settings.embedding_batch_size,
+        "embedding_batch_max_tokens": settings.embedding_batch_max_tokens,
+        "chunk_max_tokens": settings.chunk_max_tokens,
+        "days": days,
+        "stories": stories,
+        "chunks": chunks,
+        "wall_seconds": round(wall, 3),
+        "stories_per_s": round(stories / wall, 2) if wall else 0.0,
+        "chunks_per_s": round(chunks / wall, 2) if wall else 0.0,
+        "stage_seconds": {k: round(v, 3) for k, v in stages.items()},
+        "per_day": per_day,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--end", type=lambda s: datetime.fromisoformat(s).replace(tzinfo=timezone.utc),
+                        default=datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0),
+                        help="end of the window (UTC date), default today 00:00")
+    parser.add_argument("--truncate", action="store_true", help="empty stories and chunks before the run")
+    parser.add_argument("--output", type=Path, help="also write the JSON report here")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(run(args.days, args.end, args.truncate))
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Concurrent load test for the read endpoints.
+
+Drives /api/search, /story/{slug} and /api/stories/{slug}/related with a fixed
+number of concurrent clients for a fixed duration and reports throughput and
+p50/p95/p99 per endpoint as JSON, so runs can be diffed.
+
+By default the app runs in-process (ASGI transport) with the hashing embedding
+provider and the per-IP search cap lifted, so the numbers measure this
+service and Postgres, not OpenAI. Use --base-url to hit a running server
+instead. Pair with bench/synth_corpus.py:
+
+    python -m bench.synth_corpus --chunks 1000000 --truncate
+    python -m bench.load_test --concurrency 32 --duration 60 --output bench/results/1m.json
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+# Stubbed embeddings and no spend cap, unless the caller set them explicitly.
+# Set before app.config reads the environment.
+os.environ.setdefault("EMBEDDING_PROVIDER", "hashing")
+os.environ.setdefault("SEARCH_RATE_LIMIT_PER_DAY", str(10**9))
+# Bring a scratch database up to the current schema.
+os.environ.setdefault("MIGRATE_ON_STARTUP", "true")
+
+from sqlalchemy import text  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import async_session  # noqa: E402
+from app.main import app, lifespan  # noqa: E402
+from bench.common import percentiles, write_report  # noqa: E402
+from bench.synth_corpus import TopicText  # noqa: E402
+
+ENDPOINTS = ("search", "story", "related")
+
+
+def _parse_mix(raw: str) -> dict[str, float]:
+    mix = {}
+    for part in raw.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name!r}")
+        mix[name] = float(weight)
+    return mix
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def _sample_slugs(n: int) -> list[str]:
+    async with async_session() as session:
+        result = await session.execute(
+            text("SELECT slug FROM stories TABLESAMPLE SYSTEM (1) LIMIT :n"), {"n": n}
+        )
+        slugs = [r.slug for r in result]
+        if len(slugs) < n:
+            result = await session.execute(text("SELECT slug FROM stories LIMIT :n"), {"n": n})
+            slugs = [r.slug for r in result]
+    return slugs
+
+
+async def _drive(client: httpx.AsyncClient, mix: dict[str, float], slugs: list[str], topics: TopicText,
+                 concurrency: int, duration: float, top_k: int, seed: int) -> dict:
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    statuses: dict[str, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_id: int) -> None:
+        rng = random.Random(seed + worker_id)
+        np_rng = np.random.default_rng(seed + worker_id)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            slug = rng.choice(slugs)
+            # A distinct client address per request keeps everyone off one quota row.
+            headers = {"X-Forwarded-For": f"10.{worker_id % 256}.{rng.randrange(256)}.{rng.randrange(256)}"}
+            start = time.perf_counter()
+            try:
+                if name == "search":
+                    response = await client.post(
+                        "/api/search", json={"query": topics.query(np_rng), "top_k": top_k}, headers=headers
+                    )
+                elif name == "story":
+                    response = await client.get(f"/story/{slug}", headers=headers)
+                else:
+                    response = await client.get(f"/api/stories/{slug}/related", headers=headers)
+            except httpx.HTTPError:
+                errors[name] += 1
+                continue
+            latencies[name].append((time.perf_counter() - start) * 1000)
+            statuses[name][response.status_code] += 1
+            if response.status_code >= 400:
+                errors[name] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    wall = time.perf_counter() - start
+
+    endpoints = {}
+    for name in names:
+        count = len(latencies[name])
+        endpoints[name] = {
+            "requests": count,
+            "errors": errors[name],
+            "statuses": dict(statuses[name]),
+            "throughput_rps": round(count / wall, 2),
+            "latency_ms": percentiles(latencies[name]),
+        }
+    total = sum(len(v) for v in latencies.values())
+    return {
+        "wall_seconds": round(wall, 2),
+        "throughput_rps": round(total / wall, 2),
+        "endpoints": endpoints,
+    }
+
+
+async def run(args) -> dict:
+    topics = TopicText(args.topics, settings.embedding_dimensions, args.seed)
+    if args.base_url:
+        slugs = await _sample_slugs(args.slugs)
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=60.0) as client:
+            stats = (await client.get("/api/stats")).json()
+            result = await _drive(client, args.mix, slugs, topics, args.concurrency, args.duration, args.top_k, args.seed)
+    else:
+        async with lifespan(app):
+            slugs = await _sample_slugs(args.slugs)
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60.0) as client:
+                stats = (await client.get("/api/stats")).json()
+                if args.warmup:
+                    await _drive(client, args.mix, slugs, topics, args.concurrency, args.warmup, args.top_k, args.seed + 1)
+                result = await _drive(client, args.mix, slugs, topics, args.concurrency, args.duration, args.top_k, args.seed)
+
+    return {
+        "benchmark": "load_test",
+        "revision": _git_revision(),
+        "target": args.base_url or "in-process",
+        "embedding_provider": settings.embedding_provider,
+        "corpus": {"stories": stats.get("total_stories"), "chunks": stats.get("total_chunks")},
+        "concurrency": args.concurrency,
+        "duration_seconds": args.duration,
+        "mix": args.mix,
+        **result,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="hit a running server instead of the in-process app")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of measured load")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds of unmeasured load first (in-process only)")
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix("search=0.5,story=0.3,related=0.2"))
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--slugs", type=int, default=2000, help="story slugs to sample for story/related requests")
+    parser.add_argument("--topics", type=int, default=500, help="must match the synth_corpus run")
+    parser.add_argument("--seed", type=int, default=0, help="must match the synth_corpus run")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+    write_report(asyncio.run(run(args)), args.output)
+
+
+if __name__ == "__main__":
+    main()
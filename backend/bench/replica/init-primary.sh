@@ -0,0 +1,8 @@
+#!/bin/bash
+# Replication role and pg_hba entry for the replica's pg_basebackup / WAL stream.
+set -e
+psql -v ON_ERROR_STOP=1 -U "$POSTGRES_USER" -d "$POSTGRES_DB" <<SQL
+CREATE ROLE replicator WITH REPLICATION LOGIN PASSWORD 'replicator';
+CREATE EXTENSION IF NOT EXISTS vector;
+SQL
+echo "host replication replicator all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -0,0 +1,348 @@
+"""Local stand-ins for the Algolia HN API and the OpenAI embeddings endpoint.
+
+Lets ingest and search run (and be benchmarked) without touching Algolia or
+OpenAI. Three modes for the HN endpoints:
+
+    synthetic  deterministic fake stories and comments for any time window
+    record     proxy to the real Algolia API and save every response as a fixture
+    replay     serve previously recorded fixtures, filtered like Algolia would
+
+The embeddings endpoint is always fake: each text maps to a fixed unit vector,
+so the same input embeds identically across runs.
+
+    python -m bench.stub_server --mode synthetic --port 9100
+    python -m bench.stub_server --mode record --fixtures bench/fixtures
+    python -m bench.stub_server --mode replay --fixtures bench/fixtures --hn-latency-ms 80
+
+Then point the backend at it:
+
+    HN_SEARCH_URL=http://localhost:9100/api/v1/search_by_date
+    HN_ITEM_URL=http://localhost:9100/api/v1/items
+    OPENAI_BASE_URL=http://localhost:9100/v1
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import random
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+import httpx
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+
+from app.utils.hash_embedding import hash_embedding
+
+logger = logging.getLogger(__name__)
+
+ALGOLIA_BASE = "https://hn.algolia.com/api/v1"
+
+_NUMERIC_FILTER_RE = re.compile(r"(\w+)(>=|<=|>|<|=)(-?\d+)")
+
+_WORDS = (
+    "postgres index latency vector search rust python kernel compiler startup "
+    "funding database memory cache queue model embedding query planner cluster "
+    "browser network protocol storage open source license hiring remote team "
+    "benchmark performance security privacy llm agent gpu training inference"
+).split()
+
+
+@dataclass
+class StubConfig:
+    mode: str = "synthetic"
+    fixtures: Path = Path("bench/fixtures")
+    stories_per_day: int = 200
+    max_comments: int = 40
+    hn_latency_ms: float = 0.0
+    hn_error_rate: float = 0.0
+    embed_latency_ms: float = 0.0
+    embed_error_rate: float = 0.0
+    dimensions: int = 1536
+
+
+def _parse_numeric_filters(raw: str) -> list[tuple[str, str, int]]:
+    return [(m[0], m[1], int(m[2])) for m in _NUMERIC_FILTER_RE.findall(raw or "")]
+
+
+def _matches(hit: dict, filters: list[tuple[str, str, int]]) -> bool:
+    for field, op, value in filters:
+        actual = hit.get(field)
+        if actual is None:
+            return False
+        if op == ">" and not actual > value:
+            return False
+        if op == ">=" and not actual >= value:
+            return False
+        if op == "<" and not actual < value:
+            return False
+        if op == "<=" and not actual <= value:
+            return False
+        if op == "=" and not actual == value:
+            return False
+    return True
+
+
+def _bounds(filters: list[tuple[str, str, int]], field: str, lo: int, hi: int) -> tuple[int, int]:
+    for f, op, value in filters:
+        if f != field:
+            continue
+        if op in (">", ">="):
+            lo = max(lo, value)
+        elif op in ("<", "<="):
+            hi = min(hi, value)
+    return lo, hi
+
+
+def _seeded(*parts: object) -> random.Random:
+    key = ":".join(str(p) for p in parts).encode()
+    return random.Random(int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little"))
+
+
+def _sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(n))
+
+
+class SyntheticHN:
+    """Fake Algolia data that is a pure function of the requested window.
+
+    Time is cut into fixed slots of 86400 / stories_per_day seconds with one
+    story per slot, so overlapping windows agree on which stories exist and a
+    story keeps the same id on every run.
+    """
+
+    _ID_BASE = 40_000_000
+
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self.slot = max(1, 86400 // max(1, config.stories_per_day))
+
+    def _hit(self, slot_index: int) -> dict:
+        rng = _seeded("story", slot_index)
+        hn_id = self._ID_BASE + slot_index
+        kind = rng.random()
+        if kind < 0.08:
+            title = f"Ask HN: {_sentence(rng, 6).capitalize()}?"
+            story_text = "<p>" + "</p><p>".join(_sentence(rng, rng.randint(20, 120)) for _ in range(rng.randint(1, 4))) + "</p>"
+            url = None
+        elif kind < 0.16:
+            title = f"Show HN: {_sentence(rng, 5).capitalize()}"
+            story_text = "<p>" + _sentence(rng, rng.randint(20, 80)) + "</p>"
+            url = f"https://example.com/show/{hn_id}"
+        else:
+            title = _sentence(rng, rng.randint(4, 10)).capitalize()
+            story_text = None
+            url = f"https://example.com/{hn_id}"
+        return {
+            "objectID": str(hn_id),
+            "title": title,
+            "url": url,
+            "author": f"user{rng.randint(1, 5000)}",
+            "points": int(rng.paretovariate(1.2) * 5),
+            "num_comments": rng.randint(0, self.config.max_comments * 3),
+            "story_text": story_text,
+            "created_at_i": slot_index * self.slot + rng.randrange(self.slot),
+        }
+
+    def search(self, filters: list[tuple[str, str, int]]) -> list[dict]:
+        lo, hi = _bounds(filters, "created_at_i", 0, 2**31)
+        hits = []
+        for slot_index in range(lo // self.slot, hi // self.slot + 1):
+            hit = self._hit(slot_index)
+            if _matches(hit, filters):
+                hits.append(hit)
+        hits.sort(key=lambda h: h["created_at_i"], reverse=True)
+        return hits
+
+    def item(self, hn_id: int) -> dict | None:
+        slot_index = hn_id - self._ID_BASE
+        if slot_index < 0:
+            return None
+        story = self._hit(slot_index)
+        rng = _seeded("comments", hn_id)
+        children = [
+            {
+                "id": hn_id * 100 + i,
+                "author": f"user{rng.randint(1, 5000)}",
+                "text": "<p>" + _sentence(rng, rng.randint(5, 150)) + "</p>",
+                "children": [],
+            }
+            for i in range(rng.randint(0, self.config.max_comments))
+        ]
+        return {"id": hn_id, "title": story["title"], "children": children}
+
+
+class RecordedHN:
+    """Replays fixtures saved by record mode.
+
+    Search hits are kept in one pool and filtered per request rather than keyed
+    by exact query, because ingest windows are derived from the current time and
+    never repeat exactly.
+    """
+
+    def __init__(self, fixtures: Path):
+        self.fixtures = fixtures
+        self.items_dir = fixtures / "items"
+        self.hits_path = fixtures / "hits.jsonl"
+        self.hits: dict[str, dict] = {}
+        if self.hits_path.exists():
+            with self.hits_path.open() as f:
+                for line in f:
+                    if line.strip():
+                        hit = json.loads(line)
+                        self.hits[hit["objectID"]] = hit
+        logger.info("loaded %d recorded hits from %s", len(self.hits), fixtures)
+
+    def search(self, filters: list[tuple[str, str, int]]) -> list[dict]:
+        hits = [h for h in self.hits.values() if _matches(h, filters)]
+        hits.sort(key=lambda h: h["created_at_i"], reverse=True)
+        return hits
+
+    def item(self, hn_id: int) -> dict | None:
+        path = self.items_dir / f"{hn_id}.json"
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+    def save_hits(self, hits: list[dict]) -> None:
+        self.fixtures.mkdir(parents=True, exist_ok=True)
+        new = [h for h in hits if h["objectID"] not in self.hits]
+        if not new:
+            return
+        with self.hits_path.open("a") as f:
+            for hit in new:
+                self.hits[hit["objectID"]] = hit
+                f.write(json.dumps(hit) + "\n")
+
+    def save_item(self, hn_id: int, data: dict) -> None:
+        self.items_dir.mkdir(parents=True, exist_ok=True)
+        (self.items_dir / f"{hn_id}.json").write_text(json.dumps(data))
+
+
+async def _inject(latency_ms: float, error_rate: float) -> None:
+    if latency_ms > 0:
+        # Exponential around the mean gives the long tail real upstreams have.
+        await asyncio.sleep(random.expovariate(1.0 / latency_ms) / 1000)
+    if error_rate > 0 and random.random() < error_rate:
+        raise HTTPException(status_code=503, detail="injected failure")
+
+
+def create_app(config: StubConfig) -> FastAPI:
+    app = FastAPI(title="HN Search upstream stand-in")
+    synthetic = SyntheticHN(config)
+    recorded = RecordedHN(config.fixtures) if config.mode in ("record", "replay") else None
+    upstream = httpx.AsyncClient(timeout=30.0) if config.mode == "record" else None
+
+    @app.get("/api/v1/search_by_date")
+    async def search_by_date(request: Request):
+        await _inject(config.hn_latency_ms, config.hn_error_rate)
+        params = dict(request.query_params)
+
+        if upstream is not None:
+            response = await upstream.get(f"{ALGOLIA_BASE}/search_by_date", params=params)
+            response.raise_for_status()
+            data = response.json()
+            recorded.save_hits(data.get("hits", []))
+            return data
+
+        filters = _parse_numeric_filters(params.get("numericFilters", ""))
+        hits = (recorded or synthetic).search(filters)
+        per_page = int(params.get("hitsPerPage", 20))
+        page = int(params.get("page", 0))
+        nb_pages = (len(hits) + per_page - 1) // per_page
+        return {
+            "hits": hits[page * per_page : (page + 1) * per_page],
+            "nbHits": len(hits),
+            "page": page,
+            "nbPages": nb_pages,
+            "hitsPerPage": per_page,
+        }
+
+    @app.get("/api/v1/items/{hn_id}")
+    async def item(hn_id: int):
+        await _inject(config.hn_latency_ms, config.hn_error_rate)
+
+        if upstream is not None:
+            response = await upstream.get(f"{ALGOLIA_BASE}/items/{hn_id}")
+            response.raise_for_status()
+            data = response.json()
+            recorded.save_item(hn_id, data)
+            return data
+
+        data = (recorded or synthetic).item(hn_id)
+        if data is None:
+            raise HTTPException(status_code=404, detail="not recorded")
+        return data
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        await _inject(config.embed_latency_ms, config.embed_error_rate)
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = body.get("dimensions") or config.dimensions
+
+        data = []
+        for index, text in enumerate(inputs):
+            vector = hash_embedding(text, dimensions)
+            if body.get("encoding_format") == "base64":
+                # The OpenAI SDK asks for base64 float32 by default and decodes it.
+                embedding = base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode()
+            else:
+                embedding = vector
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+
+        tokens = sum(len(t.split()) for t in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "stub"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    @app.on_event("shutdown")
+    async def close_upstream():
+        if upstream is not None:
+            await upstream.aclose()
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--mode", choices=("synthetic", "record", "replay"), default="synthetic")
+    parser.add_argument("--fixtures", type=Path, default=StubConfig.fixtures)
+    parser.add_argument("--stories-per-day", type=int, default=StubConfig.stories_per_day)
+    parser.add_argument("--max-comments", type=int, default=StubConfig.max_comments)
+    parser.add_argument("--hn-latency-ms", type=float, default=0.0, help="mean added latency for HN endpoints")
+    parser.add_argument("--hn-error-rate", type=float, default=0.0, help="fraction of HN requests answered with 503")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--embed-error-rate", type=float, default=0.0)
+    parser.add_argument("--dimensions", type=int, default=StubConfig.dimensions)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        mode=args.mode,
+        fixtures=args.fixtures,
+        stories_per_day=args.stories_per_day,
+        max_comments=args.max_comments,
+        hn_latency_ms=args.hn_latency_ms,
+        hn_error_rate=args.hn_error_rate,
+        embed_latency_ms=args.embed_latency_ms,
+        embed_error_rate=args.embed_error_rate,
+        dimensions=args.dimensions,
+    )
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""Generate a synthetic corpus straight into Postgres for load testing.
+
+Stories get a title chunk, sometimes a story_text chunk and a long-tailed
+number of comment chunks, roughly the mix real ingest produces. Text is drawn
+from per-topic vocabularies and embedded with the same feature hashing as the
+"hashing" embedding provider, so vectors come out clustered by topic and
+searches run with EMBEDDING_PROVIDER=hashing find genuinely similar chunks.
+
+Day partitions for the spread are created first, rows go in with binary COPY
+and the HNSW indexes are built once at the end, one graph per partition.
+
+With --snapshot DIR the corpus is written to DIR as an app.snapshot snapshot
+after generating it, or, when DIR already holds one, loaded from it instead,
+so every benchmark run can start from exactly the same rows.
+
+    python -m bench.synth_corpus --chunks 1000000 --truncate
+    python -m bench.synth_corpus --chunks 1000000 --truncate --snapshot /data/bench-1m
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from pgvector.asyncpg import register_vector
+
+# The corpus is embedded with the hashing provider; the app must agree or it
+# refuses the corpus as mixed. Set before app.config reads the environment.
+os.environ.setdefault("EMBEDDING_PROVIDER", "hashing")
+# Bring a scratch database up to the current schema.
+os.environ.setdefault("MIGRATE_ON_STARTUP", "true")
+
+from app.config import settings  # noqa: E402
+from app.database import engine  # noqa: E402
+from app.main import app, lifespan  # noqa: E402
+from app.models import generate_slug  # noqa: E402
+from app.snapshot import build_hnsw_index, export_snapshot, import_snapshot  # noqa: E402
+from app.services.partitions import ensure_partitions  # noqa: E402
+from app.services.query_cache import bump_corpus_generation  # noqa: E402
+from app.services.vector_search import HNSW_INDEX, STORY_HNSW_INDEX, story_vector  # noqa: E402
+from app.utils.hash_embedding import token_bucket  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+_SYLLABLES = "ka lo mi ne ru ta vo shi ze pa qu dra fen gor lin mak pri sol tek vin".split()
+
+# Per story. Comment counts are capped like hn_max_comments_per_story.
+STORY_TEXT_RATE = 0.12
+MEAN_COMMENTS = 12
+
+STORY_COLUMNS = [
+    "id", "hn_id", "title", "url", "author", "score", "num_comments",
+    "story_text", "slug", "story_type", "created_at", "fetched_at", "embedding",
+]
+CHUNK_COLUMNS = [
+    "id", "story_id", "content", "chunk_type", "author", "embedding", "embedding_model", "created_at",
+    "story_created_at",
+]
+
+
+class TopicText:
+    """Deterministic topic-clustered text and its hashing-provider embedding."""
+
+    def __init__(self, topics: int, dimensions: int, seed: int = 0, vocab_size: int = 4000, topic_words: int = 60):
+        rng = np.random.default_rng(seed)
+        words = set()
+        while len(words) < vocab_size:
+            words.add("".join(rng.choice(_SYLLABLES, size=rng.integers(2, 4))))
+        self.vocab = np.array(sorted(words))
+        self.topics = [rng.choice(vocab_size, size=topic_words, replace=False) for _ in range(topics)]
+        self.dimensions = dimensions
+        buckets = [token_bucket(w, dimensions) for w in self.vocab]
+        self.bucket = np.array([b[0] for b in buckets])
+        self.sign = np.array([b[1] for b in buckets], dtype=np.float32)
+
+    def sample(self, rng: np.random.Generator, topic: int, n_words: int) -> np.ndarray:
+        """Word ids: mostly from the topic vocabulary, the rest from anywhere."""
+        from_topic = rng.random(n_words) < 0.7
+        ids = rng.integers(0, len(self.vocab), size=n_words)
+        ids[from_topic] = rng.choice(self.topics[topic], size=int(from_topic.sum()))
+        return ids
+
+    def render(self, word_ids: np.ndarray) -> str:
+        return " ".join(self.vocab[word_ids])
+
+    def embed(self, docs: list[np.ndarray]) -> np.ndarray:
+        """hash_embedding of each rendered word list, computed in bulk."""
+        out = np.zeros((len(docs), self.dimensions), dtype=np.float32)
+        for row, ids in enumerate(docs):
+            np.add.at(out[row], self.bucket[ids], self.sign[ids])
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.where(norms == 0, 1, norms)
+
+    def query(self, rng: np.random.Generator) -> str:
+        topic = int(rng.integers(len(self.topics)))
+        return self.render(self.sample(rng, topic, int(rng.integers(2, 8))))
+
+
+def _story_batch(rng, topics: TopicText, first_hn_id: int, n_stories: int, days: int, model_id: str):
+    now = datetime.now(timezone.utc)
+    stories, chunks, docs, owners = [], [], [], []
+    for i in range(n_stories):
+        hn_id = first_hn_id + i
+        story_id = uuid.uuid4()
+        topic = int(rng.integers(len(topics.topics)))
+        created_at = now - timedelta(seconds=float(rng.uniform(0, days * 86400)))
+        title_ids = topics.sample(rng, topic, int(rng.integers(4, 11)))
+        title = topics.render(title_ids).capitalize()
+        has_text = rng.random() < STORY_TEXT_RATE
+        story_type = "ask_hn" if has_text else "story"
+        text_ids = topics.sample(rng, topic, int(rng.integers(20, 200))) if has_text else None
+        url = None if has_text else f"https://example.com/{hn_id}"
+        n_comments = min(settings.hn_max_comments_per_story, int(rng.geometric(1 / MEAN_COMMENTS)) - 1)
+        author = f"user{int(rng.integers(1, 50000))}"
+
+        stories.append([
+            story_id, hn_id, title, url, author, int(rng.pareto(1.2) * 10) + 11, n_comments,
+            topics.render(text_ids) if has_text else None, generate_slug(title, hn_id), story_type,
+            created_at, now, None,
+        ])
+        first_chunk = len(chunks)
+
+        title_content = f"{title}\n{url}" if url else title
+        chunks.append([uuid.uuid4(), story_id, title_content, "title", None, None, model_id, created_at])
+        docs.append(title_ids)
+        if has_text:
+            chunks.append([uuid.uuid4(), story_id, topics.render(text_ids), "story_text", None, None, model_id, created_at])
+            docs.append(text_ids)
+        for _ in range(n_comments):
+            ids = topics.sample(rng, topic, int(np.clip(rng.lognormal(3.3, 0.8), 5, 400)))
+            chunks.append([
+                uuid.uuid4(), story_id, topics.render(ids), "comment",
+                f"user{int(rng.integers(1, 50000))}", None, model_id, created_at,
+            ])
+            docs.append(ids)
+        owners.append((first_chunk, len(chunks)))
+
+    vectors = topics.embed(docs)
+    for row, vec in zip(chunks, vectors):
+        row[5] = vec
+    # The story vector, as ingest computes it from the same chunks.
+    for story, (first, end) in zip(stories, owners):
+        story[12] = np.asarray(story_vector(vectors[first:end]), dtype=np.float32)
+    # story_created_at (the partition key) is the story's created_at, index 7.
+    return [tuple(s) for s in stories], [(*c, c[7]) for c in chunks]
+
+
+async def generate(target_chunks: int, topics: int, days: int, seed: int, truncate: bool, batch_stories: int) -> dict:
+    rng = np.random.default_rng(seed)
+    text_model = TopicText(topics, settings.embedding_dimensions, seed)
+    model_id = f"hashing:{settings.embedding_dimensions}"
+
+    async with lifespan(app):
+        async with engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            pg = raw.driver_connection
+            await register_vector(pg)
+
+            if truncate:
+                await pg.execute("TRUNCATE stories, chunks")
+            # Day partitions for the whole spread; the app only keeps the
+            # retention window plus a few days ahead.
+            today = datetime.now(timezone.utc).date()
+            await ensure_partitions(conn, today - timedelta(days=days), today + timedelta(days=1))
+            await conn.commit()
+            # Loading with the HNSW indexes in place is orders of magnitude
+            # slower than one build per partition at the end.
+            await pg.execute(f"DROP INDEX IF EXISTS {HNSW_INDEX}, {STORY_HNSW_INDEX}")
+            first_hn_id = (await pg.fetchval("SELECT COALESCE(MAX(hn_id), 50000000) FROM stories")) + 1
+
+            start = time.perf_counter()
+            n_stories = n_chunks = 0
+            while n_chunks < target_chunks:
+                stories, chunks = _story_batch(rng, text_model, first_hn_id + n_stories, batch_stories, days, model_id)
+                chunks = chunks[: target_chunks - n_chunks]
+                await pg.copy_records_to_table("stories", records=stories, columns=STORY_COLUMNS)
+                await pg.copy_records_to_table("chunks", records=chunks, columns=CHUNK_COLUMNS)
+                n_stories += len(stories)
+                n_chunks += len(chunks)
+                logger.warning("loaded %d stories / %d chunks (%.0f chunks/s)",
+                               n_stories, n_chunks, n_chunks / (time.perf_counter() - start))
+            load_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            await build_hnsw_index(conn)
+            await bump_corpus_generation(conn)
+            await conn.commit()
+            await pg.execute("ANALYZE stories")
+            await pg.execute("ANALYZE chunks")
+            index_seconds = time.perf_counter() - start
+
+            mix = dict(await pg.fetch("SELECT chunk_type, COUNT(*) FROM chunks GROUP BY chunk_type"))
+
+    return {
+        "stories": n_stories,
+        "chunks": n_chunks,
+        "chunk_type_mix": mix,
+        "load_seconds": round(load_seconds, 1),
+        "index_seconds": round(index_seconds, 1),
+    }
+
+
+async def seed(directory: Path, truncate: bool) -> dict:
+    """Load a saved benchmark corpus; the lifespan brings the schema up to date first."""
+    async with lifespan(app):
+        pass
+    await engine.dispose()
+    return await import_snapshot(directory, truncate)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    parser.add_argument("--topics", type=int, default=500, help="number of vector clusters")
+    parser.add_argument("--days", type=int, default=settings.hn_days_to_keep, help="spread stories over this many days")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-stories", type=int, default=2000)
+    parser.add_argument("--truncate", action="store_true", help="empty stories and chunks first")
+    parser.add_argument("--snapshot", type=Path, help="load the corpus from this snapshot, or save it there")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(message)s")
+    if args.snapshot and (args.snapshot / "manifest.json").exists():
+        result = asyncio.run(seed(args.snapshot, args.truncate))
+    else:
+        result = asyncio.run(generate(args.chunks, args.topics, args.days, args.seed, args.truncate, args.batch_stories))
+        if args.snapshot:
+            result["snapshot"] = asyncio.run(export_snapshot(args.snapshot))
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+#!/bin/sh
+set -e
+
+# Several workers need prometheus_client's multiprocess mode, so /metrics
+# reports all of them rather than whichever worker the scrape landed on. The
+# directory must start empty, or a restarted container reports stale values.
+if [ "${WEB_CONCURRENCY:-1}" -gt 1 ]; then
+    export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}"
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+exec uvicorn app.main:app --host 0.0.0.0 --port "${PORT}" --workers "${WEB_CONCURRENCY:-1}"
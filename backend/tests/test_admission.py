@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from app.services.admission import AdmissionLimiter, Overloaded
+
+
+def _limiter(concurrency=1, max_queue=2, deadline=1.0) -> AdmissionLimiter:
+    return AdmissionLimiter("test", concurrency, max_queue, deadline)
+
+
+def test_free_slots_are_taken_without_queueing():
+    async def main():
+        limiter = _limiter(concurrency=2)
+        a = await limiter.acquire()
+        b = await limiter.acquire()
+        assert limiter._running == 2 and limiter._waiting == 0
+        a.release()
+        b.release()
+        assert limiter._running == 0
+
+    asyncio.run(main())
+
+
+def test_full_queue_is_shed_up_front():
+    async def main():
+        limiter = _limiter(concurrency=1, max_queue=1)
+        slot = await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as shed:
+            limiter.check()
+        assert shed.value.reason == "queue_full"
+        assert shed.value.retry_after >= 1.0
+        slot.release()
+        (await waiter).release()
+
+    asyncio.run(main())
+
+
+def test_estimated_wait_over_deadline_is_shed():
+    async def main():
+        limiter = _limiter(concurrency=1, max_queue=10, deadline=1.0)
+        limiter._service_seconds = 5.0
+        slot = await limiter.acquire()
+        with pytest.raises(Overloaded) as shed:
+            limiter.check()
+        assert shed.value.reason == "deadline"
+        slot.release()
+        limiter.check()
+
+    asyncio.run(main())
+
+
+def test_queued_request_times_out():
+    async def main():
+        limiter = _limiter(concurrency=1, max_queue=5, deadline=0.05)
+        slot = await limiter.acquire()
+        with pytest.raises(Overloaded) as shed:
+            await limiter.acquire()
+        assert shed.value.reason == "timeout"
+        assert limiter._waiting == 0
+        slot.release()
+
+    asyncio.run(main())
+
+
+def test_queued_request_is_admitted_when_a_slot_frees():
+    async def main():
+        limiter = _limiter(concurrency=1)
+        slot = await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.01)
+        assert limiter._waiting == 1
+        slot.release()
+        second = await waiter
+        assert limiter._running == 1 and limiter._waiting == 0
+        second.release()
+
+    asyncio.run(main())
+
+
+def test_release_is_idempotent():
+    async def main():
+        limiter = _limiter(concurrency=1)
+        slot = await limiter.acquire()
+        slot.release()
+        slot.release()
+        assert limiter._running == 0
+        # Still exactly one slot: a double release would have made two.
+        await limiter.acquire()
+        with pytest.raises(Overloaded):
+            await asyncio.wait_for(limiter.acquire(), 5)
+
+    asyncio.run(main())
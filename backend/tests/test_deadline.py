@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from app.services import deadline as deadlines
+from app.services.deadline import (
+    ClientDisconnected,
+    DeadlineExceeded,
+    cancel_on_disconnect,
+    deadline,
+    expiry,
+    remaining,
+    resume,
+    statement_timeout_ms,
+)
+
+
+def test_no_deadline_by_default():
+    assert remaining() is None
+    assert statement_timeout_ms() is None
+
+
+def test_deadline_sets_statement_timeout_and_is_reset_after_the_block():
+    with deadline(2.0):
+        assert 0 < remaining() <= 2.0
+        assert 1000 < statement_timeout_ms() <= 2000
+        with deadline(None):
+            assert remaining() is None
+        assert remaining() is not None
+    assert remaining() is None
+
+
+def test_passed_deadline_refuses_the_next_query(monkeypatch):
+    with deadline(1.0):
+        at = expiry()
+        monkeypatch.setattr(deadlines.time, "monotonic", lambda: at + 0.1)
+        assert remaining() < 0
+        with pytest.raises(DeadlineExceeded):
+            statement_timeout_ms()
+
+
+def test_nearly_passed_deadline_still_gives_a_nonzero_timeout(monkeypatch):
+    with deadline(1.0):
+        at = expiry()
+        monkeypatch.setattr(deadlines.time, "monotonic", lambda: at - 0.0001)
+        # 0 would disable statement_timeout altogether.
+        assert statement_timeout_ms() == 1
+
+
+def test_resume_reinstates_a_deadline_in_another_context():
+    with deadline(5.0):
+        at = expiry()
+
+    async def stream_body():
+        resume(at)
+        return remaining()
+
+    assert 0 < asyncio.run(stream_body()) <= 5.0
+
+
+def test_tasks_inherit_the_deadline():
+    async def main():
+        with deadline(3.0):
+            return await asyncio.create_task(_remaining())
+
+    assert 0 < asyncio.run(main()) <= 3.0
+
+
+async def _remaining():
+    return remaining()
+
+
+class _Request:
+    """receive() reports a disconnect once `gone` is set."""
+
+    def __init__(self):
+        self.gone = asyncio.Event()
+
+    async def receive(self):
+        await self.gone.wait()
+        return {"type": "http.disconnect"}
+
+
+def test_work_finishing_first_returns_its_result():
+    async def main():
+        return await cancel_on_disconnect(_Request(), asyncio.sleep(0.01, result="done"))
+
+    assert asyncio.run(main()) == "done"
+
+
+def test_work_errors_propagate():
+    async def fail():
+        raise DeadlineExceeded("query cancelled")
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(cancel_on_disconnect(_Request(), fail()))
+
+
+def test_disconnect_cancels_the_work():
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        request = _Request()
+        asyncio.get_running_loop().call_later(0.01, request.gone.set)
+        await cancel_on_disconnect(request, work())
+
+    with pytest.raises(ClientDisconnected):
+        asyncio.run(main())
+    assert cancelled == [True]
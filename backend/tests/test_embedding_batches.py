@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from app.services import embeddings
+from app.services.chunker import pack_batches
+from app.services.embeddings import EmbeddingError, EmbeddingInputRejected, EmbeddingQuotaError
+
+
+def test_pack_batches_respects_token_and_item_limits():
+    assert pack_batches([40, 40, 40, 10], max_tokens=100, max_items=10) == [[0, 1], [2, 3]]
+    assert pack_batches([1] * 5, max_tokens=100, max_items=2) == [[0, 1], [2, 3], [4]]
+
+
+def test_oversized_text_gets_a_batch_of_its_own():
+    assert pack_batches([10, 500, 10], max_tokens=100, max_items=10) == [[0], [1], [2]]
+
+
+def _backend(error_for: frozenset[str] = frozenset(), error=None):
+    calls = []
+
+    async def embed(texts):
+        calls.append(list(texts))
+        if error is not None:
+            raise error
+        if error_for & set(texts):
+            raise EmbeddingInputRejected("input too long")
+        return [[float(len(t))] for t in texts]
+
+    return embed, calls
+
+
+def test_rejected_text_is_isolated_by_bisection(monkeypatch):
+    embed, calls = _backend(error_for={"bad"})
+    monkeypatch.setattr(embeddings, "_embed", embed)
+    vectors = asyncio.run(embeddings._embed_or_bisect(["a", "bb", "bad", "dddd"]))
+    assert vectors == [[1.0], [2.0], None, [4.0]]
+    # The half without the bad text went through in one call.
+    assert ["a", "bb"] in calls
+
+
+@pytest.mark.parametrize("error", [EmbeddingError("503 from provider"), EmbeddingQuotaError("quota")])
+def test_other_errors_raise_instead_of_dropping_vectors(monkeypatch, error):
+    embed, calls = _backend(error=error)
+    monkeypatch.setattr(embeddings, "_embed", embed)
+    with pytest.raises(type(error)):
+        asyncio.run(embeddings._embed_or_bisect(["a", "b", "c", "d"]))
+    assert len(calls) == 1
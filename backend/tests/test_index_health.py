@@ -0,0 +1,52 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from app.services import index_health
+from app.services.index_health import check_indexes, in_window
+
+
+def _row(day):
+    return SimpleNamespace(_mapping={
+        "index_name": f"idx_chunks_embedding_hnsw_p{day}",
+        "table_name": f"chunks_p{day}",
+        "index_bytes": 1024,
+        "live_tuples": 100,
+        "dead_tuples": 0,
+    })
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def execute(self, statement, params=None):
+        return SimpleNamespace(fetchall=lambda: self.rows)
+
+    async def commit(self):
+        pass
+
+
+def test_check_indexes_probes_only_the_named_index(monkeypatch):
+    probed = []
+
+    async def probe(conn, check):
+        probed.append(check.index_name)
+        check.recall = 1.0
+
+    monkeypatch.setattr(index_health, "_probe", probe)
+    conn = FakeConnection([_row("20240101"), _row("20240102"), _row("20240103")])
+
+    assert len(asyncio.run(check_indexes(conn))) == 3
+    probed.clear()
+    checks = asyncio.run(check_indexes(conn, "idx_chunks_embedding_hnsw_p20240102"))
+    assert [c.index_name for c in checks] == probed == ["idx_chunks_embedding_hnsw_p20240102"]
+
+
+def test_window_may_wrap_midnight():
+    at = lambda h, m: datetime(2024, 1, 1, h, m, tzinfo=timezone.utc)  # noqa: E731
+    assert in_window(at(2, 30), "02:00-05:00")
+    assert not in_window(at(5, 0), "02:00-05:00")
+    assert in_window(at(23, 30), "23:00-01:00")
+    assert in_window(at(0, 30), "23:00-01:00")
+    assert not in_window(at(12, 0), "23:00-01:00")
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from app import migrate
+from app.models import Story
+
+
+class _Result:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class _Conn:
+    """Just enough of an AsyncConnection for run_migrations, recording its SQL."""
+
+    def __init__(self, db: "_Database"):
+        self.db = db
+
+    async def execution_options(self, **_):
+        return self
+
+    async def execute(self, statement, params=None):
+        sql = str(statement)
+        self.db.statements.append(sql)
+        if "to_regclass('schema_migrations')" in sql:
+            return _Result(True)
+        if "MAX(version)" in sql:
+            return _Result(max(self.db.applied, default=0))
+        if sql.startswith("INSERT INTO schema_migrations"):
+            self.db.applied.append(params["version"])
+        return _Result(None)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _Database:
+    def __init__(self, applied: list[int]):
+        self.applied = list(applied)
+        self.statements: list[str] = []
+
+    def connect(self):
+        return _Conn(self)
+
+    begin = connect
+
+    async def dispose(self):
+        pass
+
+
+def _run(monkeypatch, applied: list[int], versions: list[int]) -> tuple[int, list[int], _Database]:
+    db = _Database(applied)
+    ran = []
+
+    def step(version):
+        async def apply(conn):
+            ran.append(version)
+        return apply
+
+    monkeypatch.setattr(migrate, "create_async_engine", lambda *a, **k: db)
+    monkeypatch.setattr(
+        migrate, "MIGRATIONS",
+        [migrate.Migration(v, f"step {v}", step(v), transactional=v % 2 == 0) for v in versions],
+    )
+    return asyncio.run(migrate.run_migrations()), ran, db
+
+
+def test_versions_are_contiguous_and_latest_is_last():
+    versions = [m.version for m in migrate.MIGRATIONS]
+    assert versions == list(range(1, len(versions) + 1))
+    assert migrate.LATEST_VERSION == versions[-1]
+
+
+def test_pending_migrations_run_in_order_and_are_recorded(monkeypatch):
+    version, ran, db = _run(monkeypatch, applied=[1, 2], versions=[1, 2, 3, 4, 5])
+    assert ran == [3, 4, 5]
+    assert db.applied == [1, 2, 3, 4, 5]
+    assert version == 5
+    # The lock is taken first and released last.
+    assert "pg_advisory_lock" in db.statements[0]
+    assert "pg_advisory_unlock" in db.statements[-1]
+
+
+def test_up_to_date_database_runs_nothing(monkeypatch):
+    version, ran, _ = _run(monkeypatch, applied=[1, 2, 3], versions=[1, 2, 3])
+    assert ran == []
+    assert version == 3
+
+
+def test_schema_check_refuses_an_older_database(monkeypatch):
+    async def at(version):
+        monkeypatch.setattr(migrate, "current_version", lambda conn: _value(version))
+        await migrate.check_schema_version(None)
+
+    with pytest.raises(migrate.SchemaOutOfDate):
+        asyncio.run(at(migrate.LATEST_VERSION - 1))
+    asyncio.run(at(migrate.LATEST_VERSION))
+    asyncio.run(at(migrate.LATEST_VERSION + 1))
+
+
+async def _value(value):
+    return value
+
+
+def test_partitioning_copies_only_columns_that_existed_then():
+    # Migration 7 copies from tables that later migrations have not touched yet.
+    story_columns = {c.name for c in Story.__table__.columns}
+    assert set(migrate._UNPARTITIONED_STORY_COLUMNS) <= story_columns
+    assert "embedding" not in migrate._UNPARTITIONED_STORY_COLUMNS
@@ -0,0 +1,69 @@
+import asyncio
+from datetime import date
+from types import SimpleNamespace
+
+from app.services import partitions
+from app.services.partitions import drop_day, ensure_partitions, partition_days, partition_name
+
+
+class FakeConnection:
+    """Answers the pg_inherits lookups from `existing` and records every other statement."""
+
+    def __init__(self, existing=()):
+        self.existing = list(existing)
+        self.statements = []
+
+    async def execute(self, statement, params=None):
+        sql = str(statement)
+        if "pg_inherits" in sql and "relname" in sql:
+            table = params["table"] if params and "table" in params else None
+            names = [n for n in self.existing if table is None or n.startswith(f"{table}_p")]
+            return SimpleNamespace(scalars=lambda: names, fetchall=lambda: [])
+        self.statements.append(sql)
+        return SimpleNamespace(scalar=lambda: 3)
+
+
+def test_partition_name():
+    assert partition_name("stories", date(2024, 3, 7)) == "stories_p20240307"
+    assert partition_name("chunks", date(2024, 12, 31)) == "chunks_p20241231"
+
+
+def test_partition_days_parses_suffixes_and_sorts():
+    conn = FakeConnection(["stories_p20240302", "stories_p20240229", "stories_default", "chunks_p20240301"])
+    assert asyncio.run(partition_days(conn)) == [date(2024, 2, 29), date(2024, 3, 2)]
+
+
+def test_ensure_partitions_creates_missing_days_with_utc_bounds(monkeypatch):
+    monkeypatch.setattr(partitions, "name_hnsw_partitions", _noop)
+    conn = FakeConnection(["stories_p20240228", "chunks_p20240228"])
+
+    created = asyncio.run(ensure_partitions(conn, date(2024, 2, 28), date(2024, 3, 1)))
+
+    # Leap day included; the month and year roll over in the upper bound.
+    assert created == [date(2024, 2, 29), date(2024, 3, 1)]
+    ddl = [s for s in conn.statements if s.startswith("CREATE TABLE")]
+    assert len(ddl) == 4
+    assert ("CREATE TABLE IF NOT EXISTS stories_p20240229 PARTITION OF stories "
+            "FOR VALUES FROM ('2024-02-29 00:00:00+00') TO ('2024-03-01 00:00:00+00')") in ddl
+    assert any("chunks_p20240301" in s and "TO ('2024-03-02 00:00:00+00')" in s for s in ddl)
+    assert not any("20240228" in s for s in ddl)
+
+
+def test_ensure_partitions_runs_under_lock_timeout(monkeypatch):
+    monkeypatch.setattr(partitions, "name_hnsw_partitions", _noop)
+    conn = FakeConnection()
+    asyncio.run(ensure_partitions(conn, date(2023, 12, 31), date(2023, 12, 31)))
+    assert "lock_timeout" in conn.statements[0]
+    assert any("TO ('2024-01-01 00:00:00+00')" in s for s in conn.statements)
+
+
+def test_drop_day_drops_chunks_before_stories():
+    conn = FakeConnection()
+    counts = asyncio.run(drop_day(conn, date(2024, 1, 5)))
+    assert counts == {"chunks": 3, "stories": 3}
+    drops = [s for s in conn.statements if s.startswith("DROP TABLE")]
+    assert drops == ["DROP TABLE chunks_p20240105", "DROP TABLE stories_p20240105"]
+
+
+async def _noop(conn):
+    pass
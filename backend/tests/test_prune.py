@@ -0,0 +1,103 @@
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+
+from app.services import ingest
+
+
+class FakeConnection:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+
+class FakeEngine:
+    def __init__(self):
+        self.conn = FakeConnection()
+
+    def connect(self):
+        return self.conn
+
+
+def test_failed_day_is_skipped_and_the_rest_still_runs(monkeypatch):
+    old = [date(2020, 1, 1) + timedelta(days=i) for i in range(3)]
+    dropped, created, writes = [], [], []
+
+    async def partition_days(conn):
+        return old
+
+    async def drop_day(conn, day):
+        if day == old[1]:
+            raise RuntimeError("canceling statement due to lock timeout")
+        dropped.append(day)
+        return {"stories": 2, "chunks": 5}
+
+    async def ensure_partitions(conn, first, last):
+        created.append((first, last))
+
+    async def bump_corpus_generation(conn):
+        pass
+
+    async def note_write():
+        writes.append(True)
+
+    fake = FakeEngine()
+    monkeypatch.setattr(ingest, "engine", fake)
+    monkeypatch.setattr(ingest, "partition_days", partition_days)
+    monkeypatch.setattr(ingest, "drop_day", drop_day)
+    monkeypatch.setattr(ingest, "ensure_partitions", ensure_partitions)
+    monkeypatch.setattr(ingest, "bump_corpus_generation", bump_corpus_generation)
+    monkeypatch.setattr(ingest, "note_write", note_write)
+    monkeypatch.setattr(ingest.settings, "partition_days_ahead", 3)
+
+    result = asyncio.run(ingest.prune_old_stories())
+
+    assert dropped == [old[0], old[2]]
+    assert result["partitions_dropped"] == 2
+    assert result["partitions_skipped"] == [old[1].isoformat()]
+    assert result["stories_deleted"] == 4 and result["chunks_deleted"] == 10
+    assert fake.conn.rollbacks == 1
+    (first, last), = created
+    assert last - first == timedelta(days=3)
+    assert writes == [True]
+
+
+def test_only_days_wholly_before_the_cutoff_are_dropped(monkeypatch):
+    today = datetime.now(timezone.utc).date()
+    cutoff_day = today - timedelta(days=30)
+    days = [cutoff_day - timedelta(days=2), cutoff_day - timedelta(days=1), cutoff_day, today]
+    dropped = []
+
+    async def partition_days(conn):
+        return days
+
+    async def drop_day(conn, day):
+        dropped.append(day)
+        return {"stories": 0, "chunks": 0}
+
+    async def noop(*args):
+        pass
+
+    monkeypatch.setattr(ingest, "engine", FakeEngine())
+    monkeypatch.setattr(ingest, "partition_days", partition_days)
+    monkeypatch.setattr(ingest, "drop_day", drop_day)
+    monkeypatch.setattr(ingest, "ensure_partitions", noop)
+    monkeypatch.setattr(ingest, "bump_corpus_generation", noop)
+    monkeypatch.setattr(ingest, "note_write", noop)
+    monkeypatch.setattr(ingest.settings, "hn_days_to_keep", 30)
+
+    asyncio.run(ingest.prune_old_stories())
+
+    # The cutoff's own day still holds rows newer than the cutoff.
+    assert dropped == days[:2]
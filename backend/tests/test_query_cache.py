@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+import pytest
+
+from app.services import query_cache
+from app.services.query_cache import CachedSearch, QueryCache
+from app.services.vector_search import SearchPerformance
+
+PERF = SearchPerformance(query_time_ms=1.0, chunks_searched=100, index_type="hnsw")
+
+
+def _unit(*values) -> np.ndarray:
+    v = np.asarray(values, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def _entry(top_k=10, granularity="chunk", age=0.0, results=None) -> CachedSearch:
+    return CachedSearch(top_k, granularity, results or [], PERF, time.monotonic() - age)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """A fresh module-level cache at generation 1."""
+    fresh = QueryCache(4)
+    fresh.generation = 1
+    monkeypatch.setattr(query_cache, "_cache", fresh)
+    return fresh
+
+
+def test_near_duplicate_hits_and_distant_query_misses():
+    c = QueryCache(4)
+    c.store(_unit(1, 0, 0), _entry())
+    hit = c.lookup(_unit(1, 0.05, 0), 10, "chunk")
+    assert hit is not None and hit[1] > 0.99
+    assert c.lookup(_unit(0, 1, 0), 10, "chunk") is None
+
+
+def test_entry_must_cover_top_k_and_granularity():
+    c = QueryCache(4)
+    c.store(_unit(1, 0), _entry(top_k=5, granularity="chunk"))
+    assert c.lookup(_unit(1, 0), 10, "chunk") is None
+    assert c.lookup(_unit(1, 0), 5, "story") is None
+    assert c.lookup(_unit(1, 0), 3, "chunk") is not None
+
+
+def test_expired_entry_misses():
+    c = QueryCache(4)
+    c.store(_unit(1, 0), _entry(age=10_000))
+    assert c.lookup(_unit(1, 0), 10, "chunk") is None
+
+
+def test_ring_overwrites_oldest():
+    c = QueryCache(2)
+    c.store(_unit(1, 0, 0), _entry())
+    c.store(_unit(0, 1, 0), _entry())
+    c.store(_unit(0, 0, 1), _entry())
+    assert c.lookup(_unit(1, 0, 0), 10, "chunk") is None
+    assert c.lookup(_unit(0, 0, 1), 10, "chunk") is not None
+
+
+def test_lookup_truncates_to_top_k(cache):
+    query_cache.store([1.0, 0.0], 3, ["a", "b", "c"], PERF, generation=1)
+    results, perf, similarity = query_cache.lookup([2.0, 0.0], 2)
+    assert results == ["a", "b"]
+    assert perf is PERF
+    assert similarity == 1.0
+
+
+def test_store_ignores_results_from_an_older_generation(cache):
+    query_cache.store([1.0, 0.0], 3, ["a"], PERF, generation=0)
+    assert query_cache.lookup([1.0, 0.0], 3) is None
+
+
+def test_clear_drops_everything(cache):
+    query_cache.store([1.0, 0.0], 3, ["a"], PERF, generation=1)
+    cache.clear()
+    assert query_cache.lookup([1.0, 0.0], 3) is None
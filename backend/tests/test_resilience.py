@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+
+from app.services import embeddings, resilience
+from app.services.embeddings import EmbeddingUnavailable, check_available
+from app.services.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, LatencyWindow, hedged
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = _Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", c.monotonic)
+    return c
+
+
+def test_latency_window_needs_enough_samples():
+    window = LatencyWindow(size=100, min_samples=3)
+    window.add(0.1)
+    window.add(0.2)
+    assert window.quantile(0.5) is None
+    window.add(0.3)
+    assert window.quantile(0.5) == pytest.approx(0.2)
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30)
+    breaker.failure()
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    breaker.failure()
+    assert breaker.state == CLOSED
+    breaker.failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() == pytest.approx(30)
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.failure()
+    clock.now += 30
+    assert breaker.state == HALF_OPEN
+    assert breaker.would_allow()
+    assert breaker.allow()
+    assert not breaker.would_allow() and not breaker.allow()
+    breaker.success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_searches_are_refused_while_the_probe_is_out(clock, monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    monkeypatch.setattr(embeddings, "_breaker", breaker)
+    breaker.failure()
+    with pytest.raises(EmbeddingUnavailable):
+        check_available()
+    clock.now += 30
+    check_available()
+    assert breaker.allow()
+    with pytest.raises(EmbeddingUnavailable):
+        check_available()
+    breaker.success()
+    check_available()
+
+def test_failed_probe_reopens_and_abandoned_probe_frees_the_slot(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_seconds=30)
+    for _ in range(5):
+        breaker.failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.abandon()
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == OPEN
+
+
+def _call(delays: list[float], fail: set[int] = frozenset()):
+    """A call whose n-th invocation takes delays[n] seconds and fails if n is in `fail`."""
+    started = []
+    cancelled = []
+
+    async def call():
+        n = len(started)
+        started.append(n)
+        try:
+            await asyncio.sleep(delays[n])
+        except asyncio.CancelledError:
+            cancelled.append(n)
+            raise
+        if n in fail:
+            raise RuntimeError(f"attempt {n} failed")
+        return n
+
+    return call, started, cancelled
+
+
+def test_no_hedge_without_a_delay():
+    call, started, _ = _call([0.01])
+    assert asyncio.run(hedged(call, None)) == (0, False)
+    assert started == [0]
+
+
+def test_hedge_wins_when_first_attempt_stalls():
+    call, started, cancelled = _call([1.0, 0.01])
+    assert asyncio.run(hedged(call, 0.02)) == (1, True)
+    assert started == [0, 1]
+    assert cancelled == [0]
+
+
+def test_fast_first_attempt_sends_no_hedge():
+    call, started, _ = _call([0.01, 0.01])
+    assert asyncio.run(hedged(call, 0.5)) == (0, False)
+    assert started == [0]
+
+
+def test_one_failed_attempt_waits_for_the_other():
+    call, _, _ = _call([0.05, 0.1], fail={0})
+    assert asyncio.run(hedged(call, 0.01)) == (1, True)
+
+
+def test_both_failing_raises():
+    call, _, _ = _call([0.05, 0.01], fail={0, 1})
+    with pytest.raises(RuntimeError):
+        asyncio.run(hedged(call, 0.01))
+
+
+def test_caller_timeout_cancels_every_attempt():
+    call, started, cancelled = _call([1.0, 1.0])
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(hedged(call, 0.01), 0.05)
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert sorted(cancelled) == sorted(started) == [0, 1]
@@ -0,0 +1,69 @@
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, Text
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.snapshot import _ColumnReader, _ColumnWriter
+
+TABLE = Table(
+    "sample",
+    MetaData(),
+    Column("id", UUID(as_uuid=True), primary_key=True),
+    Column("score", Integer, nullable=True),
+    Column("note", Text, nullable=True),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+    Column("embedding", Vector(3), nullable=True),
+)
+
+ROWS = {
+    "id": [uuid.uuid4() for _ in range(4)],
+    "score": [7, None, 0, -3],
+    "note": ["héllo", None, "", "last"],
+    "created_at": [datetime(2024, 5, day, 12, 30, 1, 250, tzinfo=timezone.utc) for day in (1, 2, 3, 4)],
+    "embedding": [[0.1, 0.2, 0.3], None, [1.0, 0.0, -1.0], [0.5, 0.25, 0.125]],
+}
+
+
+def _round_trip(directory, vector_dtype, rows, batches=((0, 2), (2, 4))):
+    writers = [_ColumnWriter(directory, TABLE.name, column, vector_dtype) for column in TABLE.c]
+    for start, end in batches:
+        for writer in writers:
+            writer.write(rows[writer.name][start:end])
+    for writer in writers:
+        writer.close()
+    manifest = {"vector_dtype": vector_dtype, "dimensions": 3}
+    count = len(rows["id"])
+    return {
+        w.name: _ColumnReader(directory, TABLE.name, {"name": w.name, "kind": w.kind, "nullable": w.nullable},
+                              count, manifest)
+        for w in writers
+    }
+
+
+@pytest.mark.parametrize("vector_dtype", ["float32", "float16"])
+def test_columns_round_trip(tmp_path, vector_dtype):
+    readers = _round_trip(tmp_path, vector_dtype, ROWS)
+    for name in ("id", "score", "note", "created_at"):
+        assert readers[name].read(0, 4) == ROWS[name], name
+    # A null vector is written as zeros and comes back as None from the null map.
+    vectors = readers["embedding"].read(0, 4)
+    assert vectors[1] is None
+    tolerance = 1e-3 if vector_dtype == "float16" else 1e-7
+    for got, want in zip(vectors, ROWS["embedding"]):
+        if want is not None:
+            np.testing.assert_allclose(got, want, atol=tolerance)
+
+
+def test_reads_any_slice(tmp_path):
+    readers = _round_trip(tmp_path, "float32", ROWS)
+    assert readers["note"].read(1, 3) == [None, ""]
+    assert readers["score"].read(3, 4) == [-3]
+
+
+def test_empty_table(tmp_path):
+    readers = _round_trip(tmp_path, "float32", {name: [] for name in ROWS}, batches=((0, 0),))
+    assert all(reader.data is None for reader in readers.values())
@@ -1,13 +1,16 @@
 import { ref } from 'vue'
-import type { SearchResultItem, PerformanceStats, SearchResponse } from '@/types'
+import type { SearchResultItem, PerformanceStats, SearchStreamFrame, SearchGranularity } from '@/types'
 
 const API_BASE = (window as any).env?.VITE_API_BASE || import.meta.env.VITE_API_BASE || 'http://localhost:8000'
 
 export function useSearch() {
   const query = ref('')
+  const granularity = ref<SearchGranularity>('chunk')
   const results = ref<SearchResultItem[]>([])
   const performance = ref<PerformanceStats | null>(null)
   const isSearching = ref(false)
+  // True between the fast results and the refined ones.
+  const isRefining = ref(false)
   const error = ref<string | null>(null)
 
   async function search() {
@@ -15,13 +18,15 @@ export function useSearch() {
     if (!q) return
 
     isSearching.value = true
+    isRefining.value = false
     error.value = null
+    performance.value = null
 
     try {
-      const response = await fetch(`${API_BASE}/api/search`, {
+      const response = await fetch(`${API_BASE}/api/search/stream`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ query: q }),
+        body: JSON.stringify({ query: q, granularity: granularity.value }),
       })
 
       if (!response.ok) {
@@ -36,17 +41,39 @@ export function useSearch() {
         throw new Error(detail || `Search failed (HTTP ${response.status})`)
       }
 
-      const data: SearchResponse = await response.json()
-      results.value = data.results
-      performance.value = data.performance
+      // Newline-delimited frames: fast results, refined results, performance.
+      const reader = response.body!.getReader()
+      const decoder = new TextDecoder()
+      let buffered = ''
+      for (;;) {
+        const { done, value } = await reader.read()
+        buffered += decoder.decode(value, { stream: !done })
+        const lines = buffered.split('\n')
+        buffered = lines.pop() ?? ''
+        for (const line of lines) {
+          if (!line.trim()) continue
+          const frame: SearchStreamFrame = JSON.parse(line)
+          if (frame.type === 'results') {
+            results.value = frame.results
+            isSearching.value = false
+            isRefining.value = frame.stage === 'fast'
+          } else if (frame.type === 'performance') {
+            performance.value = frame.performance
+          } else {
+            throw new Error(frame.detail)
+          }
+        }
+        if (done) break
+      }
     } catch (e: any) {
       error.value = e.message || 'Search failed'
       results.value = []
       performance.value = null
     } finally {
       isSearching.value = false
+      isRefining.value = false
     }
   }
 
-  return { query, results, performance, isSearching, error, search }
+  return { query, granularity, results, performance, isSearching, isRefining, error, search }
 }
@@ -49,6 +49,10 @@ export interface PerformanceStats {
   results_found: number
   index_type: string
   similarity_metric: string
+  // Set by /api/search/stream: when the first (fast) results arrived.
+  time_to_first_result_ms?: number | null
+  // Set when a recent near-duplicate query answered this one.
+  cache_similarity?: number | null
 }
 
 export interface SearchResponse {
@@ -56,10 +60,27 @@ export interface SearchResponse {
   performance: PerformanceStats
 }
 
+// "chunk": every matching chunk; "story": one result per story (its best chunk).
+export type SearchGranularity = 'chunk' | 'story'
+
+// One line of the /api/search/stream NDJSON response.
+export type SearchStreamFrame =
+  | { type: 'results'; stage: 'fast' | 'refined' | 'cached'; elapsed_ms: number; results: SearchResultItem[] }
+  | { type: 'performance'; performance: PerformanceStats }
+  | { type: 'error'; detail: string }
+
+export interface EmbeddingStatus {
+  state: 'closed' | 'open' | 'half_open'
+  retry_after_seconds: number
+  timeout_ms: number
+  hedge_after_ms: number | null
+}
+
 export interface DbStats {
   total_stories: number
   total_chunks: number
   oldest_story: string | null
   newest_story: string | null
   index_type: string
+  embedding: EmbeddingStatus
 }